@@ -3,6 +3,7 @@
 import os
 import io
 import json
+import struct
 import logging
 
 import numpy as np
@@ -13,6 +14,27 @@ from transformers import CLIPProcessor, CLIPModel
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Several encoded images in one request body:
+#   <uint32 count> <uint32 length> * count <image bytes> * count   (little-endian)
+IMAGE_BATCH_CONTENT_TYPE = "application/x-image-batch"
+
+# Binary embedding responses: NumPy `.npy` (little-endian float32 with a shape header)
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+def decode_image_batch(body: bytes) -> list:
+    """Split an `application/x-image-batch` body into its encoded image payloads."""
+    (count,) = struct.unpack_from("<I", body, 0)
+    lengths = struct.unpack_from(f"<{count}I", body, 4)
+    offset = 4 + 4 * count
+    payloads = []
+    for length in lengths:
+        payloads.append(body[offset:offset + length])
+        offset += length
+    if offset != len(body):
+        raise ValueError("Malformed image batch: payload lengths do not match body size")
+    return payloads
+
 def model_fn(*args, **kwargs):
     """
     Load the CLIP model & processor.
@@ -36,6 +58,8 @@ def input_fn(request_body, content_type):
     logger.info(f"Deserializing request with content type: {content_type}")
     if content_type in ("application/x-image", "image/jpeg", "image/png"):
         return Image.open(io.BytesIO(request_body)).convert("RGB")
+    if content_type == IMAGE_BATCH_CONTENT_TYPE:
+        return [Image.open(io.BytesIO(p)).convert("RGB") for p in decode_image_batch(request_body)]
     if content_type == "application/json":
         data = json.loads(request_body)
         if "inputs" not in data:
@@ -50,7 +74,10 @@ def predict_fn(input_data, context):
     device    = context["device"]
 
     if isinstance(input_data, Image.Image):
-        logger.info("Running image through CLIP vision encoder")
+        input_data = [input_data]
+
+    if isinstance(input_data, list) and input_data and isinstance(input_data[0], Image.Image):
+        logger.info(f"Running {len(input_data)} images through CLIP vision encoder")
         inputs = processor(images=input_data, return_tensors="pt").to(device)
         with torch.no_grad():
             embeddings = model.get_image_features(**inputs)
@@ -65,8 +92,26 @@ def predict_fn(input_data, context):
     return embeddings.cpu().numpy()
 
 
+def serialize_npy(prediction: np.ndarray) -> bytes:
+    """Little-endian float32 `.npy` bytes: a short shape header followed by the raw matrix."""
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(prediction, dtype="<f4"), allow_pickle=False)
+    return buf.getvalue()
+
+
 def output_fn(prediction: np.ndarray, response_content_type):
+    """
+    Serialize embeddings for the first supported type in the Accept header:
+    `application/x-npy` (binary float32) or `application/json`.
+
+    Only the body is returned: the serving stack sets the response content type
+    from the Accept header and would JSON-encode a (body, type) tuple as a list.
+    """
     logger.info(f"Serializing prediction as {response_content_type}")
-    if response_content_type == "application/json":
-        return json.dumps(prediction.tolist()), "application/json"
+    accepted = [t.split(";")[0].strip() for t in (response_content_type or "application/json").split(",")]
+    for content_type in accepted:
+        if content_type == NPY_CONTENT_TYPE:
+            return serialize_npy(prediction)
+        if content_type in ("application/json", "*/*"):
+            return json.dumps(prediction.tolist())
     raise ValueError(f"Unsupported response content type: {response_content_type}")
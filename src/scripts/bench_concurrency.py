@@ -0,0 +1,130 @@
+"""
+Stress benchmark: search QPS and latency on N reader threads, first on an
+idle index and then while a writer thread ingests batches into it.
+
+    cd src && python -m scripts.bench_concurrency --items 50000 --readers 8 --seconds 10
+
+Every result is also checked for consistency (k results, each with a path
+that was inserted); any violation is counted as an error.
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+import threading
+
+import numpy as np
+
+# Index settings are read from the environment at import time
+for key, default in {"HNSW_DIM": "512", "HNSW_MAX_ELEMENTS": "100000", "HNSW_EF_CONSTRUCTION": "200",
+                     "HNSW_M": "16", "HNSW_EF_SEARCH": "50"}.items():
+    os.environ.setdefault(key, default)
+
+from server.index_store import HNSWIndexSingleton
+
+
+def _reset(capacity: int):
+    HNSWIndexSingleton.reset()
+    HNSWIndexSingleton.MAX_ELEMENTS = capacity
+    workdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+    HNSWIndexSingleton.INDEX_PATH = os.path.join(workdir, "image_index.bin")
+    HNSWIndexSingleton.META_PATH = os.path.join(workdir, "metadata.sqlite3")
+    HNSWIndexSingleton.load()
+
+
+def _ingest(vectors: np.ndarray, start: int, batch_size: int, stop: threading.Event) -> int:
+    added = 0
+    for lo in range(0, len(vectors), batch_size):
+        if stop.is_set():
+            break
+        chunk = vectors[lo:lo + batch_size]
+        HNSWIndexSingleton.add_batch(chunk, [f"img_{start + lo + i}.jpg" for i in range(len(chunk))])
+        added += len(chunk)
+    return added
+
+
+def run_phase(queries: np.ndarray, readers: int, seconds: float, k: int, ingest=None) -> dict:
+    """Search from `readers` threads for `seconds`, optionally while `ingest(stop)` runs on another thread."""
+    stop = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    errors = [0] * readers
+
+    def reader(slot: int):
+        rng = np.random.default_rng(slot)
+        while not stop.is_set():
+            vec = queries[rng.integers(len(queries))]
+            start = time.perf_counter()
+            try:
+                paths, _ = HNSWIndexSingleton.query(vec, k=k)
+            except Exception:
+                errors[slot] += 1
+                continue
+            latencies[slot].append(time.perf_counter() - start)
+            if len(paths) != k or not all(p and p.startswith("img_") for p in paths):
+                errors[slot] += 1
+
+    ingested = {"items": 0, "seconds": 0.0}
+
+    def writer():
+        start = time.perf_counter()
+        ingested["items"] = ingest(stop)
+        ingested["seconds"] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    if ingest is not None:
+        threads.append(threading.Thread(target=writer))
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = np.concatenate([np.asarray(l) for l in latencies]) if any(latencies) else np.zeros(1)
+    return {
+        "qps": len(all_latencies) / elapsed,
+        "p50_ms": float(np.percentile(all_latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(all_latencies, 99) * 1000),
+        "errors": sum(errors),
+        "ingest_per_s": ingested["items"] / ingested["seconds"] if ingested["seconds"] else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000, help="Items indexed before searching starts")
+    parser.add_argument("--ingest-items", type=int, default=200000, help="Upper bound on items added during ingest")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    rng = np.random.default_rng(args.seed)
+    dim = HNSWIndexSingleton.DIM
+    base = rng.standard_normal((args.items, dim)).astype(np.float32)
+    extra = rng.standard_normal((args.ingest_items, dim)).astype(np.float32)
+    queries = rng.standard_normal((1000, dim)).astype(np.float32)
+
+    _reset(args.items)
+    _ingest(base, 0, args.batch_size, threading.Event())
+
+    idle = run_phase(queries, args.readers, args.seconds, args.k)
+    busy = run_phase(queries, args.readers, args.seconds, args.k,
+                     ingest=lambda stop: _ingest(extra, args.items, args.batch_size, stop))
+
+    print(f"{'phase':<10}{'qps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'ingest/s':>12}")
+    for name, r in (("idle", idle), ("ingest", busy)):
+        print(f"{name:<10}{r['qps']:>10.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['errors']:>8}"
+              f"{r['ingest_per_s']:>12.0f}")
+    print(f"search QPS retained during ingest: {busy['qps'] / idle['qps']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
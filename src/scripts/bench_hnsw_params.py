@@ -0,0 +1,263 @@
+"""
+HNSW parameter sweep: recall@k against exact search, single- and
+multi-thread QPS, p50/p99 latency, build throughput, peak RSS and on-disk
+size for every combination of M, ef_construction and ef_search, plus the
+QPS of the same graph searched through its memory map (HNSW_STORAGE=mmap).
+
+    cd src && python -m scripts.bench_hnsw_params --sizes 10000 100000 \\
+        --M 8 16 32 --ef-construction 100 200 --ef-search 20 50 100 --output results.json
+
+Datasets are reproducible CLIP-like unit vectors (a shared offset plus
+clustered noise, generated from --seed) or an embedding dump given with
+--embeddings (an (N, D) .npy file; the last --queries rows become queries
+unless --query-file is set). Each graph is built in a fresh process so its
+peak RSS is its own. The JSON output records the environment, every
+measurement and, per dataset, the fastest setting that reaches
+--target-recall; pass a previous output as --baseline to flag regressions
+(exit status 1).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from importlib import metadata
+from datetime import datetime, timezone
+
+import hnswlib
+import numpy as np
+
+from server.exact_search import exact_knn
+from server.mmap_index import MappedGraph
+
+_CHUNK = 100_000  # rows generated per step, so 10M-item datasets never sit in memory twice
+
+
+def synthetic_dataset(path: str, items: int, dim: int, seed: int, stream: int = 0, clusters: int = 1000) -> str:
+    """
+    Write `items` CLIP-like unit vectors to an .npy file and return its path.
+    Embeddings from contrastive models share a dominant direction and form
+    clusters per concept, so each vector is offset + centre + noise, normalized.
+    Every `stream` of one seed shares the offset and centres (use one for the
+    indexed vectors, another for queries); a smaller dataset is a prefix of a
+    larger one.
+    """
+    rng = np.random.default_rng(seed)
+    offset = rng.standard_normal(dim)
+    offset *= 2.0 / np.linalg.norm(offset)
+    centres = rng.standard_normal((clusters, dim)) / np.sqrt(dim)
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(items, dim))
+    for lo in range(0, items, _CHUNK):
+        hi = min(lo + _CHUNK, items)
+        chunk_rng = np.random.default_rng([seed, stream, lo])
+        points = offset + centres[chunk_rng.integers(clusters, size=hi - lo)] \
+            + 0.6 * chunk_rng.standard_normal((hi - lo, dim)) / np.sqrt(dim)
+        out[lo:hi] = points / np.linalg.norm(points, axis=1, keepdims=True)
+    out.flush()
+    return path
+
+
+def _rss_mb() -> float:
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)]))
+
+
+def measure_build(base_path: str, items: int, query_path: str, truth_path: str, space: str, M: int,
+                  ef_construction: int, ef_searches: list, k: int, workdir: str) -> list:
+    """Build one graph over the first `items` rows and search it at every ef_search (runs in its own process)."""
+    base = np.load(base_path, mmap_mode="r")[:items]
+    queries, truth = np.load(query_path), np.load(truth_path)
+    items, dim = base.shape
+    rss_before = _rss_mb()
+
+    index = hnswlib.Index(space=space, dim=dim)
+    index.init_index(max_elements=items, ef_construction=ef_construction, M=M)
+    start = time.perf_counter()
+    for lo in range(0, items, _CHUNK):
+        index.add_items(np.asarray(base[lo:lo + _CHUNK]), np.arange(lo, min(lo + _CHUNK, items)))
+    build_s = time.perf_counter() - start
+    index_path = os.path.join(workdir, f"M{M}_efc{ef_construction}.bin")
+    index.save_index(index_path)
+    disk_bytes = os.path.getsize(index_path)
+    mapped = MappedGraph(index_path, space, dim)
+
+    rows = []
+    for ef in ef_searches:
+        index.set_ef(max(ef, k))
+        mapped.set_ef(max(ef, k))
+        latencies, found = [], []
+        for query in queries:
+            t = time.perf_counter()
+            labels, _ = index.knn_query(query, k=k, num_threads=1)
+            latencies.append(time.perf_counter() - t)
+            found.append(labels[0])
+        t = time.perf_counter()
+        index.knn_query(queries, k=k, num_threads=-1)
+        batch_s = time.perf_counter() - t
+        t = time.perf_counter()
+        for query in queries:
+            mapped.knn_query(query, k=k, num_threads=1)
+        mapped_s = time.perf_counter() - t
+        t = time.perf_counter()
+        mapped.knn_query(queries, k=k, num_threads=-1)
+        mapped_batch_s = time.perf_counter() - t
+        latencies = np.asarray(latencies)
+        rows.append({
+            "M": M, "ef_construction": ef_construction, "ef_search": ef,
+            "recall": _recall(np.asarray(found), truth),
+            "qps_1_thread": len(queries) / latencies.sum(),
+            "qps_all_threads": len(queries) / batch_s,
+            "qps_mmap_1_thread": len(queries) / mapped_s,
+            "qps_mmap_all_threads": len(queries) / mapped_batch_s,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "build_s": build_s,
+            "build_items_per_s": items / build_s,
+            "peak_rss_mb": _rss_mb(),
+            "index_rss_mb": _rss_mb() - rss_before,
+            "disk_mb": disk_bytes / 2**20,
+        })
+    del mapped
+    os.remove(index_path)
+    return rows
+
+
+def _prepare(args, size: int, workdir: str) -> dict:
+    """Dataset, queries and exact ground truth on disk; returns their description and paths."""
+    if args.embeddings:
+        base_path = args.embeddings
+        items = len(np.load(base_path, mmap_mode="r"))
+        if args.query_file:
+            queries = np.load(args.query_file)
+        else:
+            items -= args.queries  # the dump's last rows are held out as queries
+            queries = np.asarray(np.load(base_path, mmap_mode="r")[items:])
+        source = os.path.abspath(args.embeddings)
+    else:
+        items = size
+        base_path = synthetic_dataset(os.path.join(workdir, "base.npy"), size, args.dim, args.seed)
+        queries = np.load(synthetic_dataset(os.path.join(workdir, "generated_queries.npy"), args.queries,
+                                            args.dim, args.seed, stream=1))
+        source = "synthetic"
+
+    base = np.load(base_path, mmap_mode="r")[:items]
+    query_path = os.path.join(workdir, "queries.npy")
+    truth_path = os.path.join(workdir, "truth.npy")
+    np.save(query_path, np.asarray(queries, dtype=np.float32))
+    start = time.perf_counter()
+    truth, _ = exact_knn(base, queries, args.k, args.space)
+    np.save(truth_path, truth.astype(np.int64))
+    return {"source": source, "items": items, "dim": int(base.shape[1]), "queries": len(queries),
+            "exact_search_s": time.perf_counter() - start, "paths": (base_path, items, query_path, truth_path)}
+
+
+def recommend(rows: list, target_recall: float):
+    """The setting with the highest single-thread QPS whose recall reaches the target."""
+    good = [r for r in rows if r["recall"] >= target_recall]
+    return max(good, key=lambda r: r["qps_1_thread"]) if good else None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Measurements that got worse than the baseline by more than `tolerance` (relative)."""
+    def key(dataset, row):
+        return dataset["items"], dataset["dim"], row["M"], row["ef_construction"], row["ef_search"]
+
+    before = {key(d, r): r for d in baseline["datasets"] for r in d["results"]}
+    regressions = []
+    for dataset in results["datasets"]:
+        for row in dataset["results"]:
+            old = before.get(key(dataset, row))
+            if old is None:
+                continue
+            for metric, higher_is_better in (("recall", True), ("qps_1_thread", True), ("p99_ms", False),
+                                             ("build_items_per_s", True)):
+                change = (row[metric] - old[metric]) / max(abs(old[metric]), 1e-12)
+                if (-change if higher_is_better else change) > tolerance:
+                    regressions.append(f"{key(dataset, row)} {metric}: {old[metric]:.4g} -> {row[metric]:.4g}")
+    return regressions
+
+
+def _print(dataset: dict, k: int, target_recall: float):
+    print(f"\n{dataset['source']}: {dataset['items']} x {dataset['dim']}, {dataset['queries']} queries")
+    print(f"{'M':>4}{'efC':>6}{'ef':>6}{f'recall@{k}':>11}{'qps 1t':>9}{'qps all':>9}{'mmap 1t':>9}{'mmap all':>10}{'p50 ms':>8}{'p99 ms':>8}"
+          f"{'build/s':>9}{'rss MB':>8}{'disk MB':>9}")
+    for r in dataset["results"]:
+        print(f"{r['M']:>4}{r['ef_construction']:>6}{r['ef_search']:>6}{r['recall']:>11.3f}{r['qps_1_thread']:>9.0f}"
+              f"{r['qps_all_threads']:>9.0f}{r.get('qps_mmap_1_thread', 0):>9.0f}"
+              f"{r.get('qps_mmap_all_threads', 0):>10.0f}{r['p50_ms']:>8.2f}{r['p99_ms']:>8.2f}{r['build_items_per_s']:>9.0f}"
+              f"{r['peak_rss_mb']:>8.0f}{r['disk_mb']:>9.1f}")
+    best = dataset["recommended"]
+    if best is None:
+        print(f"no setting reached recall {target_recall}")
+    else:
+        print(f"fastest with recall >= {target_recall}: M={best['M']} ef_construction={best['ef_construction']} "
+              f"ef_search={best['ef_search']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--space", default="cosine", choices=["cosine", "ip", "l2"])
+    parser.add_argument("--embeddings", help="(N, D) .npy embedding dump to use instead of synthetic data")
+    parser.add_argument("--query-file", help="(Q, D) .npy queries for --embeddings")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[10, 20, 50, 100, 200])
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Previous --output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "hnswlib": metadata.version("hnswlib"), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "settings": {"k": args.k, "space": args.space, "seed": args.seed, "target_recall": args.target_recall},
+        "datasets": [],
+    }
+    spawn = multiprocessing.get_context("spawn")
+    for size in ([None] if args.embeddings else args.sizes):
+        with tempfile.TemporaryDirectory(prefix="bench_hnsw_params_") as workdir:
+            dataset = _prepare(args, size, workdir)
+            paths = dataset.pop("paths")
+            rows = []
+            for M in args.M:
+                for ef_construction in args.ef_construction:
+                    with spawn.Pool(1) as pool:  # a fresh process per graph, so peak RSS is its own
+                        rows += pool.apply(measure_build, (*paths, args.space, M, ef_construction,
+                                                           args.ef_search, args.k, workdir))
+            dataset["results"] = rows
+            dataset["recommended"] = recommend(rows, args.target_recall)
+            results["datasets"].append(dataset)
+            _print(dataset, args.k, args.target_recall)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
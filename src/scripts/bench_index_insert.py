@@ -0,0 +1,74 @@
+"""
+Benchmark index insertion: per-item `add_items` vs bulk `add_batch`.
+
+    cd src && python -m scripts.bench_index_insert --items 20000 --batch-size 256
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+
+# Index settings are read from the environment at import time
+for key, default in {"HNSW_DIM": "512", "HNSW_MAX_ELEMENTS": "100000", "HNSW_EF_CONSTRUCTION": "200",
+                     "HNSW_M": "16", "HNSW_EF_SEARCH": "50"}.items():
+    os.environ.setdefault(key, default)
+
+from server.index_store import HNSWIndexSingleton
+
+
+def _reset(capacity: int):
+    HNSWIndexSingleton.reset()
+    HNSWIndexSingleton.MAX_ELEMENTS = capacity
+    workdir = tempfile.mkdtemp(prefix="bench_index_")  # fresh files: never load a previous run
+    HNSWIndexSingleton.INDEX_PATH = os.path.join(workdir, "image_index.bin")
+    HNSWIndexSingleton.META_PATH = os.path.join(workdir, "metadata.sqlite3")
+    HNSWIndexSingleton.load()
+
+
+def bench_per_item(vectors: np.ndarray) -> float:
+    """Current ingestion path: one add_items call (lock, vstack, gc.collect) per record."""
+    _reset(len(vectors))
+    start = time.perf_counter()
+    for i, vec in enumerate(vectors):
+        HNSWIndexSingleton.add_items([vec], [f"img_{i}.jpg"])
+    return time.perf_counter() - start
+
+
+def bench_bulk(vectors: np.ndarray, batch_size: int) -> float:
+    """Bulk path: one multi-threaded add_batch call per micro-batch."""
+    _reset(len(vectors))
+    start = time.perf_counter()
+    for lo in range(0, len(vectors), batch_size):
+        chunk = vectors[lo:lo + batch_size]
+        HNSWIndexSingleton.add_batch(chunk, [f"img_{i}.jpg" for i in range(lo, lo + len(chunk))])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # add_items logs a warning per missing image file; keep the timing loop quiet
+    logging.basicConfig(level=logging.ERROR)
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.items, HNSWIndexSingleton.DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    per_item = bench_per_item(vectors)
+    bulk = bench_bulk(vectors, args.batch_size)
+
+    print(f"{'path':<12}{'seconds':>10}{'items/s':>12}")
+    print(f"{'per-item':<12}{per_item:>10.2f}{args.items / per_item:>12.0f}")
+    print(f"{'bulk':<12}{bulk:>10.2f}{args.items / bulk:>12.0f}")
+    print(f"speedup: {per_item / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark compressed vector storage against the float32 HNSW index: memory
+per item, recall@k against exact search, and single-query and batched QPS
+per mode.
+
+    cd src && python -m scripts.bench_quantization --items 1000000 --dim 512 --k 10
+
+Modes: the float HNSW graph, then int8 scalar (sq8) and product (pq)
+quantization, each without and with re-ranking the best --rerank
+candidates against the memory-mapped float32 vectors, at every --nprobe
+(inverted lists scanned per query). The dataset is streamed to disk
+(`bench_hnsw_params.synthetic_dataset`), so 1M+ items fit in memory;
+--no-float skips the float graph, whose build dominates the run time.
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import hnswlib
+import numpy as np
+
+import server.quantization as quantization
+from server.quantization import CompressedIndex
+from server.exact_search import exact_knn
+from scripts.bench_hnsw_params import synthetic_dataset
+
+_CHUNK = 100_000  # rows added per call
+
+
+def _measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    found, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        labels, _ = index.knn_query(query, k=k, num_threads=1)
+        latencies.append(time.perf_counter() - start)
+        found.append(labels[0])
+    start = time.perf_counter()
+    index.knn_query(queries, k=k, num_threads=-1)
+    batch_s = time.perf_counter() - start
+    recall = np.mean([len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)])
+    return {"recall": float(recall), "qps": len(queries) / sum(latencies), "qps_batch": len(queries) / batch_s}
+
+
+def _add(index, base: np.ndarray):
+    for lo in range(0, len(base), _CHUNK):
+        index.add_items(np.asarray(base[lo:lo + _CHUNK]), np.arange(lo, min(lo + _CHUNK, len(base))))
+
+
+def run(items: int, queries: int, dim: int, k: int, m: int, ef: int, reranks: list, pq_subvectors: int,
+        nprobes: list, seed: int = 0, float_graph: bool = True):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_quantization_") as workdir:  # ~6 GB of files at 1M x 512
+        base = np.load(synthetic_dataset(os.path.join(workdir, "base.npy"), items, dim, seed), mmap_mode="r")
+        query_vectors = np.load(synthetic_dataset(os.path.join(workdir, "queries.npy"), queries, dim, seed, stream=1))
+        truth, _ = exact_knn(base, query_vectors, k, "cosine")
+
+        if float_graph:
+            graph = hnswlib.Index(space="cosine", dim=dim)
+            graph.init_index(max_elements=items, ef_construction=200, M=m)
+            _add(graph, base)
+            graph.set_ef(ef)
+            per_item = 4 * dim + 8 * m + 64  # same estimate as HNSWIndex.memory_bytes
+            results.append(("hnsw float32", per_item, _measure(graph, query_vectors, truth, k)))
+            del graph
+
+        quantization.TRAIN_SIZE = min(items, quantization.TRAIN_SIZE)
+        for kind in ("sq8", "pq"):
+            index = CompressedIndex("cosine", dim, os.path.join(workdir, f"{kind}.f32"), quantization=kind,
+                                    pq_subvectors=pq_subvectors)
+            index.init_index(max_elements=items)
+            _add(index, base)
+            for nprobe in nprobes:
+                index.nprobe = nprobe
+                for rerank in [0] + reranks:
+                    index.rerank = rerank > 0
+                    index.set_ef(rerank)
+                    name = f"{kind} nprobe {nprobe}" + (f" + rerank {rerank}" if rerank else "")
+                    results.append((name, index.memory_bytes() / items, _measure(index, query_vectors, truth, k)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef", type=int, default=50, help="HNSW ef_search of the float index")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[100, 1000],
+                        help="Code matches re-scored against float32 vectors")
+    parser.add_argument("--pq-subvectors", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[quantization.IVF_NPROBE],
+                        help="Inverted lists scanned per query")
+    parser.add_argument("--no-float", action="store_true", help="Skip the float32 HNSW graph")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = run(args.items, args.queries, args.dim, args.k, args.M, args.ef, args.rerank, args.pq_subvectors,
+                  args.nprobe, args.seed, float_graph=not args.no_float)
+
+    print(f"{args.items} x {args.dim}, {os.cpu_count()} CPUs")
+    print(f"{'mode':<32}{'bytes/item':>12}{f'recall@{args.k}':>12}{'qps':>10}{'qps batch':>11}")
+    for name, per_item, r in results:
+        print(f"{name:<32}{per_item:>12.0f}{r['recall']:>12.3f}{r['qps']:>10.0f}{r['qps_batch']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark the embedding response formats: JSON vs binary `.npy` float32.
+
+Reports payload size and the endpoint-side encode / client-side decode time,
+per single vector and per batch.
+
+    cd src && python -m scripts.bench_wire_format --dim 512 --batches 1 32 256
+"""
+import io
+import json
+import time
+import argparse
+
+import numpy as np
+
+from server.sage_maker import decode_json_embeddings, decode_npy_embeddings
+
+
+def _timeit(fn, repeat: int) -> float:
+    """Best-of-3 mean seconds per call."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def _npy_bytes(matrix: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, matrix, allow_pickle=False)
+    return buf.getvalue()
+
+
+def bench(dim: int, rows: int, repeat: int) -> list[dict]:
+    matrix = np.random.default_rng(0).standard_normal((rows, dim)).astype("<f4")
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    formats = {
+        "json": (lambda: json.dumps(matrix.tolist()).encode(), decode_json_embeddings),
+        "npy": (lambda: _npy_bytes(matrix), decode_npy_embeddings),
+    }
+    out = []
+    for name, (encode, decode) in formats.items():
+        body = encode()
+        out.append({
+            "format": name,
+            "rows": rows,
+            "bytes": len(body),
+            "encode_us": _timeit(encode, repeat) * 1e6,
+            "decode_us": _timeit(lambda: decode(body, rows), repeat) * 1e6,
+        })
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 32, 256])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = [r for rows in args.batches for r in bench(args.dim, rows, args.repeat)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'rows':>6} {'format':<6}{'bytes':>10}{'bytes/vec':>11}{'encode µs':>12}{'decode µs':>12}{'decode µs/vec':>15}")
+    for r in results:
+        print(f"{r['rows']:>6} {r['format']:<6}{r['bytes']:>10}{r['bytes'] / r['rows']:>11.0f}"
+              f"{r['encode_us']:>12.1f}{r['decode_us']:>12.1f}{r['decode_us'] / r['rows']:>15.2f}")
+    for rows in args.batches:
+        js, npy = [r for r in results if r["rows"] == rows]
+        print(f"rows={rows}: npy saves {js['bytes'] - npy['bytes']} bytes "
+              f"({js['bytes'] / npy['bytes']:.1f}x smaller), decode {js['decode_us'] / npy['decode_us']:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
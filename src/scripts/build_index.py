@@ -2,68 +2,249 @@ import os
 import io
 import ast
 import logging
-from uuid import uuid4
+import threading
+from typing import Callable, Optional
 import numpy as np
 from PIL import Image, UnidentifiedImageError
 from datasets import load_dataset
 
-from server.sage_maker import CLIPSageMakerClient
-from server.index_store import HNSWIndexSingleton
+from server.encoders import get_encoder
+from server.embedding_store import EMBEDDING_CACHE_DIR, EmbeddingCache, content_key
+from server.index_store import HNSWIndexSingleton, DEFAULT_COLLECTION
+from server.metadata_store import ItemMetadata
+from server.metrics import timed_encode
+from scripts.pipeline import SKIP, IngestItem, IngestPipeline, PipelineStats
 
 logger = logging.getLogger(__name__)
-IMG_DIR = os.getenv("IMG_DIR")
 
-def build_index(repo: str, split: str="train", image_column: str="image"):
-    logger.info(f"📦 Starting simplified index build for {repo}/{split}")
+# Images already in a format the endpoint decodes are sent as-is
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+PASSTHROUGH_MAX_BYTES = int(os.getenv("INGEST_PASSTHROUGH_MAX_BYTES", str(512 * 1024)))
+CLIP_INPUT_SIZE = 224  # CLIP ViT-B/32 resizes the short side to 224 and center-crops
+
+# Micro-batching of endpoint requests during ingestion
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+BATCH_MAX_WAIT_S = float(os.getenv("INGEST_BATCH_MAX_WAIT_MS", "500")) / 1000.0
+
+# Pipeline stage sizing
+DECODE_WORKERS = int(os.getenv("INGEST_DECODE_WORKERS", str(os.cpu_count() or 4)))
+MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", "4"))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+
+# Save the index (and report a resumable offset) every N processed records
+CHECKPOINT_EVERY = int(os.getenv("BUILD_CHECKPOINT_EVERY", "1000"))
+
+
+def _dataset_size(dataset, split: str) -> Optional[int]:
+    """Number of rows in the split, if the dataset card declares it."""
+    try:
+        return dataset.info.splits[split].num_examples
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def prepare_image_payload(data: bytes) -> bytes:
+    """
+    Bytes to send to the endpoint for one image, without touching disk.
+
+    JPEG and PNG bytes up to PASSTHROUGH_MAX_BYTES are passed through untouched
+    (only the header is parsed to reject garbage). Anything else is decoded,
+    scaled and center-cropped to CLIP's 224px input on the client, and encoded
+    once as a compact JPEG.
+    """
+    img = Image.open(io.BytesIO(data))  # lazy: reads the header only
+    if data[:len(JPEG_MAGIC)] == JPEG_MAGIC or data[:len(PNG_MAGIC)] == PNG_MAGIC:
+        if len(data) <= PASSTHROUGH_MAX_BYTES:
+            return data
+
+    img = img.convert("RGB")
+    width, height = img.size
+    scale = CLIP_INPUT_SIZE / min(width, height)
+    if scale < 1:
+        img = img.resize((max(CLIP_INPUT_SIZE, round(width * scale)), max(CLIP_INPUT_SIZE, round(height * scale))),
+                         Image.BICUBIC)
+        width, height = img.size
+        left, top = (width - CLIP_INPUT_SIZE) // 2, (height - CLIP_INPUT_SIZE) // 2
+        img = img.crop((left, top, left + CLIP_INPUT_SIZE, top + CLIP_INPUT_SIZE))
+
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _decode_record(repo: str, split: str, image_column: str, label_column: str, idx: int, rec: dict,
+                   is_duplicate: Optional[Callable[[bytes], bool]]=None,
+                   cache: Optional[EmbeddingCache]=None):
+    """
+    Decode stage: validate a record and prepare its image payload in memory.
+
+    Records whose bytes were already claimed in this build are skipped; records
+    whose embedding is in `cache` carry it and never reach the encoder.
+    """
+    # Per-record lines are DEBUG with lazy formatting: this runs for every row of the dataset.
+    # Failures are counted in the pipeline stats and visionsearch_ingest_records_total instead.
+    logger.debug("[%s] 🔄 Processing record...", idx)
+
+    img_field = rec.get(image_column)
+    if not img_field or not isinstance(img_field, dict) or "bytes" not in img_field:
+        logger.debug("[%s] ⚠️ Invalid or missing 'bytes' field.", idx)
+        return None
+
+    data = img_field["bytes"]
+    key = content_key(data)
+    if is_duplicate is not None and is_duplicate(key):
+        logger.debug("[%s] ♻️ Duplicate image, skipping.", idx)
+        return SKIP
+
+    path = f"hf://{repo}/{split}/{idx}"
+    label = rec.get(label_column)
+    label = None if label is None else str(label)
+    embedding = cache.get(key) if cache is not None else None
+    if embedding is not None:
+        return IngestItem(idx=idx, payload=None, path=path, embedding=embedding, key=key, label=label)
+
+    try:
+        payload = prepare_image_payload(data)
+    except UnidentifiedImageError:
+        logger.debug("[%s] ❌ Could not identify image, skipping.", idx)
+        return None
+
+    return IngestItem(idx=idx, payload=payload, path=path, key=key, label=label)
+
+
+def build_index(repo: str, split: str="train", image_column: str="image", label_column: str="label",
+                batch_size: int=BATCH_SIZE, max_wait_s: float=BATCH_MAX_WAIT_S,
+                decode_workers: int=DECODE_WORKERS, max_inflight: int=MAX_INFLIGHT,
+                start_offset: int=0, stop_event: Optional[threading.Event]=None,
+                on_progress: Optional[Callable[[PipelineStats], None]]=None,
+                on_checkpoint: Optional[Callable[[PipelineStats], None]]=None,
+                checkpoint_every: int=CHECKPOINT_EVERY, collection: str=DEFAULT_COLLECTION,
+                index_params: Optional[dict]=None, rebuild: Optional[str]=None) -> PipelineStats:
+    """
+    Stream a HF image dataset, embed it and insert it into the HNSW index of
+    `collection`, creating it with `index_params` (M, ef_construction,
+    ef_search overrides) if it does not exist yet.
+
+    Runs as a staged pipeline (see `scripts.pipeline.IngestPipeline`): images
+    are decoded on `decode_workers` threads, grouped into micro-batches of up
+    to `batch_size` (or whatever arrived within `max_wait_s`), sent to the
+    endpoint with at most `max_inflight` requests outstanding, and inserted
+    into the index by a single writer.
+
+    Every `checkpoint_every` records the index is saved and `on_checkpoint`
+    receives stats whose `offset` can be passed back as `start_offset` to
+    resume without re-embedding. Setting `stop_event` stops the build early;
+    records already read are still indexed and checkpointed.
+
+    With `rebuild` (a generation id, e.g. the job id) the build goes into a
+    new generation of the collection while the live one keeps serving
+    searches; when it completes, the new generation is warmed up and swapped
+    in (see `HNSWIndexSingleton.promote`). A stopped rebuild is not swapped
+    in and resumes into the same generation.
+
+    Rows at or past `start_offset` that are already in the collection (inserts
+    recovered from the write-ahead log after a crash) are skipped.
+
+    Embeddings are looked up in the persistent content-addressed cache under
+    EMBEDDING_CACHE_DIR before calling the encoder, and images whose bytes
+    repeat within the dataset are indexed once.
+
+    Returns:
+        PipelineStats: counts of seen, embedded and failed records.
+    """
+    logger.info(f"📦 Starting index build for {repo}/{split} into '{collection}' from offset {start_offset} "
+                f"(batch_size={batch_size}, decode_workers={decode_workers}, max_inflight={max_inflight})")
     dataset = load_dataset(repo, split=split, streaming=True)
-    os.makedirs(IMG_DIR, exist_ok=True)
+    total = _dataset_size(dataset, split)
+    if start_offset:
+        dataset = dataset.skip(start_offset)
 
-    clip_client = CLIPSageMakerClient()
-    HNSWIndexSingleton.ensure_ready()
+    encoder = get_encoder()
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIR, encoder.model_id) if EMBEDDING_CACHE_DIR else None
+    if rebuild:
+        index = HNSWIndexSingleton.stage(collection, rebuild, **(index_params or {}))
+    else:
+        index = HNSWIndexSingleton.collection(collection, create=True, **(index_params or {}))
+    index.ensure_ready()
+    if total:
+        # One resize up front instead of several doublings (and their copies) mid-build
+        index.reserve(max(total - start_offset, 0))
 
-    success_count = 0
-    fail_count = 0
+    # Rows past the checkpoint that the write-ahead log already recovered into the index
+    indexed = index.indexed_rows(repo, split, since=start_offset)
+    if indexed:
+        logger.info(f"⏭️ {len(indexed)} rows past offset {start_offset} are already indexed; skipping them")
 
-    for idx, rec in enumerate(dataset):
-        try:
-            logger.info(f"[{idx}] 🔄 Processing record...")
+    # Content keys of images embedded or on their way; a failed batch releases its keys,
+    # so a later copy of the same image is indexed instead of skipped
+    seen_keys, seen_lock = set(), threading.Lock()
 
-            img_field = rec.get(image_column)
-            if not img_field or not isinstance(img_field, dict) or "bytes" not in img_field:
-                logger.warning(f"[{idx}] ⚠️ Invalid or missing 'bytes' field.")
-                fail_count += 1
-                continue
+    def is_duplicate(key: bytes) -> bool:
+        with seen_lock:
+            if key in seen_keys:
+                return True
+            seen_keys.add(key)
+            return False
 
-            img_data = img_field["bytes"]
-            img = Image.open(io.BytesIO(img_data)).convert("RGB")
+    def release(items: list):
+        with seen_lock:
+            seen_keys.difference_update(item.key for item in items)
 
-            fname = f"{repo.replace('/', '_')}_{idx}_{uuid4().hex[:6]}.jpg"
-            path = os.path.join(IMG_DIR, fname)
-            img.save(path, format="JPEG")
-            img.close()
-            logger.info(f"[{idx}] ✅ Saved image at {path}")
+    def write(items: list, embeddings: np.ndarray):
+        if cache is not None:
+            fresh = [i for i, item in enumerate(items) if item.embedding is None]
+            if fresh:
+                cache.put_many([items[i].key for i in fresh], embeddings[fresh])
+        index.add_batch(embeddings, [
+            ItemMetadata(path=item.path, dataset=repo, split=split, row=item.idx,
+                         content_hash=item.key.hex(), class_label=item.label)
+            for item in items
+        ])
+        logger.debug("📌 Indexed batch of %d", len(items))
 
-            # Reopen for prediction
-            with Image.open(path) as reloaded_img:
-                logger.debug(f"[{idx}] 🔍 Reopened image for encoding.")
-                embedding = clip_client.encode_image(reloaded_img)
+    last_checkpoint = start_offset
 
-            logger.info(f"[{idx}] ✅ Embedding shape: {embedding.shape}")
+    def checkpoint(stats: PipelineStats):
+        nonlocal last_checkpoint
+        if cache is not None:
+            cache.flush()
+        index.save()
+        last_checkpoint = stats.offset
+        if on_checkpoint is not None:
+            on_checkpoint(stats)
 
-            # Add to index
-            HNSWIndexSingleton.add_items([embedding], [path])
-            logger.info(f"[{idx}] 📌 Embedded and indexed.")
-            success_count += 1
+    def progress(stats: PipelineStats):
+        if on_progress is not None:
+            on_progress(stats)
+        if stats.offset - last_checkpoint >= checkpoint_every:
+            checkpoint(stats)
 
-        except UnidentifiedImageError:
-            logger.warning(f"[{idx}] ❌ Could not identify image, skipping.")
-            fail_count += 1
+    def encode(payloads: list) -> np.ndarray:
+        with timed_encode("image", encoder, len(payloads)):
+            return encoder.encode_images(payloads)
 
-        except Exception as e:
-            import traceback
-            logger.error(f"[{idx}] ❌ Failed to process image: {e}")
-            logger.debug(traceback.format_exc())
-            fail_count += 1
+    pipeline = IngestPipeline(
+        decode_fn=lambda idx, rec: SKIP if idx in indexed else _decode_record(
+            repo, split, image_column, label_column, idx, rec, is_duplicate, cache),
+        encode_fn=encode,
+        write_fn=write,
+        decode_workers=decode_workers,
+        max_inflight=max_inflight,
+        batch_size=batch_size,
+        max_wait_s=max_wait_s,
+        queue_size=QUEUE_SIZE,
+        on_progress=progress,
+        stop_event=stop_event,
+        on_failure=release,
+    )
+    pipeline.stats.total = total
+    stats = pipeline.run(dataset, start=start_offset)
 
-    HNSWIndexSingleton.save()
-    print(f"🚀 Done. Indexed {success_count}, Failed {fail_count}.")
\ No newline at end of file
+    checkpoint(stats)
+    if rebuild and not (stop_event is not None and stop_event.is_set()):
+        HNSWIndexSingleton.promote(collection, index)
+    cached = f", {cache.hits} from cache" if cache is not None else ""
+    logger.info(f"🚀 Done. Indexed {stats.embedded}{cached}, Skipped {stats.skipped} duplicates, "
+                f"Failed {stats.failed}.")
+    return stats
@@ -0,0 +1,281 @@
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from server.metrics import INGEST_RECORDS
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output
+_DONE = object()
+# Returned by decode_fn for records that are intentionally not indexed (e.g. duplicates)
+SKIP = object()
+
+
+@dataclass
+class IngestItem:
+    """One decoded dataset record travelling through the pipeline."""
+    idx: int
+    payload: Any
+    path: str
+    embedding: Optional[np.ndarray] = None  # set when already known; the item then skips the encoder
+    key: Optional[bytes] = None  # content address of the source bytes
+    label: Optional[str] = None  # class label from the source record
+
+
+@dataclass
+class PipelineStats:
+    seen: int = 0
+    embedded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    offset: int = 0  # every record before this dataset offset is fully processed
+    total: Optional[int] = None  # records in the dataset, when known
+
+
+class _Watermark:
+    """Tracks the lowest record index that is not yet finished (written or failed)."""
+
+    def __init__(self, start: int):
+        self.value = start
+        self._done = set()
+
+    def mark(self, idx: int) -> int:
+        self._done.add(idx)
+        while self.value in self._done:
+            self._done.remove(self.value)
+            self.value += 1
+        return self.value
+
+
+class IngestPipeline:
+    """
+    Staged ingestion: read → decode (worker pool) → micro-batch → encode
+    (bounded in-flight requests) → write (single thread).
+
+    Stages are connected by bounded queues, so a slow stage applies
+    backpressure upstream instead of letting decoded images pile up in
+    memory. Total build time approaches that of the slowest stage.
+
+    Items that arrive from `decode_fn` with an `embedding` already set are
+    grouped separately and go straight to the writer.
+
+    Args:
+        decode_fn: (idx, record) -> IngestItem, None for a failed record, or
+            SKIP for one that should not be indexed.
+        encode_fn: list of payloads -> (N, D) embedding matrix.
+        write_fn: (items, embeddings) -> None. Only ever called from one thread.
+        on_progress: Optional (stats) -> None, called on the writer thread after
+            every written batch. `stats.offset` is a safe resume point.
+        on_failure: Optional (items) -> None, called with the items of a batch
+            that failed to embed or to be written.
+        stop_event: Optional event; once set, no further records are read.
+    """
+
+    def __init__(
+        self,
+        decode_fn: Callable[[int, Any], Optional[IngestItem]],
+        encode_fn: Callable[[list], np.ndarray],
+        write_fn: Callable[[list, np.ndarray], None],
+        decode_workers: int = 4,
+        max_inflight: int = 4,
+        batch_size: int = 32,
+        max_wait_s: float = 0.5,
+        queue_size: int = 256,
+        on_progress: Optional[Callable[[PipelineStats], None]] = None,
+        stop_event: Optional[threading.Event] = None,
+        on_failure: Optional[Callable[[list], None]] = None,
+    ):
+        self.decode_fn = decode_fn
+        self.encode_fn = encode_fn
+        self.write_fn = write_fn
+        self.decode_workers = max(1, decode_workers)
+        self.max_inflight = max(1, max_inflight)
+        self.batch_size = max(1, batch_size)
+        self.max_wait_s = max_wait_s
+        self.on_progress = on_progress
+        self.on_failure = on_failure
+
+        self._decode_q = queue.Queue(maxsize=queue_size)
+        self._batch_q = queue.Queue(maxsize=queue_size)
+        self._write_q = queue.Queue(maxsize=self.max_inflight)
+        self._inflight = threading.BoundedSemaphore(self.max_inflight)
+
+        self.stats = PipelineStats()
+        self._stats_lock = threading.Lock()
+        self._watermark = _Watermark(0)
+        self._stop = stop_event or threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def _count(self, field: str, n: int = 1):
+        with self._stats_lock:
+            setattr(self.stats, field, getattr(self.stats, field) + n)
+        INGEST_RECORDS.inc(n, stage=field)
+
+    def _finish(self, field: str, indices: list):
+        """Count records as embedded/failed/skipped and advance the resume watermark."""
+        with self._stats_lock:
+            setattr(self.stats, field, getattr(self.stats, field) + len(indices))
+            for idx in indices:
+                self.stats.offset = self._watermark.mark(idx)
+        INGEST_RECORDS.inc(len(indices), stage=field)
+
+    def _fail(self, batch: list):
+        self._finish("failed", [item.idx for item in batch])
+        if self.on_failure is not None:
+            self.on_failure(batch)
+
+    def stop(self):
+        """Stop reading new records; everything already read is still processed."""
+        self._stop.set()
+
+    # ── Stages ──────────────────────────────────────────────────────
+
+    def _read(self, records: Iterable, start: int):
+        try:
+            for idx, rec in enumerate(records, start):
+                if self._stop.is_set():
+                    break
+                self._decode_q.put((idx, rec))
+                self._count("seen")
+        except BaseException as e:
+            logger.error(f"❌ Dataset iteration failed: {e}")
+            self._error = e
+        finally:
+            for _ in range(self.decode_workers):
+                self._decode_q.put(_DONE)
+
+    def _decode(self):
+        while True:
+            task = self._decode_q.get()
+            if task is _DONE:
+                self._batch_q.put(_DONE)
+                return
+            idx, rec = task
+            try:
+                item = self.decode_fn(idx, rec)
+            except Exception as e:
+                logger.debug("[%s] ❌ Failed to decode record: %s", idx, e)
+                item = None
+            if item is None:
+                self._finish("failed", [idx])
+                continue
+            if item is SKIP:
+                self._finish("skipped", [idx])
+                continue
+            self._batch_q.put(item)
+
+    def _encode(self, batch: list):
+        try:
+            embeddings = self.encode_fn([item.payload for item in batch])
+            self._write_q.put((batch, embeddings))
+        except Exception as e:
+            import traceback
+            logger.error(f"❌ Failed to embed batch of {len(batch)}: {e}")
+            logger.debug(traceback.format_exc())
+            self._fail(batch)
+        finally:
+            self._inflight.release()
+
+    def _batch(self, executor: ThreadPoolExecutor):
+        remaining_decoders = self.decode_workers
+        batch, deadline = [], None
+        known = []  # items whose embedding is already set
+
+        def submit():
+            nonlocal batch
+            if batch:
+                self._inflight.acquire()  # blocks while max_inflight requests are pending
+                executor.submit(self._encode, batch)
+                batch = []
+
+        def submit_known():
+            nonlocal known
+            if known:
+                self._write_q.put((known, np.vstack([item.embedding for item in known])))
+                known = []
+
+        while remaining_decoders:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._batch_q.get(timeout=timeout)
+            except queue.Empty:
+                submit()
+                submit_known()
+                deadline = None
+                continue
+
+            if item is _DONE:
+                remaining_decoders -= 1
+                continue
+
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait_s
+            if item.embedding is not None:
+                known.append(item)
+                if len(known) >= self.batch_size:
+                    submit_known()
+            else:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    submit()
+            if not batch and not known:
+                deadline = None
+
+        submit()
+        submit_known()
+
+    def _dispatch(self):
+        with ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="ingest-encode") as executor:
+            try:
+                self._batch(executor)
+            except BaseException as e:
+                self._error = e
+        # Executor has drained: every in-flight batch is on the write queue
+        self._write_q.put(_DONE)
+
+    # ── Driver ──────────────────────────────────────────────────────
+
+    def run(self, records: Iterable, start: int = 0) -> PipelineStats:
+        """
+        Run all stages over `records`; writes happen on the calling thread.
+
+        `start` is the dataset offset of the first record (when resuming), so
+        item indices and `stats.offset` stay absolute.
+        """
+        self.stats.offset = start
+        self._watermark = _Watermark(start)
+        threads = [threading.Thread(target=self._read, args=(records, start), name="ingest-read", daemon=True)]
+        threads += [
+            threading.Thread(target=self._decode, name=f"ingest-decode-{i}", daemon=True)
+            for i in range(self.decode_workers)
+        ]
+        threads.append(threading.Thread(target=self._dispatch, name="ingest-batch", daemon=True))
+        for t in threads:
+            t.start()
+
+        while True:
+            task = self._write_q.get()
+            if task is _DONE:
+                break
+            batch, embeddings = task
+            try:
+                self.write_fn(batch, embeddings)
+                self._finish("embedded", [item.idx for item in batch])
+            except Exception as e:
+                logger.error(f"❌ Failed to index batch of {len(batch)}: {e}")
+                self._fail(batch)
+            if self.on_progress is not None:
+                self.on_progress(self.stats)
+
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+        return self.stats
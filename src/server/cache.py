@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache whose entries also expire after `ttl_s`.
+
+    Thread-safe; `get` refreshes an entry's LRU position but not its expiry.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a text query. CLIP's tokenizer lowercases, so case is not significant."""
+    return " ".join(text.lower().split())
+
+
+# Query text -> embedding, saves a SageMaker round trip per repeated query
+query_embedding_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "10000")),
+    ttl_s=float(os.getenv("QUERY_CACHE_TTL_S", "3600")),
+)
+
+# (query, k, index version) -> search results; entries for older index versions are never hit again
+search_result_cache = TTLCache(
+    maxsize=int(os.getenv("RESULT_CACHE_SIZE", "10000")),
+    ttl_s=float(os.getenv("RESULT_CACHE_TTL_S", "300")),
+)
@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from typing import Callable, Optional
+
+import numpy as np
+
+from server.encoders import Encoder
+from server.metrics import timed_encode
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW_MS = float(os.getenv("SEARCH_COALESCE_WINDOW_MS", "3"))
+COALESCE_MAX_BATCH = int(os.getenv("SEARCH_COALESCE_MAX_BATCH", "32"))
+
+
+class TextEncodeCoalescer:
+    """
+    Micro-batches concurrent single-text encodes into one encoder request.
+
+    The first text to arrive opens a window of `window_ms`; every text that
+    arrives before it closes (or until `max_batch` distinct texts are queued)
+    is sent in one `encode_texts_async` call, and each caller receives its own
+    row. Identical texts in a window share a row. Runs on the event loop, so
+    it is meant for `async def` endpoints.
+
+    Args:
+        encoder_fn: Returns the encoder to use; resolved at flush time.
+    """
+
+    def __init__(self, encoder_fn: Callable[[], Encoder], window_ms: float = COALESCE_WINDOW_MS,
+                 max_batch: int = COALESCE_MAX_BATCH):
+        self.encoder_fn = encoder_fn
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: dict[str, list[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()  # the loop only holds weak references to tasks
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Return a (1, D) embedding for `text`, sharing a request with concurrent callers."""
+        self.requests += 1
+        if self.window_s <= 0:
+            self.batches += 1
+            self.texts += 1
+            encoder = self.encoder_fn()
+            with timed_encode("text", encoder, 1):
+                return (await encoder.encode_texts_async([text])).reshape(1, -1)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(text, []).append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict[str, list[asyncio.Future]]):
+        texts = list(batch)
+        self.batches += 1
+        self.texts += len(texts)
+        try:
+            encoder = self.encoder_fn()
+            with timed_encode("text", encoder, len(texts)):
+                embeddings = await encoder.encode_texts_async(texts)
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"Encoder returned {len(embeddings)} embeddings for {len(texts)} texts")
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for text, row in zip(texts, embeddings):
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(row.reshape(1, -1))
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
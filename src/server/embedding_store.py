@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embeddings")  # "" disables the cache
+KEY_BYTES = 16
+_MIN_CAPACITY = 1024
+_KEY_DTYPE = np.dtype(f"V{KEY_BYTES}")
+_MIN_RECENT = 4096  # appended keys held in a dict before they are merged into the sorted index
+
+
+def content_key(data: bytes) -> bytes:
+    """Content address of an encoded image: a 128-bit BLAKE2b digest of its bytes."""
+    return hashlib.blake2b(data, digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of image embeddings for one model.
+
+    Lives in `<root>/<model slug>/`:
+      - `vectors.f32`: memory-mapped (capacity, dim) float32 matrix, grown by doubling
+      - `keys.bin`: append-only 16-byte content keys; key i owns row i
+      - `meta.json`: model id and dim
+
+    Keys are only appended to `keys.bin` on `flush()`, after the vectors they
+    point at have been flushed, so a crash loses unflushed rows but never maps
+    a key to a row that was not written. `dim` is taken from the first `put`
+    when the store is new.
+
+    In memory, keys are indexed by a sorted fixed-width key array with their
+    rows alongside (24 bytes per key, looked up with `searchsorted`). New keys
+    go to a small dict first and are merged into the sorted arrays once it
+    holds more than max(_MIN_RECENT, 1/16 of them).
+    """
+
+    def __init__(self, root: str, model_id: str):
+        self.model_id = str(model_id)
+        slug = hashlib.blake2b(self.model_id.encode(), digest_size=6).hexdigest()
+        self.path = os.path.join(root, slug)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._keys_path = os.path.join(self.path, "keys.bin")
+        self._meta_path = os.path.join(self.path, "meta.json")
+
+        self.dim: Optional[int] = None
+        self._keys = np.empty(0, dtype=_KEY_DTYPE)  # sorted
+        self._rows = np.empty(0, dtype=np.int64)  # row of each sorted key
+        self._recent: dict[bytes, int] = {}  # keys put since the last merge
+        self._pending: list[bytes] = []
+        self._vectors: Optional[np.memmap] = None
+        self._capacity = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def _open(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        if meta["model_id"] != self.model_id:
+            raise ValueError(f"Embedding cache at {self.path} belongs to {meta['model_id']}, not {self.model_id}")
+        self.dim = int(meta["dim"])
+
+        with open(self._keys_path, "rb") as f:
+            keys = f.read()
+        self._capacity = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        count = min(len(keys) // KEY_BYTES, self._capacity)
+        keys = np.frombuffer(keys, dtype=_KEY_DTYPE, count=count)
+        self._rows = np.argsort(keys, kind="stable")
+        self._keys = keys[self._rows]
+        self._map()
+        logger.info(f"🗃️ Opened embedding cache with {count} vectors for {self.model_id}")
+
+    def _map(self):
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def _create(self, dim: int):
+        os.makedirs(self.path, exist_ok=True)
+        self.dim = dim
+        with open(self._meta_path, "w") as f:
+            json.dump({"model_id": self.model_id, "dim": dim}, f)
+        open(self._keys_path, "wb").close()
+        open(self._vectors_path, "wb").close()
+
+    def _reserve(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = max(_MIN_CAPACITY, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "r+b") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._capacity = capacity
+        self._map()
+
+    def _find(self, keys: list[bytes]) -> np.ndarray:
+        """Row of each key, or -1 where it is not cached."""
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._keys):
+            wanted = np.frombuffer(b"".join(keys), dtype=_KEY_DTYPE)
+            at = np.minimum(np.searchsorted(self._keys, wanted), len(self._keys) - 1)
+            found = self._keys[at] == wanted
+            rows[found] = self._rows[at[found]]
+        for i, key in enumerate(keys):
+            row = self._recent.get(key)
+            if row is not None:
+                rows[i] = row
+        return rows
+
+    def _merge_recent(self):
+        keys = np.concatenate([self._keys, np.frombuffer(b"".join(self._recent), dtype=_KEY_DTYPE)])
+        recent_rows = np.fromiter(self._recent.values(), dtype=np.int64, count=len(self._recent))
+        rows = np.concatenate([self._rows, recent_rows])
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._rows = keys[order], rows[order]
+        self._recent = {}
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._recent)
+
+    def __contains__(self, key: bytes) -> bool:
+        with self._lock:
+            return self._find([key])[0] >= 0
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        """Return a copy of the cached (D,) embedding for `key`, or None."""
+        with self._lock:
+            row = self._find([key])[0]
+            if row < 0:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return np.array(self._vectors[row])
+
+    def put_many(self, keys: list[bytes], vectors: np.ndarray):
+        """Store one (D,) row of `vectors` per key; keys already present are left as-is."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        with self._lock:
+            if self.dim is None:
+                self._create(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d embeddings, got {vectors.shape[1]}")
+
+            new = {}
+            for key, vector, row in zip(keys, vectors, self._find(keys)):
+                if row < 0 and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            start = len(self)
+            self._reserve(start + len(new))
+            self._vectors[start:start + len(new)] = np.vstack(list(new.values()))
+            for offset, key in enumerate(new):
+                self._recent[key] = start + offset
+            self._pending.extend(new)
+            if len(self._recent) > max(_MIN_RECENT, len(self._keys) // 16):
+                self._merge_recent()
+
+    def flush(self):
+        """Persist rows added since the last flush: vectors first, then their keys."""
+        with self._lock:
+            if not self._pending:
+                return
+            self._vectors.flush()
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(self._pending))
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending = []
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
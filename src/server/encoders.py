@@ -0,0 +1,197 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
+import threading
+import importlib.util
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Which encoder the server and build scripts use: sagemaker | local | fake
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "sagemaker")
+CLIP_MODEL_ID = os.getenv("CLIP_MODEL_ID", "openai/clip-vit-base-patch32")
+
+# Local backend: reuse the endpoint's own inference code and a local model dir / hub id. The default
+# path only exists in a source checkout; containers mount the file and point this variable at it.
+LOCAL_CLIP_INFERENCE_PATH = os.getenv(
+    "LOCAL_CLIP_INFERENCE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "cloud", "inference_deployment", "inference.py"),
+)
+LOCAL_CLIP_MODEL_DIR = os.getenv("LOCAL_CLIP_MODEL_DIR", CLIP_MODEL_ID)
+
+# Fake backend: deterministic vectors and simulated endpoint latency
+FAKE_ENCODER_DIM = int(os.getenv("FAKE_ENCODER_DIM", os.getenv("HNSW_DIM") or "512"))
+FAKE_ENCODER_SEED = int(os.getenv("FAKE_ENCODER_SEED", "0"))
+FAKE_ENCODER_LATENCY_MS = float(os.getenv("FAKE_ENCODER_LATENCY_MS", "0"))
+FAKE_ENCODER_PER_ITEM_MS = float(os.getenv("FAKE_ENCODER_PER_ITEM_MS", "0"))
+
+
+class Encoder(ABC):
+    """
+    CLIP embedding backend. Implementations are batch-first: one call to
+    `encode_texts` / `encode_images` is one request (or forward pass) and
+    returns a (N, D) float32 matrix of unit vectors.
+    """
+
+    backend: str = "abstract"
+    model_id: str = CLIP_MODEL_ID
+
+    @abstractmethod
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def encode_images(self, images: list) -> np.ndarray:
+        """`images` holds PIL images or encoded JPEG/PNG bytes."""
+        ...
+
+    def encode_text(self, text: str) -> np.ndarray:
+        return self.encode_texts([text])
+
+    async def encode_texts_async(self, texts: list[str]) -> np.ndarray:
+        return await asyncio.to_thread(self.encode_texts, texts)
+
+    async def encode_text_async(self, text: str) -> np.ndarray:
+        return await self.encode_texts_async([text])
+
+    async def aclose(self):
+        pass
+
+
+class FakeEncoder(Encoder):
+    """
+    Offline stand-in for benchmarks and tests: every input maps to a seeded,
+    reproducible unit vector, and each request can sleep to mimic endpoint
+    latency (`latency_ms` per request plus `per_item_ms` per input).
+    """
+
+    backend = "fake"
+
+    def __init__(self, dim: int = FAKE_ENCODER_DIM, seed: int = FAKE_ENCODER_SEED,
+                 latency_ms: float = FAKE_ENCODER_LATENCY_MS, per_item_ms: float = FAKE_ENCODER_PER_ITEM_MS):
+        self.dim = dim
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.model_id = f"fake-{dim}-seed{seed}"
+
+    def _vector(self, data: bytes) -> np.ndarray:
+        digest = hashlib.blake2b(data, digest_size=8, key=str(self.seed).encode()).digest()
+        vec = np.random.default_rng(int.from_bytes(digest, "little")).standard_normal(self.dim)
+        return (vec / np.linalg.norm(vec)).astype(np.float32)
+
+    def _delay_s(self, n: int) -> float:
+        return (self.latency_ms + self.per_item_ms * n) / 1000.0
+
+    def _embed(self, payloads: list[bytes]) -> np.ndarray:
+        if not payloads:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.vstack([self._vector(p) for p in payloads])
+
+    @staticmethod
+    def _image_bytes(image) -> bytes:
+        if isinstance(image, (bytes, bytearray)):
+            return b"img:" + bytes(image)
+        return b"img:" + image.tobytes()
+
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        time.sleep(self._delay_s(len(texts)))
+        return self._embed([b"txt:" + t.encode() for t in texts])
+
+    def encode_images(self, images: list) -> np.ndarray:
+        time.sleep(self._delay_s(len(images)))
+        return self._embed([self._image_bytes(img) for img in images])
+
+    async def encode_texts_async(self, texts: list[str]) -> np.ndarray:
+        await asyncio.sleep(self._delay_s(len(texts)))
+        return self._embed([b"txt:" + t.encode() for t in texts])
+
+
+class LocalCLIPEncoder(Encoder):
+    """
+    In-process CPU/GPU backend that loads the endpoint's `inference.py` and
+    calls its `model_fn` / `predict_fn` directly, so local embeddings match
+    the deployed endpoint's preprocessing and normalization.
+    """
+
+    backend = "local"
+
+    def __init__(self, model_dir: str = LOCAL_CLIP_MODEL_DIR, inference_path: str = LOCAL_CLIP_INFERENCE_PATH):
+        check_local_inference_path(inference_path)
+        spec = importlib.util.spec_from_file_location("clip_inference", os.path.abspath(inference_path))
+        if spec is None or spec.loader is None:
+            raise FileNotFoundError(f"Cannot load CLIP inference code from {inference_path}")
+        self._inference = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self._inference)
+
+        self.model_id = model_dir
+        self._context = self._inference.model_fn(model_dir)
+        # One forward pass at a time; torch already parallelizes within a batch
+        self._lock = threading.Lock()
+        logger.info(f"✅ Loaded local CLIP encoder from {model_dir}")
+
+    def _predict(self, inputs) -> np.ndarray:
+        with self._lock:
+            out = self._inference.predict_fn(inputs, self._context)
+        return np.asarray(out, dtype=np.float32)
+
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        return self._predict(list(texts))
+
+    def encode_images(self, images: list) -> np.ndarray:
+        decoded = [
+            Image.open(io.BytesIO(img)).convert("RGB") if isinstance(img, (bytes, bytearray)) else img
+            for img in images
+        ]
+        return self._predict(decoded)
+
+
+def check_local_inference_path(inference_path: str = LOCAL_CLIP_INFERENCE_PATH):
+    """Raise if the endpoint's `inference.py`, which the local backend loads, is not there."""
+    if not os.path.isfile(inference_path):
+        raise FileNotFoundError(
+            f"ENCODER_BACKEND=local needs the endpoint's inference.py, but {os.path.abspath(inference_path)} "
+            f"does not exist; set LOCAL_CLIP_INFERENCE_PATH to cloud/inference_deployment/inference.py "
+            f"(mounted into the container, see docker-compose.yml)"
+        )
+
+
+_encoder: Optional[Encoder] = None
+_encoder_lock = threading.Lock()
+
+
+def create_encoder(backend: str = ENCODER_BACKEND) -> Encoder:
+    if backend == "sagemaker":
+        from server.sage_maker import CLIPSageMakerClient
+        return CLIPSageMakerClient()
+    if backend == "local":
+        return LocalCLIPEncoder()
+    if backend == "fake":
+        return FakeEncoder()
+    raise ValueError(f"Unknown ENCODER_BACKEND '{backend}' (expected sagemaker, local or fake)")
+
+
+def get_encoder() -> Encoder:
+    """Process-wide encoder selected by ENCODER_BACKEND, created on first use."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = create_encoder()
+                logger.info(f"🧠 Using '{_encoder.backend}' encoder ({_encoder.model_id})")
+    return _encoder
+
+
+async def close_encoder():
+    """Release the process-wide encoder's connections, if one was created."""
+    global _encoder
+    if _encoder is not None:
+        await _encoder.aclose()
+        _encoder = None
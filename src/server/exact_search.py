@@ -0,0 +1,120 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+BLOCK_ROWS = int(os.getenv("EXACT_BLOCK_ROWS", "16384"))  # base vectors per matrix product
+_SCORE_BYTES = 64 * 2**20  # bound on one (queries x block) distance matrix
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="exact-search")
+        return _pool
+
+
+class IndexRows:
+    """Rows 0..count-1 of an hnswlib-style index, fetched a block at a time with `get_items`."""
+
+    def __init__(self, index, count: int, dim: int):
+        self.index = index
+        self.shape = (count, dim)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, rows) -> np.ndarray:
+        labels = np.arange(*rows.indices(self.shape[0])) if isinstance(rows, slice) else np.asarray(rows)
+        return np.asarray(self.index.get_items(labels, return_type="numpy"), dtype=np.float32)
+
+
+class SelectedRows:
+    """The rows `labels` of `base` (an array or `IndexRows`), gathered a block at a time."""
+
+    def __init__(self, base, labels: np.ndarray):
+        self.base = base
+        self.labels = labels
+        self.shape = (len(labels), base.shape[1])
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, rows: slice) -> np.ndarray:
+        return self.base[self.labels[rows]]
+
+
+def exact_knn(base: np.ndarray, queries: np.ndarray, k: int, space: str = "cosine", num_threads: int = -1,
+              block_rows: int = BLOCK_ROWS):
+    """
+    Exact top-k of each query row among the rows of `base`, by brute force.
+
+    The base is scanned in blocks of `block_rows`: each block is one matrix
+    product against a block of queries, reduced to its k best per query with
+    `argpartition`, and the per-block winners are merged at the end. Blocks
+    run on a shared thread pool (NumPy releases the GIL in the product)
+    unless `num_threads` is 1. Distances match hnswlib's spaces, and for
+    "cosine" `base` rows must already be normalized, as hnswlib stores them.
+
+    Args:
+        base: (N, D) vectors, or anything sliceable into row blocks (np.memmap,
+            `IndexRows`, `SelectedRows`); row numbers are the returned labels.
+        queries (np.ndarray): (D,) or (Q, D) query vectors.
+        k (int): Neighbours per query.
+        space (str): "cosine", "ip" or "l2".
+        num_threads (int): 1 to scan on the calling thread; otherwise the pool is used.
+        block_rows (int): Base rows per block.
+
+    Returns:
+        (labels, distances): (Q, k) uint64 and float32 arrays, nearest first.
+
+    Raises:
+        RuntimeError: If `base` has fewer than k rows (hnswlib's error for a short result).
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, base.shape[1])
+    n = len(base)
+    if k > n:
+        raise RuntimeError("Cannot return the results in a contiguous 2D array. Probably ef or M is too small")
+    if space == "cosine":
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    blocks = [(lo, min(lo + block_rows, n)) for lo in range(0, n, block_rows)]
+    query_rows = max(1, _SCORE_BYTES // (4 * min(block_rows, n)))
+    labels, distances = [], []
+    for qlo in range(0, len(queries), query_rows):
+        block_queries = queries[qlo:qlo + query_rows]
+        query_norms = (block_queries ** 2).sum(1)[:, None] if space == "l2" else None
+
+        def scan(block):
+            lo, hi = block
+            chunk = np.asarray(base[lo:hi], dtype=np.float32)
+            scores = block_queries @ chunk.T
+            if space == "l2":
+                d = query_norms - 2 * scores + (chunk ** 2).sum(1)[None, :]
+            else:
+                d = 1 - scores
+            if k >= hi - lo:
+                top = np.broadcast_to(np.arange(hi - lo), d.shape)
+            else:
+                top = np.argpartition(d, k - 1, axis=1)[:, :k]
+            return top + lo, np.take_along_axis(d, top, axis=1)
+
+        if num_threads != 1 and len(blocks) > 1:
+            parts = list(_executor().map(scan, blocks))
+        else:
+            parts = [scan(block) for block in blocks]
+        block_labels = np.concatenate([p[0] for p in parts], axis=1)
+        block_distances = np.concatenate([p[1] for p in parts], axis=1)
+        top = np.argpartition(block_distances, k - 1, axis=1)[:, :k] if k < block_distances.shape[1] \
+            else np.broadcast_to(np.arange(k), (len(block_queries), k))
+        top_distances = np.take_along_axis(block_distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        labels.append(np.take_along_axis(np.take_along_axis(block_labels, top, axis=1), order, axis=1))
+        distances.append(np.take_along_axis(top_distances, order, axis=1))
+    return np.concatenate(labels).astype(np.uint64), np.concatenate(distances).astype(np.float32)
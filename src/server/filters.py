@@ -0,0 +1,85 @@
+import threading
+from dataclasses import dataclass, fields
+from typing import Iterable, Optional
+
+import numpy as np
+
+_MIN_CAPACITY = 1024
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """Restrict a search to items whose attributes equal every given value."""
+    dataset: Optional[str] = None
+    split: Optional[str] = None
+    class_label: Optional[str] = None
+
+    def terms(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self) if getattr(self, f.name) is not None}
+
+    def is_empty(self) -> bool:
+        return not self.terms()
+
+
+ATTRIBUTES = tuple(f.name for f in fields(SearchFilter))
+
+
+class AttributeBitsets:
+    """
+    One boolean membership array per (attribute, value), indexed by HNSW label.
+
+    Arrays grow by doubling as labels are appended. A filter's mask is the AND
+    of its terms' arrays, so evaluating it costs a few vectorized passes over
+    `count` bytes no matter how many items match.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._capacity = 0
+        self._bits: dict[str, dict[str, np.ndarray]] = {attr: {} for attr in ATTRIBUTES}
+        self._lock = threading.Lock()
+
+    def _grow(self, size: int):
+        capacity = max(_MIN_CAPACITY, self._capacity)
+        while capacity < size:
+            capacity *= 2
+        for values in self._bits.values():
+            for value, bits in values.items():
+                grown = np.zeros(capacity, dtype=bool)
+                grown[:self._capacity] = bits
+                values[value] = grown
+        self._capacity = capacity
+
+    def extend(self, start: int, rows: Iterable[tuple]):
+        """Record attribute values for labels start, start+1, ... (rows follow ATTRIBUTES order)."""
+        with self._lock:
+            rows = list(rows)
+            end = start + len(rows)
+            if end > self._capacity:
+                self._grow(end)
+            for offset, row in enumerate(rows):
+                for attr, value in zip(ATTRIBUTES, row):
+                    if value is None:
+                        continue
+                    bits = self._bits[attr].get(value)
+                    if bits is None:
+                        bits = self._bits[attr][value] = np.zeros(self._capacity, dtype=bool)
+                    bits[start + offset] = True
+            self.count = max(self.count, end)
+
+    def mask(self, search_filter: SearchFilter) -> np.ndarray:
+        """(count,) bool array of labels matching every term of the filter."""
+        with self._lock:
+            mask = np.ones(self.count, dtype=bool)
+            for attr, value in search_filter.terms().items():
+                bits = self._bits[attr].get(value)
+                if bits is None:
+                    return np.zeros(self.count, dtype=bool)
+                mask &= bits[:self.count]
+            return mask
+
+    def memory_bytes(self) -> int:
+        return sum(bits.nbytes for values in self._bits.values() for bits in values.values())
+
+    def values(self, attr: str) -> list[str]:
+        return sorted(self._bits[attr])
@@ -1,109 +1,563 @@
 import hnswlib
 import numpy as np
 import os
+import re
+import json
+import time
+import shutil
+import itertools
 import threading
 import logging
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, replace
+from typing import NamedTuple, Optional
+
+from server.filters import AttributeBitsets, SearchFilter
+from server.metadata_store import ItemMetadata, MetadataStore
+from server.rwlock import ModeLock, RWLock
+from server.wal import WriteAheadLog
+from server.mmap_index import MappedGraph, file_signature
+from server.quantization import CompressedIndex
+from server.exact_search import IndexRows, SelectedRows, exact_knn
+from server.metrics import KNN_SECONDS
 
 logger = logging.getLogger(__name__)
 
-class HNSWIndexSingleton:
-    _index = None
-    _image_paths = []
-    _ready = False
-    _lock = threading.Lock()
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+QUALITY_PATTERN = r"^(fast|balanced|high|exact)$"  # per-query recall/latency tiers, see HNSWIndex.search_ef
 
-    # File paths
-    INDEX_PATH = "data/index/image_index.bin"
-    META_PATH = "data/index/image_paths.txt"
 
-    # Configurable HNSW index settings from env
-    DIM = int(os.getenv("HNSW_DIM"))
-    MAX_ELEMENTS = int(os.getenv("HNSW_MAX_ELEMENTS"))
-    SPACE = os.getenv("HNSW_SPACE", "cosine")
-    EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION"))
-    M = int(os.getenv("HNSW_M"))
-    EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH"))
+class CollectionNotFound(KeyError):
+    pass
+
+
+# Content versions are unique across every HNSWIndex instance, so a collection
+# swapped to a new generation never reuses a version a result cache has seen
+_VERSIONS = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class IndexParams:
+    """HNSW settings of one collection, fixed when it is created."""
+    dim: int
+    space: str
+    M: int
+    ef_construction: int
+    ef_search: int
+    max_elements: int
+    # "sq8" / "pq": keep only quantized codes in memory (see `CompressedIndex`) instead of an HNSW graph
+    quantization: str = "none"
+    pq_subvectors: int = 64
+    rerank: bool = True  # re-score the best ef_search code matches against the float32 vectors
 
     @classmethod
-    def ensure_ready(cls):
+    def read(cls, path: str) -> Optional["IndexParams"]:
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(asdict(self), f)
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _View(NamedTuple):
+    """What a reader sees: the index, its metadata, and how many labels are fully inserted."""
+    index: hnswlib.Index
+    metadata: MetadataStore
+    visible: int
+
+
+class HNSWIndex:
+    """
+    One collection: an hnswlib graph, its label → metadata table and filter
+    bitsets, loaded on first use and unloadable when memory is needed.
+
+    Concurrency: writers (add, resize, save, load, unload) are serialized by
+    `_lock`. Readers never take it; each query reads `_view` once, an
+    immutable (index, metadata, visible) tuple that writers replace after
+    every change. Labels >= `visible` belong to an insert still in progress
+    and are dropped from results, so a query sees exactly the labels that
+    were complete when it started, and every label it returns has metadata.
+    The references in the view stay valid even if the collection is unloaded
+    or swapped mid-query. Readers share `_rw` only with `resize_index`, the
+    one hnswlib call that is unsafe during a search; hnswlib itself allows
+    inserts and searches to run concurrently.
+
+    Each search may ask for its own ef (`search_ef`). hnswlib keeps ef on
+    the index, so searches run under `_ef`: those with the current ef share
+    it, and one with a different ef waits for them to finish before
+    setting it. The ef does not depend on k (the index searches at least k
+    deep by itself) and explicit values are bucketed, so there are only a
+    few such modes.
+
+    Collections of at most EXACT_MAX_ITEMS are searched by brute force
+    (`exact_knn` over a float32 copy of their vectors), which beats a graph
+    walk at that size and is exact; `exact=True` forces it at any size, e.g.
+    for recall ground truth.
+
+    Capacity grows by GROWTH_FACTOR whenever an insert would not fit, so
+    `max_elements` is only the initial size.
+
+    Every insert is first appended to a write-ahead log next to the index.
+    Snapshots (`save`, or automatically every SNAPSHOT_EVERY_ITEMS inserts /
+    SNAPSHOT_INTERVAL_S seconds) write the index to a temp file, rename it
+    into place and record it in a manifest before the log is emptied; `load`
+    replays whatever the log holds past the snapshot.
+    """
+
+    ADD_THREADS = int(os.getenv("HNSW_ADD_THREADS", "-1"))  # -1 = all cores
+    QUERY_THREADS = int(os.getenv("HNSW_QUERY_THREADS", "-1"))
+    # Filters matching at most this many items are answered by an exact scan instead of HNSW
+    FILTER_EXACT_MAX = int(os.getenv("HNSW_FILTER_EXACT_MAX", "5000"))
+    GROWTH_FACTOR = float(os.getenv("HNSW_GROWTH_FACTOR", "2.0"))
+    SNAPSHOT_EVERY_ITEMS = int(os.getenv("HNSW_SNAPSHOT_EVERY_ITEMS", "50000"))  # 0 = only on save()
+    SNAPSHOT_INTERVAL_S = float(os.getenv("HNSW_SNAPSHOT_INTERVAL_S", "300"))  # 0 = only on save()
+    WARMUP_QUERIES = int(os.getenv("HNSW_WARMUP_QUERIES", "64"))  # searches run on a rebuild before it goes live
+    EXACT_MAX_ITEMS = int(os.getenv("HNSW_EXACT_MAX_ITEMS", "10000"))  # brute-force search up to this size; 0 = never
+    # Extra depth a search may add for labels of an insert still in progress; rows it leaves short are scanned
+    IN_FLIGHT_DEPTH_MAX = int(os.getenv("HNSW_IN_FLIGHT_DEPTH_MAX", "256"))
+    QUALITY_EF_FACTORS = {"fast": 0, "balanced": 1, "high": 4}  # ef = factor * ef_search; searches use max(ef, k)
+
+    def __init__(self, name: str, index_path: str, meta_path: str, params: IndexParams,
+                 legacy_meta_path: Optional[str] = None, generation: Optional[str] = None):
+        self.name = name
+        self.generation = generation  # rebuild id this instance was built by; None for the original files
+        self.index_path = index_path
+        self.meta_path = meta_path
+        self.legacy_meta_path = legacy_meta_path
+        base = os.path.splitext(index_path)[0]
+        self.wal_path = base + ".wal"
+        self.manifest_path = base + ".manifest.json"
+        self.vectors_path = base + ".vectors.f32"  # float32 vectors of a quantized collection
+        self.params = params
+        self._index = None
+        self._metadata = None  # MetadataStore: label -> ItemMetadata
+        self._filters = None  # AttributeBitsets, built from the metadata on the first filtered query
+        self._view: Optional[_View] = None  # published state for readers; None while not loaded
+        self._matrix = None  # (index, float32 buffer, rows filled): vectors copied out for exact search
+        self._version = 0  # bumped on every change to the index contents
+        self._saved_version = 0
+        self._wal = None  # WriteAheadLog, open while loaded
+        self._snapshot_count = 0  # items covered by the last snapshot
+        self._snapshot_at = time.monotonic()
+        self._lock = threading.Lock()  # serializes writers (add, resize, save, load)
+        self._rw = RWLock()  # searches read; resize_index writes
+        self._ef = ModeLock()  # searches share the index's ef; a search with another ef waits to set it
+
+    def ensure_ready(self):
         """Ensure the index is loaded and ready."""
-        if not cls._ready:
-            logger.warning("⚠️ Index not ready. Loading now...")
-            cls.load()
+        if self._view is None:
+            logger.warning(f"⚠️ Collection '{self.name}' not ready. Loading now...")
+            self.load()
 
-    @classmethod
-    def load(cls):
+    def load(self):
         """
         Load the HNSW index and metadata from disk.
         If not found, initialize an empty index.
         """
-        with cls._lock:
-            if cls._index is not None:
-                cls._ready = True
-                return
+        with self._lock:
+            self._load_locked()
 
-            cls._index = hnswlib.Index(space=cls.SPACE, dim=cls.DIM)
+    def _load_locked(self):
+        if self._index is not None:
+            self._publish_locked()
+            return
 
-            if os.path.exists(cls.INDEX_PATH) and os.path.exists(cls.META_PATH):
-                cls._index.load_index(cls.INDEX_PATH)
-                with open(cls.META_PATH, "r") as f:
-                    cls._image_paths = [line.strip() for line in f]
-                cls._index.set_ef(cls.EF_SEARCH)
-                logger.info(f"✅ Loaded HNSW index with {len(cls._image_paths)} items.")
-            else:
-                cls._index.init_index(
-                    max_elements=cls.MAX_ELEMENTS,
-                    ef_construction=cls.EF_CONSTRUCTION,
-                    M=cls.M
-                )
-                logger.info(
-                    f"🆕 Initialized new HNSW index with dim={cls.DIM}, ef_construction={cls.EF_CONSTRUCTION}, "
-                    f"M={cls.M}, max_elements={cls.MAX_ELEMENTS}"
-                )
+        p = self.params
+        index = self._new_index()
+        has_metadata = os.path.exists(self.meta_path) or (
+            self.legacy_meta_path is not None and os.path.exists(self.legacy_meta_path)
+        )
 
-            cls._ready = True
+        if os.path.exists(self.index_path) and has_metadata:
+            index.load_index(self.index_path)
+            metadata = MetadataStore(self.meta_path, legacy_path=self.legacy_meta_path)
+            count = index.get_current_count()
+            if len(metadata) > count:
+                # Metadata is saved before the index; drop rows from an interrupted save
+                logger.warning(f"⚠️ Dropping {len(metadata) - count} metadata rows not in the saved index")
+                metadata.truncate(count)
+            self._check_manifest(count)
+            logger.info(f"✅ Loaded collection '{self.name}' with {count} items.")
+        else:
+            metadata = MetadataStore(self.meta_path)
+            metadata.truncate(0)  # rows saved without an index are orphans
+            index.init_index(max_elements=p.max_elements, ef_construction=p.ef_construction, M=p.M)
+            logger.info(
+                f"🆕 Initialized collection '{self.name}' with dim={p.dim}, ef_construction={p.ef_construction}, "
+                f"M={p.M}, max_elements={p.max_elements}"
+            )
 
-    @classmethod
-    def is_ready(cls):
-        return cls._ready
+        index.set_ef(p.ef_search)
+        self._metadata = metadata
+        self._filters = None
+        self._index = index
+        self._version = next(_VERSIONS)
+        self._saved_version = self._version
+        self._snapshot_count = len(metadata)
+        self._snapshot_at = time.monotonic()
+        self._wal = WriteAheadLog(self.wal_path)
+        if self._replay_wal_locked():
+            self._save_locked()  # fold the replayed inserts into a snapshot and empty the log
+        self._publish_locked()
 
-    @classmethod
-    def query(cls, vector: np.ndarray, k: int=5):
+    def _new_index(self, read_only: bool = False):
+        p = self.params
+        if p.quantization == "none":
+            return hnswlib.Index(space=p.space, dim=p.dim)
+        return CompressedIndex(p.space, p.dim, self.vectors_path, quantization=p.quantization,
+                               pq_subvectors=p.pq_subvectors, rerank=p.rerank, read_only=read_only)
+
+    def _publish_locked(self):
+        """Make every completed insert visible to queries that start from now on."""
+        self._view = _View(self._index, self._metadata, len(self._metadata))
+
+    def _check_manifest(self, count: int):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("count") != count:
+            # The index was renamed into place but the manifest not yet rewritten; the log covers the gap
+            logger.warning(f"⚠️ Snapshot of '{self.name}' has {count} items, manifest says {manifest.get('count')}")
+
+    def _replay_wal_locked(self) -> int:
+        """Re-apply logged inserts past the snapshot; returns how many were replayed."""
+        replayed = 0
+        for start, vectors, items in self._wal.replay():
+            count = len(self._metadata)
+            end = start + len(items)
+            if end <= count:
+                continue  # already in the snapshot
+            if start > count:
+                logger.warning(f"⚠️ Gap in write-ahead log of '{self.name}' at label {count}; ignoring the rest")
+                break
+            vectors, items = vectors[count - start:], items[count - start:]
+            self._reserve_locked(end)
+            self._metadata.append(items)
+            self._index.add_items(vectors, np.arange(count, end), num_threads=self.ADD_THREADS)
+            replayed += len(items)
+        if replayed:
+            self._version = next(_VERSIONS)
+            logger.info(f"🔁 Replayed {replayed} items from the write-ahead log of '{self.name}'")
+        return replayed
+
+    def _maybe_snapshot_locked(self):
+        pending = len(self._metadata) - self._snapshot_count
+        if pending <= 0:
+            return
+        if (self.SNAPSHOT_EVERY_ITEMS and pending >= self.SNAPSHOT_EVERY_ITEMS) or (
+                self.SNAPSHOT_INTERVAL_S and time.monotonic() - self._snapshot_at >= self.SNAPSHOT_INTERVAL_S):
+            self._save_locked()
+
+    def unload(self, blocking: bool = True) -> bool:
+        """
+        Drop the in-memory index; refused while it has unsaved changes, or,
+        without `blocking`, while a writer (build, save, load) holds it.
         """
-        Perform a KNN search.
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            if self._index is None:
+                return True
+            if self.is_dirty():
+                return False
+            self._view = None
+            self._index = None
+            self._metadata = None
+            self._filters = None
+            self._matrix = None
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+            logger.info(f"📤 Unloaded collection '{self.name}'")
+            return True
+        finally:
+            self._lock.release()
+
+    def _resident(self) -> _View:
+        """The current view, loading the collection first if needed."""
+        while True:
+            view = self._view
+            if view is not None:
+                return view
+            self.ensure_ready()
+
+    def is_ready(self):
+        return self._view is not None
+
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def is_dirty(self) -> bool:
+        return self._version != self._saved_version
+
+    def version(self) -> int:
+        """Monotonic counter identifying the current index contents (for cache keys)."""
+        return self._version
+
+    def count(self) -> int:
+        view = self._view
+        return view.visible if view is not None else 0
+
+    def capacity(self) -> int:
+        index = self._index
+        return index.get_max_elements() if index is not None else 0
+
+    def _reserve_locked(self, needed: int, grow: bool = True):
+        """Resize so `needed` labels fit; with `grow`, by at least GROWTH_FACTOR. Caller holds `_lock`."""
+        capacity = self._index.get_max_elements()
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, int(capacity * self.GROWTH_FACTOR)) if grow else needed
+        # Searches hold the read side; they wait only for the reallocation itself
+        with self._rw.write():
+            self._index.resize_index(new_capacity)
+        logger.info(f"📈 Resized collection '{self.name}' from {capacity} to {new_capacity} elements")
+
+    def reserve(self, additional: int):
+        """Pre-size for `additional` more items (e.g. a dataset's row count) in one resize."""
+        with self._lock:
+            self._load_locked()
+            self._reserve_locked(len(self._metadata) + additional, grow=False)
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size: hnswlib's per-slot level-0 data plus filter bitsets."""
+        index, filters = self._index, self._filters
+        if index is None:
+            return 0
+        extra = (filters.memory_bytes() if filters is not None else 0) + self._matrix_bytes()
+        if isinstance(index, CompressedIndex):
+            return index.memory_bytes() + extra
+        p = self.params
+        per_element = 4 * p.dim + 8 * p.M + 64  # vector, level-0 links, label and bookkeeping
+        return index.get_max_elements() * per_element + extra
+
+    def _matrix_bytes(self) -> int:
+        matrix = self._matrix
+        return matrix[1].nbytes if matrix is not None else 0
+
+    def search_ef(self, quality: Optional[str] = None, ef: Optional[int] = None) -> int:
+        """
+        The ef set on the index for a search: the `quality` tier's multiple of
+        the collection's ef_search ("fast" = 1, "balanced" = ef_search,
+        "high" = 4x), or an explicit `ef` rounded up to a power of two. The
+        index searches max(ef, k) deep, so "fast" means ef = k and k never
+        changes the value, which is what keeps searches sharing one ef.
+        """
+        if ef is not None:
+            return 1 << (max(ef, 1) - 1).bit_length()
+        return max(1, self.QUALITY_EF_FACTORS.get(quality or "balanced", 1) * self.params.ef_search)
+
+    def query(self, vector: np.ndarray, k: int=5, search_filter: Optional[SearchFilter]=None,
+              exact: Optional[bool] = None, quality: Optional[str] = None, ef: Optional[int] = None):
+        """
+        Perform a KNN search, optionally restricted to items matching `search_filter`.
+        `exact=True` (or quality "exact") scans every vector (ground truth),
+        `False` always uses the index, None picks by size (EXACT_MAX_ITEMS).
+        `quality` / `ef` trade recall for latency, see `search_ef`.
         Returns a list of image paths and similarity scores.
         """
-        cls.ensure_ready()
+        view = self._resident()
+        exact = True if quality == "exact" else exact
+        ef = self.search_ef(quality, ef)
 
-        labels, distances = cls._index.knn_query(vector, k=k)
-        results = [cls._image_paths[i] for i in labels[0]]
-        scores = [1 - d for d in distances[0]]  # Convert cosine distance to similarity
+        with self._rw.read():
+            if search_filter is not None and not search_filter.is_empty():
+                labels, distances = self._filtered_knn(view, vector, k, search_filter, exact, ef)
+            else:
+                labels, distances = self._knn(view, np.asarray(vector, dtype=np.float32).reshape(1, -1), k, 1,
+                                              exact, ef)[0]
+        results = view.metadata.paths(labels)
+        scores = [1 - d for d in distances]  # Convert cosine distance to similarity
         logger.debug(f"🔍 Query returned {len(results)} results.")
         return results, scores
 
-    @classmethod
-    def add_items(cls, vectors: list[np.ndarray], paths: list[str]):
+    def _attribute_bitsets(self, metadata: MetadataStore) -> AttributeBitsets:
+        filters = self._filters
+        if filters is None:
+            with self._lock:
+                if self._filters is None:
+                    bitsets = AttributeBitsets()
+                    bitsets.extend(0, metadata.attributes())
+                    self._filters = bitsets
+                filters = self._filters
+        return filters
+
+    def _track_attributes(self, start_id: int, items: list[ItemMetadata]):
+        # Called after the vectors are in the index, so a mask never admits a missing label
+        if self._filters is not None:
+            self._filters.extend(start_id, [(i.dataset, i.split, i.class_label) for i in items])
+
+    def _using_ef(self, index, ef: Optional[int]):
+        """Context for searching `index` at `ef` (None: the collection's ef_search)."""
+        return self._ef.hold((index, ef or self.params.ef_search), lambda mode: index.set_ef(mode[1]))
+
+    def _knn(self, view: _View, vectors: np.ndarray, k: int, num_threads: int, exact: Optional[bool] = None,
+             ef: Optional[int] = None):
+        """
+        Top-k per query row among the labels visible in `view`, as a list of
+        (labels, distances). Raises hnswlib's RuntimeError if fewer than k
+        labels are visible.
+        """
+        index, _, visible = view
+        if exact or (exact is None and visible <= self.EXACT_MAX_ITEMS):
+            return list(zip(*self._exact_knn(view, vectors, k, num_threads)))
+        for _ in range(3):
+            in_flight = index.get_current_count() - visible  # labels of an insert that started after the view
+            try:
+                with self._using_ef(index, ef), KNN_SECONDS.time(collection=self.name, engine="hnsw"):
+                    labels, distances = index.knn_query(vectors, k=k + min(in_flight, self.IN_FLIGHT_DEPTH_MAX),
+                                                        num_threads=num_threads)
+            except RuntimeError:
+                if visible < k:
+                    raise
+                # Nodes of a concurrent insert were still being linked and the walk came up short; scan exactly
+                return list(zip(*self._exact_knn(view, vectors, k, num_threads)))
+            keep = labels < visible
+            if in_flight == 0 or keep.sum(axis=1).min() >= k:
+                break
+            # Another batch started while we searched and crowded out visible labels; search deeper
+        rows = [(row_labels[row_keep][:k], row_distances[row_keep][:k])
+                for row_labels, row_distances, row_keep in zip(labels, distances, keep)]
+        depth = min(k, visible)
+        short = np.flatnonzero(keep.sum(axis=1) < depth)
+        if len(short):
+            # An insert larger than IN_FLIGHT_DEPTH_MAX crowded these rows out; scan them exactly in one batch
+            for row, result in zip(short, zip(*self._exact_knn(view, vectors[short], depth, num_threads))):
+                rows[row] = result
+        return rows
+
+    def _filtered_knn(self, view: _View, vector: np.ndarray, k: int, search_filter: SearchFilter,
+                      exact: Optional[bool] = None, ef: Optional[int] = None):
+        """
+        Top-k among labels matching the filter. Selective filters are scanned
+        exactly; broad ones use hnswlib's filtered search, which skips
+        non-matching labels during graph traversal.
+        """
+        index = view.index
+        mask = self._attribute_bitsets(view.metadata).mask(search_filter)[:view.visible]
+        matches = np.flatnonzero(mask)
+        k = min(k, len(matches))
+        if k == 0:
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.float32)
+        if exact or len(matches) <= self.FILTER_EXACT_MAX:
+            labels, distances = self._exact_knn(view, vector, k, num_threads=1, labels=matches)
+            return labels[0], distances[0]
+
+        size = len(mask)
+        try:
+            with self._using_ef(index, ef), KNN_SECONDS.time(collection=self.name, engine="filtered"):
+                labels, distances = index.knn_query(vector, k=k, num_threads=1,
+                                                    filter=lambda label: label < size and mask[label])
+        except RuntimeError:
+            # The filtered graph walk found fewer than k matches; fall back to a blocked scan of the matches
+            labels, distances = self._exact_knn(view, vector, k, num_threads=1, labels=matches)
+        return labels[0], distances[0]
+
+    def _exact_knn(self, view: _View, vectors: np.ndarray, k: int, num_threads: int,
+                   labels: Optional[np.ndarray] = None):
+        """
+        Brute-force top-k of each query row over the view's vectors (or only
+        the rows `labels` of them), with the same distance as the index space.
+        Vectors come from `_exact_vectors`, so large views are read in blocks
+        rather than copied whole.
+        """
+        base = self._exact_vectors(view)
+        if labels is not None:
+            base = SelectedRows(base, labels)
+        with KNN_SECONDS.time(collection=self.name, engine="exact"):
+            top, distances = exact_knn(base, vectors, k, self.params.space, num_threads)
+        if labels is not None:
+            top = labels[top.astype(np.int64)]
+        return top, distances
+
+    def _exact_vectors(self, view: _View):
+        """
+        The view's vectors for an exact scan: a float32 copy for collections
+        within EXACT_MAX_ITEMS (extended as they grow, dropped on unload),
+        otherwise read from the index block by block.
+        """
+        index, _, visible = view
+        if visible > self.EXACT_MAX_ITEMS:
+            return IndexRows(index, visible, self.params.dim)
+        matrix = self._matrix
+        if matrix is None or matrix[0] is not index:
+            matrix = (index, np.empty((0, self.params.dim), dtype=np.float32), 0)
+        _, buffer, rows = matrix
+        if rows < visible:
+            # Rows are only appended past what any published view covers, so concurrent scans stay valid
+            if visible > len(buffer):
+                grown = np.empty((max(visible, 2 * len(buffer)), self.params.dim), dtype=np.float32)
+                grown[:rows] = buffer[:rows]
+                buffer = grown
+            buffer[rows:visible] = index.get_items(np.arange(rows, visible), return_type="numpy")
+            self._matrix = (index, buffer, visible)
+        return buffer[:visible]
+
+    def query_batch(self, vectors: np.ndarray, ks: list[int], exact: Optional[bool] = None,
+                    quality: Optional[str] = None, ef: Optional[int] = None):
+        """
+        Run one vectorized, multi-threaded KNN search for a (N, D) query matrix.
+
+        Each query i gets its own top-`ks[i]`; the index is searched once at
+        max(ks) and the rows are truncated.
+
+        Returns:
+            list of (image paths, similarity scores) tuples, one per query.
+        """
+        view = self._resident()
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ks), -1)
+        with self._rw.read():
+            rows = self._knn(view, vectors, max(ks), self.QUERY_THREADS, True if quality == "exact" else exact,
+                             self.search_ef(quality, ef))
+        out = []
+        for (row_labels, row_distances), k in zip(rows, ks):
+            out.append((view.metadata.paths(row_labels[:k]), [1 - d for d in row_distances[:k]]))
+        logger.debug(f"🔍 Batch query of {len(ks)} returned top-{max(ks)}.")
+        return out
+
+    def add_items(self, vectors: list[np.ndarray], paths: list[str]):
         """
         Add new image vectors to the index.
         After indexing, deletes image files and frees memory.
         """
         import gc
 
-        with cls._lock:
+        with self._lock:
 
-            cls.ensure_ready()
-            cls._ready = False
-            start_id = len(cls._image_paths)
+            self._load_locked()
+            start_id = len(self._metadata)
             flat_vectors = np.vstack(vectors).astype(np.float32)  # Ensures shape=(N, D)
-            cls._index.add_items(np.array(flat_vectors), list(range(start_id, start_id + len(flat_vectors))))
-            cls._image_paths.extend(paths)
-            logger.info(f"➕ Added {len(paths)} items to index. Total: {len(cls._image_paths)}")
+            items = [ItemMetadata(path=p) for p in paths]
+            self._wal.append(start_id, flat_vectors, items)
+            self._reserve_locked(start_id + len(flat_vectors))
+            self._index.add_items(np.array(flat_vectors), list(range(start_id, start_id + len(flat_vectors))))
+            self._metadata.append(items)
+            self._track_attributes(start_id, items)
+            self._version = next(_VERSIONS)
+            self._publish_locked()
+            logger.info(f"➕ Added {len(paths)} items to index. Total: {len(self._metadata)}")
+            self._maybe_snapshot_locked()
 
         # 🔥 Clean up memory and delete images from disk
         for p in paths:
             try:
                 os.remove(p)
-                logger.debug(f"🧹 Deleted image: {p}")
+                logger.debug("🧹 Deleted image: %s", p)
             except Exception as e:
                 logger.warning(f"⚠️ Could not delete image {p}: {e}")
 
@@ -111,19 +565,485 @@ class HNSWIndexSingleton:
         del vectors
         del paths
         gc.collect()
-        cls._ready = True
+
+    def add_batch(self, vectors: np.ndarray, ids: list):
+        """
+        Bulk-insert a (N, D) float32 matrix with one id per row: an image path
+        or a full `ItemMetadata`.
+
+        Uses hnswlib's multi-threaded insertion and holds the lock once for the
+        whole batch; no garbage collection is forced. Queries keep running
+        during the insert and see the whole batch once it is published.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(f"Expected a (N, D) matrix with one id per row, got {vectors.shape} for {len(ids)} ids")
+        if vectors.shape[0] == 0:
+            return
+
+        items = [i if isinstance(i, ItemMetadata) else ItemMetadata(path=i) for i in ids]
+        with self._lock:
+            self._load_locked()
+            start_id = len(self._metadata)
+            self._wal.append(start_id, vectors, items)
+            self._reserve_locked(start_id + len(ids))
+            self._metadata.append(items)
+            labels = np.arange(start_id, start_id + len(ids))
+            self._index.add_items(vectors, labels, num_threads=self.ADD_THREADS)
+            self._track_attributes(start_id, items)
+            self._version = next(_VERSIONS)
+            self._publish_locked()
+            self._maybe_snapshot_locked()
+
+        logger.debug(f"➕ Added {len(ids)} items to '{self.name}'. Total: {start_id + len(ids)}")
+
+    def get_metadata(self, labels) -> list[ItemMetadata]:
+        """Stored metadata for each HNSW label, in order."""
+        return self._resident().metadata.get_many(labels)
+
+    def warm_up(self, queries: Optional[int] = None):
+        """Load the index and run searches for a sample of its own vectors to fault its pages in."""
+        index, _, count = self._resident()
+        queries = min(self.WARMUP_QUERIES if queries is None else queries, count)
+        if queries <= 0:
+            return
+        labels = np.random.default_rng().choice(count, size=queries, replace=False)
+        vectors = np.asarray(index.get_items(labels, return_type="numpy"), dtype=np.float32)
+        with self._rw.read(), self._using_ef(index, None):
+            try:
+                index.knn_query(vectors, k=min(10, count), num_threads=self.QUERY_THREADS)
+            except RuntimeError:
+                pass  # a short result is irrelevant here, the pages were still touched
+        logger.info(f"🔥 Warmed up collection '{self.name}' with {queries} queries")
+
+    def indexed_rows(self, dataset: str, split: str, since: int = 0) -> set[int]:
+        return self._resident().metadata.rows(dataset, split, since)
+
+    def save(self):
+        """Write a snapshot of the collection and empty its write-ahead log."""
+        with self._lock:
+            self._load_locked()
+            self._save_locked()
+
+    def _save_locked(self):
+        # 🔧 Ensure the directory exists
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+
+        # Metadata first: rows beyond the saved index are dropped on load
+        self._metadata.flush()
+        count = len(self._metadata)
+        tmp_path = self.index_path + ".tmp"
+        self._index.save_index(tmp_path)
+        _fsync_path(tmp_path)
+        os.replace(tmp_path, self.index_path)  # readers of the file see the old or the new snapshot, never half
+
+        manifest = {"index": os.path.basename(self.index_path), "metadata": os.path.basename(self.meta_path),
+                    "count": count, "version": self._version, "params": asdict(self.params),
+                    "saved_at": time.time()}
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        _fsync_path(self.manifest_path + ".tmp")
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+        # Only now is every logged insert covered by the snapshot
+        self._wal.reset()
+        self._saved_version = self._version
+        self._snapshot_count = count
+        self._snapshot_at = time.monotonic()
+
+        logger.info(f"💾 Saved collection '{self.name}' ({count} items) to '{self.index_path}' "
+                    f"and metadata to '{self.meta_path}'")
+
+
+class MappedHNSWIndex(HNSWIndex):
+    """
+    Read-only collection served from the writer's snapshot files, for
+    HNSW_STORAGE=mmap.
+
+    The graph is memory-mapped (`MappedGraph`) and the metadata is read
+    through SQLite's mmap I/O, so any number of worker processes searching
+    the same collection share one copy in the page cache. At most every
+    REFRESH_INTERVAL_S a query checks whether the writer replaced the
+    snapshot and, if so, maps the new one; in-flight queries finish on the
+    old mapping. Inserts a writer has not snapshotted yet are not visible.
+    """
+
+    REFRESH_INTERVAL_S = float(os.getenv("HNSW_MMAP_REFRESH_S", "1.0"))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checked_at = 0.0
+
+    def _load_locked(self):
+        signature = file_signature(self.index_path)
+        if self._index is not None and self._index.signature == signature:
+            self._publish_locked()
+            return
+        if signature is None or not os.path.exists(self.meta_path):
+            return  # nothing published yet; stays not ready
+
+        if self.params.quantization == "none":
+            graph = MappedGraph(self.index_path, self.params.space, self.params.dim)
+        else:
+            graph = self._new_index(read_only=True)  # codes are read into memory, vectors stay mapped
+            graph.load_index(self.index_path)
+        graph.set_ef(self.params.ef_search)
+        metadata = MetadataStore(self.meta_path, read_only=True)  # opened after the graph: covers all its labels
+        self._index, self._metadata, self._filters = graph, metadata, None
+        self._version = next(_VERSIONS)
+        self._saved_version = self._version
+        self._publish_locked()
+        logger.info(f"🗺️ Mapped collection '{self.name}' with {graph.get_current_count()} items from '{self.index_path}'")
+
+    def _publish_locked(self):
+        # The writer flushes metadata before the index, so rows past the graph may exist; they are not visible
+        self._view = _View(self._index, self._metadata, self._index.get_current_count())
+
+    def _resident(self) -> _View:
+        now = time.monotonic()
+        if self._view is None or now - self._checked_at >= self.REFRESH_INTERVAL_S:
+            self._checked_at = now
+            index = self._index
+            if index is None or file_signature(self.index_path) != index.signature:
+                with self._lock:
+                    self._load_locked()
+        view = self._view
+        if view is None:
+            raise RuntimeError(f"Collection '{self.name}' has no snapshot at '{self.index_path}' yet")
+        return view
+
+    def memory_bytes(self) -> int:
+        index, filters = self._index, self._filters
+        if index is None:
+            return 0
+        return index.memory_bytes() + (filters.memory_bytes() if filters is not None else 0) + self._matrix_bytes()
+
+    def _read_only(self, *args, **kwargs):
+        raise RuntimeError(f"Collection '{self.name}' is served read-only (HNSW_STORAGE=mmap); "
+                           f"build it from a process with HNSW_STORAGE=memory")
+
+    add_items = add_batch = reserve = save = _read_only
+
+
+class HNSWIndexSingleton:
+    """
+    Process-wide registry of named index collections.
+
+    Every method takes a `collection` name: "default" is stored at
+    INDEX_PATH / META_PATH, others under COLLECTIONS_DIR/<name>/. Collections
+    load on first use; when the loaded ones exceed HNSW_MEMORY_BUDGET_MB, the
+    least recently used ones without unsaved changes are unloaded.
+
+    A rebuild writes a new generation under `<collection dir>/generations/<id>/`
+    (`stage`) while the live one keeps serving, then `promote` swaps the
+    registry entry in one assignment and records it in `active.json`. Queries
+    already holding the old instance finish on it; it is freed when the last
+    of them drops its reference. The previous generation is kept on disk so
+    `rollback` can swap back; the one before it is deleted. Generations that
+    were never promoted (a rebuild stopped or failed midway) are left alone,
+    since their job resumes into them.
+    """
+
+    _collections: dict = {}
+    _lru: OrderedDict = OrderedDict()  # loaded collection names, least recently used first
+    _registry_lock = threading.RLock()
+
+    # File paths
+    INDEX_PATH = "data/index/image_index.bin"
+    META_PATH = "data/index/metadata.sqlite3"
+    LEGACY_META_PATH = "data/index/image_paths.txt"  # imported once into META_PATH
+    COLLECTIONS_DIR = "data/index/collections"
+
+    # Configurable HNSW index settings from env (defaults for new collections)
+    DIM = int(os.getenv("HNSW_DIM"))
+    MAX_ELEMENTS = int(os.getenv("HNSW_MAX_ELEMENTS"))
+    SPACE = os.getenv("HNSW_SPACE", "cosine")
+    EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION"))
+    M = int(os.getenv("HNSW_M"))
+    EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH"))
+    MEMORY_BUDGET_MB = float(os.getenv("HNSW_MEMORY_BUDGET_MB", "0"))  # 0 = unlimited
+    # "memory": load into this process, read-write. "mmap": map the snapshots read-only, shared across
+    # processes; searches then run in numpy instead of hnswlib, several times slower (see README)
+    STORAGE = os.getenv("HNSW_STORAGE", "memory")
+    QUANTIZATION = os.getenv("HNSW_QUANTIZATION", "none")  # none | sq8 | pq
+    PQ_SUBVECTORS = int(os.getenv("HNSW_PQ_SUBVECTORS", "64"))
+    RERANK = os.getenv("HNSW_RERANK", "1") == "1"
+    GENERATION_CHECK_S = 1.0  # how often mmap readers look for a generation promoted by the writer
+    _generation_checked: dict = {}
+
+    @classmethod
+    def default_params(cls) -> IndexParams:
+        return IndexParams(dim=cls.DIM, space=cls.SPACE, M=cls.M, ef_construction=cls.EF_CONSTRUCTION,
+                           ef_search=cls.EF_SEARCH, max_elements=cls.MAX_ELEMENTS,
+                           quantization=cls.QUANTIZATION, pq_subvectors=cls.PQ_SUBVECTORS, rerank=cls.RERANK)
 
     @classmethod
-    def save(cls):
-        with cls._lock:
-            cls.ensure_ready()
-            
-            # 🔧 Ensure the directory exists
-            os.makedirs(os.path.dirname(cls.INDEX_PATH), exist_ok=True)
+    def _params_path(cls, name: str) -> str:
+        if name == DEFAULT_COLLECTION:
+            return os.path.join(os.path.dirname(cls.INDEX_PATH), "collection.json")
+        return os.path.join(cls.COLLECTIONS_DIR, name, "collection.json")
 
-            cls._index.save_index(cls.INDEX_PATH)
-            with open(cls.META_PATH, "w") as f:
-                for path in cls._image_paths:
-                    f.write(path + "\n")
+    @classmethod
+    def _base_dir(cls, name: str) -> str:
+        if name == DEFAULT_COLLECTION:
+            return os.path.dirname(cls.INDEX_PATH)
+        return os.path.join(cls.COLLECTIONS_DIR, name)
+
+    @classmethod
+    def _generation_dir(cls, name: str, generation: str) -> str:
+        return os.path.join(cls._base_dir(name), "generations", generation)
 
-            logger.info(f"💾 Saved index to '{cls.INDEX_PATH}' and metadata to '{cls.META_PATH}'")
+    @classmethod
+    def _active(cls, name: str) -> dict:
+        """{"generation": live id or None for the original files, "previous": ...} once a rebuild was promoted."""
+        path = os.path.join(cls._base_dir(name), "active.json")
+        if not os.path.exists(path):
+            return {"generation": None}
+        with open(path) as f:
+            return json.load(f)
+
+    @classmethod
+    def _open(cls, name: str, generation: Optional[str], params: IndexParams) -> HNSWIndex:
+        kind = MappedHNSWIndex if cls.STORAGE == "mmap" else HNSWIndex
+        if generation is not None:
+            directory = cls._generation_dir(name, generation)
+            return kind(name, os.path.join(directory, "image_index.bin"),
+                        os.path.join(directory, "metadata.sqlite3"), params, generation=generation)
+        if name == DEFAULT_COLLECTION:
+            return kind(name, cls.INDEX_PATH, cls.META_PATH, params, legacy_meta_path=cls.LEGACY_META_PATH)
+        directory = cls._base_dir(name)
+        return kind(name, os.path.join(directory, "image_index.bin"),
+                    os.path.join(directory, "metadata.sqlite3"), params)
+
+    @classmethod
+    def _follow_generation(cls, name: str):
+        """mmap readers: switch to the generation the writer promoted, if it changed."""
+        now = time.monotonic()
+        if now - cls._generation_checked.get(name, 0.0) < cls.GENERATION_CHECK_S:
+            return
+        cls._generation_checked[name] = now
+        index = cls._collections.get(name)
+        generation = cls._active(name)["generation"]
+        if index is None or index.generation == generation:
+            return
+        with cls._registry_lock:
+            cls._collections.pop(name, None)
+            cls.collection(name)
+        logger.info(f"🔀 Following collection '{name}' to generation {generation}")
+
+    @classmethod
+    def exists(cls, name: str = DEFAULT_COLLECTION) -> bool:
+        return name == DEFAULT_COLLECTION or name in cls._collections or os.path.exists(cls._params_path(name))
+
+    @classmethod
+    def collection(cls, name: str = DEFAULT_COLLECTION, create: bool = False, **overrides) -> HNSWIndex:
+        """
+        The `HNSWIndex` for a collection. With `create=True` a missing
+        collection is created with the default params updated by `overrides`
+        (e.g. M=32); existing collections keep the params they were created with.
+        """
+        if not re.match(COLLECTION_NAME_PATTERN, name):
+            raise ValueError(f"Invalid collection name '{name}'")
+        with cls._registry_lock:
+            index = cls._collections.get(name)
+            if index is not None:
+                return index
+            if not create and not cls.exists(name):
+                raise CollectionNotFound(name)
+
+            generation = cls._active(name)["generation"]
+            params_path = cls._params_path(name)
+            if generation is not None:
+                params_path = os.path.join(cls._generation_dir(name, generation), "collection.json")
+            params = IndexParams.read(params_path)
+            if params is None:
+                params = replace(cls.default_params(), **{k: v for k, v in overrides.items() if v is not None})
+                if name != DEFAULT_COLLECTION:
+                    params.write(params_path)
+            index = cls._open(name, generation, params)
+            cls._collections[name] = index
+            return index
+
+    @classmethod
+    def stage(cls, name: str, generation: str, **overrides) -> HNSWIndex:
+        """
+        An unregistered `HNSWIndex` for a new generation of a collection, to be
+        filled and then `promote`d. Reopening the same `generation` resumes it.
+        New generations inherit the live params updated by `overrides`.
+        """
+        if not re.match(COLLECTION_NAME_PATTERN, generation):
+            raise ValueError(f"Invalid generation id '{generation}'")
+        live = cls.collection(name, create=True)
+        if live.generation == generation:
+            return live  # already promoted (e.g. a resumed job that finished before a crash)
+        params_path = os.path.join(cls._generation_dir(name, generation), "collection.json")
+        params = IndexParams.read(params_path)
+        if params is None:
+            params = replace(live.params, **{k: v for k, v in overrides.items() if v is not None})
+            params.write(params_path)
+        return cls._open(name, generation, params)
+
+    @classmethod
+    def promote(cls, name: str, staged: HNSWIndex):
+        """Snapshot and warm up `staged`, then make it the live generation of `name`."""
+        live = cls.collection(name)
+        if staged is live or staged.generation == live.generation:
+            # A resumed job whose generation was already promoted: the pointer and rollback target stay
+            logger.info(f"🔀 Collection '{name}' already serves generation {staged.generation}")
+            return
+        staged.save()
+        staged.warm_up()
+        with cls._registry_lock:
+            live = cls.collection(name)
+            if live.is_dirty():
+                live.save()  # keep what was written meanwhile, for a rollback
+            displaced = cls._active(name).get("previous")  # no longer reachable by rollback after this swap
+            pointer = {"generation": staged.generation, "previous": live.generation}
+            path = os.path.join(cls._base_dir(name), "active.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(pointer, f)
+            os.replace(path + ".tmp", path)
+            cls._collections[name] = staged
+            cls._lru[name] = None
+            cls._lru.move_to_end(name)
+        if displaced is not None and displaced not in (staged.generation, live.generation):
+            cls._remove_generation(name, displaced)
+        logger.info(f"🔀 Collection '{name}' now serves generation {staged.generation} "
+                    f"(previous: {live.generation}, {staged.count()} items)")
+
+    @classmethod
+    def rollback(cls, name: str) -> HNSWIndex:
+        """Swap `name` back to the generation it served before the last promote."""
+        active = cls._active(name)
+        if "previous" not in active:
+            raise ValueError(f"Collection '{name}' has no previous generation")
+        previous = active["previous"]
+        params_path = cls._params_path(name)
+        if previous is not None:
+            params_path = os.path.join(cls._generation_dir(name, previous), "collection.json")
+        params = IndexParams.read(params_path) or cls.default_params()
+        index = cls._open(name, previous, params)
+        cls.promote(name, index)
+        return index
+
+    @classmethod
+    def _remove_generation(cls, name: str, generation: str):
+        shutil.rmtree(cls._generation_dir(name, generation), ignore_errors=True)
+        logger.info(f"🗑️ Removed old generation {generation} of '{name}'")
+
+    @classmethod
+    def list_collections(cls) -> list[HNSWIndex]:
+        names = {DEFAULT_COLLECTION, *cls._collections}
+        if os.path.isdir(cls.COLLECTIONS_DIR):
+            names.update(n for n in os.listdir(cls.COLLECTIONS_DIR) if cls.exists(n))
+        return [cls.collection(n) for n in sorted(names)]
+
+    @classmethod
+    def _use(cls, name: str) -> HNSWIndex:
+        """Resolve a collection, load it if needed and mark it most recently used."""
+        if cls.STORAGE == "mmap":
+            cls._follow_generation(name)
+        index = cls.collection(name)
+        index.ensure_ready()
+        with cls._registry_lock:
+            cls._lru[name] = None
+            cls._lru.move_to_end(name)
+        cls._enforce_budget(keep=name)
+        return index
+
+    @classmethod
+    def _enforce_budget(cls, keep: str):
+        if cls.MEMORY_BUDGET_MB <= 0:
+            return
+        budget = cls.MEMORY_BUDGET_MB * 1024 * 1024
+        with cls._registry_lock:
+            loaded = [cls._collections[n] for n in cls._lru if n in cls._collections]
+        # Unload outside the registry lock, skipping collections a writer is busy with, so
+        # searches of other collections never queue behind a build or save
+        total = sum(index.memory_bytes() for index in loaded)
+        for index in loaded:
+            if total <= budget:
+                break
+            if index.name == keep or index.is_dirty():
+                continue
+            size = index.memory_bytes()
+            if not index.unload(blocking=False):
+                continue
+            total -= size
+            with cls._registry_lock:
+                if cls._collections.get(index.name) is index and not index.is_loaded():
+                    cls._lru.pop(index.name, None)
+
+    @classmethod
+    def unload(cls, collection: str = DEFAULT_COLLECTION) -> bool:
+        """Unload a collection from memory; False if it has unsaved changes."""
+        with cls._registry_lock:
+            index = cls._collections.get(collection)
+            if index is not None and not index.unload():
+                return False
+            cls._lru.pop(collection, None)
+            return True
+
+    @classmethod
+    def reset(cls):
+        """Forget every collection instance (unsaved changes are discarded)."""
+        with cls._registry_lock:
+            cls._collections = {}
+            cls._lru = OrderedDict()
+            cls._generation_checked = {}
+
+    # ── Per-collection operations ───────────────────────────────────
+
+    @classmethod
+    def ensure_ready(cls, collection: str = DEFAULT_COLLECTION):
+        """Ensure the collection is loaded and ready."""
+        cls._use(collection)
+
+    @classmethod
+    def load(cls, collection: str = DEFAULT_COLLECTION):
+        cls._use(collection)
+
+    @classmethod
+    def is_ready(cls, collection: str = DEFAULT_COLLECTION) -> bool:
+        index = cls._collections.get(collection)
+        return index is not None and index.is_ready()
+
+    @classmethod
+    def version(cls, collection: str = DEFAULT_COLLECTION) -> int:
+        index = cls._collections.get(collection)
+        return index.version() if index is not None else 0
+
+    @classmethod
+    def query(cls, vector: np.ndarray, k: int=5, search_filter: Optional[SearchFilter]=None,
+              collection: str = DEFAULT_COLLECTION, exact: Optional[bool] = None, quality: Optional[str] = None,
+              ef: Optional[int] = None):
+        return cls._use(collection).query(vector, k, search_filter, exact, quality, ef)
+
+    @classmethod
+    def query_batch(cls, vectors: np.ndarray, ks: list[int], collection: str = DEFAULT_COLLECTION,
+                    exact: Optional[bool] = None, quality: Optional[str] = None, ef: Optional[int] = None):
+        return cls._use(collection).query_batch(vectors, ks, exact, quality, ef)
+
+    @classmethod
+    def reserve(cls, additional: int, collection: str = DEFAULT_COLLECTION):
+        cls._use(collection).reserve(additional)
+
+    @classmethod
+    def add_items(cls, vectors: list[np.ndarray], paths: list[str], collection: str = DEFAULT_COLLECTION):
+        cls._use(collection).add_items(vectors, paths)
+
+    @classmethod
+    def add_batch(cls, vectors: np.ndarray, ids: list, collection: str = DEFAULT_COLLECTION):
+        cls._use(collection).add_batch(vectors, ids)
+
+    @classmethod
+    def get_metadata(cls, labels, collection: str = DEFAULT_COLLECTION) -> list[ItemMetadata]:
+        return cls._use(collection).get_metadata(labels)
+
+    @classmethod
+    def indexed_rows(cls, dataset: str, split: str, since: int = 0, collection: str = DEFAULT_COLLECTION) -> set[int]:
+        return cls._use(collection).indexed_rows(dataset, split, since)
+
+    @classmethod
+    def save(cls, collection: str = DEFAULT_COLLECTION):
+        cls._use(collection).save()
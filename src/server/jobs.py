@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from contextlib import closing
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS build_jobs (
+    id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    checkpoint_offset INTEGER NOT NULL DEFAULT 0,
+    checkpoint_embedded INTEGER NOT NULL DEFAULT 0,
+    checkpoint_failed INTEGER NOT NULL DEFAULT 0,
+    seen INTEGER NOT NULL DEFAULT 0,
+    embedded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    throughput REAL,
+    eta_s REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+)
+"""
+
+
+class BuildJobStore:
+    """
+    Durable queue of index build jobs, backed by a SQLite file.
+
+    Each job records its request parameters, live progress counters and the
+    last checkpointed dataset offset, so it can be resumed after a restart.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def create(self, params: dict) -> dict:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO build_jobs (id, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(params), QUEUED, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM build_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit: int = 50) -> list[dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM build_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE build_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def claim_next(self) -> Optional[dict]:
+        """Atomically move the oldest queued job to running and return it."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM build_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE build_jobs SET status = ?, updated_at = ? WHERE id = ?",
+                         (RUNNING, time.time(), row["id"]))
+        return self.get(row["id"])
+
+    def requeue(self, job_id: str):
+        """Queue a job again; it resumes from its last checkpoint."""
+        job = self.get(job_id)
+        self.update(job_id, status=QUEUED, cancel_requested=0, error=None, finished_at=None,
+                    seen=job["checkpoint_offset"], embedded=job["checkpoint_embedded"],
+                    failed=job["checkpoint_failed"])
+
+    def requeue_interrupted(self) -> int:
+        """Requeue jobs that were running when the process died."""
+        with closing(self._connect()) as conn:
+            ids = [r["id"] for r in conn.execute("SELECT id FROM build_jobs WHERE status = ?", (RUNNING,))]
+        for job_id in ids:
+            self.requeue(job_id)
+        return len(ids)
+
+
+class BuildJobManager:
+    """
+    Runs index build jobs one at a time on a background thread.
+
+    Builds mutate the shared index, so jobs are serialized. Progress is written
+    to the store while a job runs; the dataset offset is checkpointed only after
+    the index has been saved, so a resumed job never skips unindexed records.
+    """
+
+    def __init__(self, store_path: str, build_fn: Callable, progress_interval_s: float = 1.0,
+                 run_worker: bool = True):
+        self.store_path = store_path
+        self.build_fn = build_fn
+        self.progress_interval_s = progress_interval_s
+        self.run_worker = run_worker  # False: only queue jobs, for another process to run
+        self._store: Optional[BuildJobStore] = None
+        self._wakeup = threading.Event()
+        self._stop_events: dict[str, threading.Event] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> BuildJobStore:
+        if self._store is None:
+            self._store = BuildJobStore(self.store_path)
+        return self._store
+
+    def start(self):
+        """Start the worker thread (idempotent); interrupted jobs are resumed."""
+        if not self.run_worker:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._shutdown = False
+            resumed = self.store.requeue_interrupted()
+            if resumed:
+                logger.info(f"🔁 Resuming {resumed} interrupted build job(s)")
+            self._thread = threading.Thread(target=self._worker, name="index-build-jobs", daemon=True)
+            self._thread.start()
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Stop the running job at its next record and wait for the worker to exit."""
+        self._shutdown = True
+        for event in list(self._stop_events.values()):
+            event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, params: dict) -> dict:
+        job = self.store.create(params)
+        logger.info(f"🗂️ Queued build job {job['id']} for {params.get('dataset_repo')}")
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def list(self) -> list[dict]:
+        return self.store.list()
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATES:
+            return job
+        if job["status"] == QUEUED:
+            self.store.update(job_id, status=CANCELLED, cancel_requested=1, finished_at=time.time())
+        else:
+            self.store.update(job_id, cancel_requested=1)
+            event = self._stop_events.get(job_id)
+            if event is not None:
+                event.set()
+        return self.store.get(job_id)
+
+    def resume(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] not in (FAILED, CANCELLED):
+            return job
+        self.store.requeue(job_id)
+        self.start()
+        self._wakeup.set()
+        return self.store.get(job_id)
+
+    # ── Worker ──────────────────────────────────────────────────────
+
+    def _worker(self):
+        while not self._shutdown:
+            job = self.store.claim_next()
+            if job is None:
+                self._wakeup.wait(timeout=5)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: dict):
+        job_id, params = job["id"], job["params"]
+        stop_event = threading.Event()
+        self._stop_events[job_id] = stop_event
+
+        base_embedded, base_failed = job["checkpoint_embedded"], job["checkpoint_failed"]
+        start_offset = job["checkpoint_offset"]
+        started, last_report = time.monotonic(), 0.0
+
+        def counters(stats) -> dict:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            rate = (stats.offset - start_offset) / elapsed
+            remaining = stats.total - stats.offset if stats.total is not None else None
+            return dict(
+                seen=start_offset + stats.seen,
+                embedded=base_embedded + stats.embedded,
+                failed=base_failed + stats.failed,
+                total=stats.total,
+                throughput=stats.embedded / elapsed,
+                eta_s=remaining / rate if remaining is not None and rate > 0 else None,
+            )
+
+        def on_progress(stats):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval_s:
+                last_report = now
+                self.store.update(job_id, **counters(stats))
+
+        def on_checkpoint(stats):
+            self.store.update(job_id, checkpoint_offset=stats.offset,
+                              checkpoint_embedded=base_embedded + stats.embedded,
+                              checkpoint_failed=base_failed + stats.failed, **counters(stats))
+
+        logger.info(f"🏗️ Running build job {job_id} from offset {start_offset}")
+        try:
+            stats = self.build_fn(
+                params["dataset_repo"], params["split"], params["image_column"],
+                label_column=params.get("label_column", "label"),
+                collection=params.get("collection", "default"),
+                index_params={k: params.get(k) for k in ("M", "ef_construction", "ef_search", "quantization")},
+                rebuild=job_id if params.get("rebuild") else None,
+                batch_size=params["batch_size"], max_wait_s=params["max_wait_ms"] / 1000.0,
+                start_offset=start_offset, stop_event=stop_event,
+                on_progress=on_progress, on_checkpoint=on_checkpoint,
+            )
+        except Exception as e:
+            logger.error(f"❌ Build job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            return
+        finally:
+            self._stop_events.pop(job_id, None)
+
+        if stop_event.is_set():
+            # Either cancelled through the API or interrupted by shutdown (resumed on next start)
+            if self.store.get(job_id)["cancel_requested"]:
+                self.store.update(job_id, status=CANCELLED, finished_at=time.time(), **counters(stats))
+                logger.info(f"🛑 Build job {job_id} cancelled at offset {stats.offset}")
+            return
+
+        final = counters(stats)
+        final["eta_s"] = 0.0
+        self.store.update(job_id, status=COMPLETED, finished_at=time.time(), **final)
+        logger.info(f"✅ Build job {job_id} completed: {stats.embedded} embedded, {stats.failed} failed")
@@ -1,10 +1,26 @@
+import os
+import time
 import logging
-from fastapi import FastAPI, HTTPException, Query
-from server.index_store import HNSWIndexSingleton
-from server.sage_maker import CLIPSageMakerClient
-from server.models.search import SearchResponse, SearchResult
+import numpy as np
+from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Path, Query, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from server.index_store import HNSWIndexSingleton, DEFAULT_COLLECTION, COLLECTION_NAME_PATTERN, QUALITY_PATTERN
+from server.filters import SearchFilter
+from server.encoders import ENCODER_BACKEND, get_encoder, close_encoder, check_local_inference_path
+from server.coalescer import TextEncodeCoalescer
+from server.jobs import BuildJobManager
+from server.cache import query_embedding_cache, search_result_cache, normalize_query
+from server.models.search import SearchResponse, SearchResult, SearchBatchRequest, SearchBatchResponse
 from server.models.status import StatusResponse
 from server.models.requests import IndexBuildRequest
+from server.models.jobs import BuildJobStatus, BuildJobList
+from server.models.cache import CacheStatsResponse
+from server.models.collections import CollectionInfo, CollectionList
+from server.metrics import (REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_ERRORS, SERIALIZE_SECONDS,
+                            INDEX_ITEMS, INDEX_CAPACITY, INDEX_MEMORY_BYTES, timed_encode)
 from scripts.build_index import build_index
 
 # Configure root logger to output to console
@@ -12,58 +28,203 @@ logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger("server")
 
+# Background index builds, persisted so they survive restarts. Processes serving mmap'd
+# snapshots are read-only: they only queue jobs for the writer process to run.
+build_jobs = BuildJobManager(os.getenv("BUILD_JOBS_DB", "data/jobs/build_jobs.sqlite3"), build_index,
+                             run_worker=HNSWIndexSingleton.STORAGE != "mmap")
+
+# Concurrent /search requests share endpoint invocations
+text_coalescer = TextEncodeCoalescer(lambda: get_encoder())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ENCODER_BACKEND == "local":
+        check_local_inference_path()  # fail at startup, not on the first search
+    build_jobs.start()  # resumes builds interrupted by the last shutdown
+    yield
+    build_jobs.shutdown(timeout=30)
+    await close_encoder()
+
 app = FastAPI(
     title="VisionSearch API",
     description="API for building and querying an HNSW index of CLIP embeddings over HuggingFace datasets.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and count error responses, labelled by route template (not the raw path)."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        labels = dict(method=request.method, route=getattr(route, "path", "unmatched"), status=str(status))
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+        if status >= 400:
+            HTTP_ERRORS.inc(**labels)
+
+def _json_response(model, endpoint: str) -> Response:
+    """Serialize a response model directly, timing it; FastAPI would otherwise re-validate and re-encode it."""
+    with SERIALIZE_SECONDS.time(endpoint=endpoint):
+        body = model.model_dump_json()
+    return Response(content=body, media_type="application/json")
+
+def _collection_or_404(collection: str):
+    if not HNSWIndexSingleton.exists(collection):
+        raise HTTPException(status_code=404, detail="Collection not found.")
+
+async def _ready_or_503(collection: str):
+    """Load the collection on first use; 503 if it still is not ready."""
+    _collection_or_404(collection)
+    if not HNSWIndexSingleton.is_ready(collection):
+        await run_in_threadpool(HNSWIndexSingleton.ensure_ready, collection)
+        if not HNSWIndexSingleton.is_ready(collection):
+            raise HTTPException(status_code=503, detail="Index is still building.")
+
+def _job_or_404(job) -> BuildJobStatus:
+    if job is None:
+        raise HTTPException(status_code=404, detail="Build job not found.")
+    return BuildJobStatus.from_job(job)
+
 @app.get(
     "/index/status", 
     response_model=StatusResponse,
     summary="Get index build status",
     response_description="Indicates whether the index is ready or still building. Invokes building of index if not ready"
 )
-def index_status():
+def index_status(
+    collection: str = Query(DEFAULT_COLLECTION, pattern=COLLECTION_NAME_PATTERN, description="Collection to check.")
+):
     """
     Check the current status of the HNSW index.
 
     Returns:
-        StatusResponse: Contains a single field 'status', which is 'ready' if the index
-                        has been built, or 'building' otherwise.
+        StatusResponse: 'status' is 'ready' if the index has been built, or 'building'
+                        otherwise, plus the item count, current capacity and fill ratio.
+    """
+    _collection_or_404(collection)
+    HNSWIndexSingleton.ensure_ready(collection)
+    status = "ready" if HNSWIndexSingleton.is_ready(collection) else "building"
+    index = HNSWIndexSingleton.collection(collection)
+    count, capacity = index.count(), index.capacity()
+    return StatusResponse(status=status, count=count, capacity=capacity,
+                          fill_ratio=round(count / capacity, 4) if capacity else 0.0)
+
+@app.get(
+    "/collections",
+    response_model=CollectionList,
+    summary="List index collections",
+    response_description="Every collection with its HNSW parameters, whether it is loaded and its approximate memory use."
+)
+def list_collections():
+    return CollectionList(collections=[
+        CollectionInfo(name=c.name, loaded=c.is_loaded(), count=c.count(), memory_mb=c.memory_bytes() / 2**20,
+                       dim=c.params.dim, space=c.params.space, M=c.params.M,
+                       ef_construction=c.params.ef_construction, ef_search=c.params.ef_search,
+                       quantization=c.params.quantization, generation=c.generation)
+        for c in HNSWIndexSingleton.list_collections()
+    ])
+
+@app.post(
+    "/collections/{collection}/rollback",
+    response_model=CollectionInfo,
+    summary="Roll back a collection",
+    response_description="The collection after swapping back to the generation it served before the last rebuild."
+)
+def rollback_collection(collection: str = Path(..., pattern=COLLECTION_NAME_PATTERN)):
+    """
+    Swap a collection back to its previous generation, without downtime.
+
+    Returns:
+        CollectionInfo: the collection as now served.
     """
-    HNSWIndexSingleton.ensure_ready()
-    status = "ready" if HNSWIndexSingleton.is_ready() else "building"
-    return StatusResponse(status=status)
+    _collection_or_404(collection)
+    try:
+        c = HNSWIndexSingleton.rollback(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return CollectionInfo(name=c.name, loaded=c.is_loaded(), count=c.count(), memory_mb=c.memory_bytes() / 2**20,
+                          dim=c.params.dim, space=c.params.space, M=c.params.M,
+                          ef_construction=c.params.ef_construction, ef_search=c.params.ef_search,
+                          quantization=c.params.quantization, generation=c.generation)
 @app.post(
     "/index/build", 
+    status_code=202,
+    response_model=BuildJobStatus,
     summary="Trigger index build",
-    response_description="Confirmation that index build has completed and how many passed/failed."
+    response_description="The queued build job; poll GET /index/build/{job_id} for progress."
 )
 def build_index_endpoint(
     req: IndexBuildRequest
 ):
     """
-    Build the HNSW index from a HuggingFace dataset.
+    Queue a background build of the HNSW index from a HuggingFace dataset.
 
     Args:
         req (IndexBuildRequest): Contains:
             - dataset_repo (str): HF repo identifier (e.g., 'huggingface/xyz').
             - split (str): Dataset split to use (e.g., 'train').
             - image_column (str): Column name containing image paths or URLs.
+            - batch_size (int): Images embedded per endpoint request.
+            - max_wait_ms (int): Max time a partial batch waits before it is sent.
+            - collection (str): Collection to build into; created on first use.
+            - rebuild (bool): Build a new generation and hot-swap it in when done.
+            - M, ef_construction, ef_search (int, optional): HNSW params of a new collection.
+            - quantization (str, optional): "sq8" or "pq" to store compressed codes in a new collection.
 
     Returns:
-        dict: {"status": "completed", "dataset": <repo_id>} on success.
+        BuildJobStatus: The queued job, including its `job_id`.
 
     Raises:
-        HTTPException(500): If the index build fails.
+        HTTPException(500): If the job could not be queued.
     """
     try:
-        build_index(req.dataset_repo, req.split, req.image_column)
-        return {"status": "completed", "dataset": req.dataset_repo}
+        job = build_jobs.submit(req.model_dump())
     except Exception as e:
         logger.error(f"❌ Build index error: {e}")
-        raise HTTPException(status_code=500, detail="Failed to build index.")
+        raise HTTPException(status_code=500, detail="Failed to queue index build.")
+    return BuildJobStatus.from_job(job)
+
+@app.get(
+    "/index/build",
+    response_model=BuildJobList,
+    summary="List index build jobs",
+    response_description="Most recent build jobs, newest first."
+)
+def list_build_jobs():
+    return BuildJobList(jobs=[BuildJobStatus.from_job(j) for j in build_jobs.list()])
+
+@app.get(
+    "/index/build/{job_id}",
+    response_model=BuildJobStatus,
+    summary="Get index build progress",
+    response_description="Records seen/embedded/failed, throughput and ETA for a build job."
+)
+def get_build_job(job_id: str):
+    return _job_or_404(build_jobs.get(job_id))
+
+@app.post(
+    "/index/build/{job_id}/cancel",
+    response_model=BuildJobStatus,
+    summary="Cancel an index build",
+    response_description="The job; a running build stops after checkpointing what it has read."
+)
+def cancel_build_job(job_id: str):
+    return _job_or_404(build_jobs.cancel(job_id))
+
+@app.post(
+    "/index/build/{job_id}/resume",
+    response_model=BuildJobStatus,
+    summary="Resume a failed or cancelled index build",
+    response_description="The re-queued job; it continues from its last checkpointed offset."
+)
+def resume_build_job(job_id: str):
+    return _job_or_404(build_jobs.resume(job_id))
 
 @app.get(
     "/search", 
@@ -71,9 +232,16 @@ def build_index_endpoint(
     summary="Search the index",
     response_description="Return top-k closest images for a given text query."
 )
-def search(
+async def search(
     query: str = Query(..., description="Text query to encode and search over the index."),
-    k: int = Query(5, ge=1, le=100, description="Number of nearest neighbors to retrieve.")
+    k: int = Query(5, ge=1, le=100, description="Number of nearest neighbors to retrieve."),
+    dataset: Optional[str] = Query(None, description="Only return images from this dataset repo."),
+    split: Optional[str] = Query(None, description="Only return images from this dataset split."),
+    label: Optional[str] = Query(None, description="Only return images with this class label."),
+    collection: str = Query(DEFAULT_COLLECTION, pattern=COLLECTION_NAME_PATTERN, description="Collection to search."),
+    quality: Optional[str] = Query(None, pattern=QUALITY_PATTERN,
+                                   description="Recall/latency tier: fast, balanced (default), high or exact."),
+    ef: Optional[int] = Query(None, ge=1, le=5000, description="HNSW search depth; overrides `quality`, rounded up to a power of two, at least k."),
 ):
     """
     Encode a text query using CLIP and search the HNSW index.
@@ -81,20 +249,131 @@ def search(
     Args:
         query (str): The input text to encode.
         k (int): Number of nearest neighbors to return.
+        dataset, split, label (str, optional): Attribute filters; results match all given values.
+        collection (str): Collection to search; loaded on first use.
+        quality (str, optional): "fast" (ef = k), "balanced" (the collection's ef_search),
+            "high" (4x ef_search) or "exact" (brute-force scan).
+        ef (int, optional): Explicit HNSW ef; never below k.
 
     Returns:
         SearchResponse: Contains a list of image paths and their similarity scores.
+
+    Query embeddings and final result lists are cached; results are keyed by the
+    index version so they are never served after the index changes.
     """
-    if not HNSWIndexSingleton.is_ready():
-        raise HTTPException(status_code=503, detail="Index is still building.")
-    try:
-        client = CLIPSageMakerClient()
-        vec = client.encode_text(text=query)
-    except Exception as e:
-        logger.error(f"❌ Text encoding error: {e}")
-        raise HTTPException(status_code=500, detail="Failed to encode query text.")
+    await _ready_or_503(collection)
+
+    key = normalize_query(query)
+    search_filter = SearchFilter(dataset=dataset, split=split, class_label=label)
+    result_key = (collection, key, k, search_filter, quality, ef, HNSWIndexSingleton.version(collection))
+    cached = search_result_cache.get(result_key)
+    if cached is not None:
+        return _json_response(cached, "search")
+
+    vec = query_embedding_cache.get(key)
+    if vec is None:
+        try:
+            vec = await text_coalescer.encode(query)
+        except Exception as e:
+            logger.error(f"❌ Text encoding error: {e}")
+            raise HTTPException(status_code=500, detail="Failed to encode query text.")
+        query_embedding_cache.put(key, vec)
 
-    results, scores = HNSWIndexSingleton.query(vec, k)
-    return SearchResponse(
+    # A search can load the collection, wait for a resize or another ef, or scan; keep it off the event loop
+    results, scores = await run_in_threadpool(HNSWIndexSingleton.query, vec, k, search_filter,
+                                              collection=collection, quality=quality, ef=ef)
+    response = SearchResponse(
         results=[SearchResult(image_path=p, score=s) for p, s in zip(results, scores)]
     )
+    search_result_cache.put(result_key, response)
+    return _json_response(response, "search")
+
+@app.post(
+    "/search/batch",
+    response_model=SearchBatchResponse,
+    summary="Search the index with many queries",
+    response_description="Top-k closest images for each query, in request order."
+)
+async def search_batch(req: SearchBatchRequest):
+    """
+    Encode many text queries in one endpoint request and search them with one
+    vectorized KNN query.
+
+    Args:
+        req (SearchBatchRequest): Queries, each with its own `k`.
+
+    Returns:
+        SearchBatchResponse: One SearchResponse per query, in request order.
+
+    Cached results and embeddings are reused; only the remaining distinct
+    queries are sent to the endpoint.
+    """
+    collection = req.collection
+    await _ready_or_503(collection)
+
+    version = HNSWIndexSingleton.version(collection)
+    keys = [normalize_query(q.query) for q in req.queries]
+    no_filter = SearchFilter()
+    responses = [search_result_cache.get((collection, key, q.k, no_filter, req.quality, req.ef, version))
+                 for key, q in zip(keys, req.queries)]
+    pending = [i for i, r in enumerate(responses) if r is None]
+    if not pending:
+        return _json_response(SearchBatchResponse(results=responses), "search_batch")
+
+    vectors = {}
+    for i in pending:
+        if keys[i] not in vectors:
+            vectors[keys[i]] = query_embedding_cache.get(keys[i])
+    missing = [key for key, vec in vectors.items() if vec is None]
+    if missing:
+        try:
+            encoder = get_encoder()
+            with timed_encode("text", encoder, len(missing)):
+                embeddings = await encoder.encode_texts_async(missing)
+        except Exception as e:
+            logger.error(f"❌ Batch text encoding error: {e}")
+            raise HTTPException(status_code=500, detail="Failed to encode query text.")
+        for key, vec in zip(missing, embeddings):
+            vectors[key] = vec
+            query_embedding_cache.put(key, vec)
+
+    matrix = np.vstack([vectors[keys[i]] for i in pending])
+    # A large batch search takes milliseconds; keep it off the event loop
+    hits = await run_in_threadpool(HNSWIndexSingleton.query_batch, matrix, [req.queries[i].k for i in pending],
+                                   collection=collection, quality=req.quality, ef=req.ef)
+    for i, (results, scores) in zip(pending, hits):
+        responses[i] = SearchResponse(
+            results=[SearchResult(image_path=p, score=s) for p, s in zip(results, scores)]
+        )
+        search_result_cache.put((collection, keys[i], req.queries[i].k, no_filter, req.quality, req.ef, version),
+                                responses[i])
+
+    return _json_response(SearchBatchResponse(results=responses), "search_batch")
+
+@app.get(
+    "/cache/stats",
+    response_model=CacheStatsResponse,
+    summary="Query cache statistics",
+    response_description="Size, hit and miss counters of the query embedding and search result caches."
+)
+def cache_stats():
+    return CacheStatsResponse(
+        query_embeddings=query_embedding_cache.stats(),
+        search_results=search_result_cache.stats(),
+    )
+
+@app.get(
+    "/metrics",
+    summary="Prometheus metrics",
+    response_description="Latency histograms, error/retry/ingestion counters and index gauges in the Prometheus text format."
+)
+def metrics():
+    # Refill from scratch so evicted and deleted collections stop reporting their last values
+    for gauge in (INDEX_ITEMS, INDEX_CAPACITY, INDEX_MEMORY_BYTES):
+        gauge.clear()
+    for c in HNSWIndexSingleton.list_collections():
+        if c.is_loaded():
+            INDEX_ITEMS.set(c.count(), collection=c.name)
+            INDEX_CAPACITY.set(c.capacity(), collection=c.name)
+            INDEX_MEMORY_BYTES.set(c.memory_bytes(), collection=c.name)
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import logging
+from dataclasses import dataclass, astuple
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    label INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    dataset TEXT,
+    split TEXT,
+    row INTEGER,
+    content_hash TEXT,
+    class_label TEXT,
+    thumbnail TEXT
+)
+"""
+_COLUMNS = "path, dataset, split, row, content_hash, class_label, thumbnail"
+# Let SQLite read the file through a memory map, so processes share its pages in the OS cache
+MMAP_BYTES = int(os.getenv("METADATA_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+
+@dataclass
+class ItemMetadata:
+    """What is known about one indexed image, keyed by its HNSW label."""
+    path: str
+    dataset: Optional[str] = None
+    split: Optional[str] = None
+    row: Optional[int] = None
+    content_hash: Optional[str] = None
+    class_label: Optional[str] = None
+    thumbnail: Optional[str] = None
+
+
+class MetadataStore:
+    """
+    Append-only label → ItemMetadata table in a SQLite file.
+
+    New rows are buffered in memory by `append` and written by `flush`, so a
+    save only inserts what was added since the previous one. Lookups go to
+    SQLite by primary key; nothing is read into memory at open time.
+
+    Writes share one connection under `_lock`. Lookups only take the lock to
+    read the (persisted count, pending list) pair and then query through a
+    per-thread read connection, so concurrent searches do not queue behind
+    each other or behind a flush (SQLite WAL mode lets readers run alongside
+    the writer).
+
+    Args:
+        path: SQLite file, created if missing.
+        legacy_path: Optional `image_paths.txt` (one path per line, line i is
+            label i) imported once when the SQLite file is new.
+        read_only: Open an existing file for lookups only (another process
+            owns the writes); SQLite then rejects `flush` and `truncate`.
+    """
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        is_new = not os.path.exists(path)
+        if read_only:
+            self._conn = self._connect()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = self._connect()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(_SCHEMA)
+        self._lock = threading.Lock()
+        self._pending: list[ItemMetadata] = []  # replaced, never cleared, on flush: readers may hold it
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+
+        if is_new and legacy_path and os.path.exists(legacy_path) and not read_only:
+            self._import_legacy(legacy_path)
+        (self._persisted,) = self._conn.execute("SELECT COALESCE(MAX(label) + 1, 0) FROM items").fetchone()
+
+    def _import_legacy(self, legacy_path: str):
+        with open(legacy_path, "r") as f, self._conn:
+            self._conn.executemany(
+                "INSERT INTO items (label, path) VALUES (?, ?)",
+                ((label, line.strip()) for label, line in enumerate(f)),
+            )
+        logger.info(f"📥 Imported legacy metadata from '{legacy_path}'")
+
+    def _connect(self, query_only: bool = False) -> sqlite3.Connection:
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        if query_only:
+            conn.execute("PRAGMA query_only=ON")
+        conn.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(query_only=True)
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def __len__(self) -> int:
+        return self._persisted + len(self._pending)
+
+    def append(self, items: list[ItemMetadata]) -> int:
+        """Buffer rows for the next labels; returns the label of the first one."""
+        with self._lock:
+            start = len(self)
+            self._pending.extend(items)
+            return start
+
+    def flush(self):
+        """Write rows appended since the last flush."""
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(self._persisted + i, *astuple(item)) for i, item in enumerate(self._pending)]
+            with self._conn:
+                self._conn.executemany(f"INSERT INTO items (label, {_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._persisted += len(rows)
+            self._pending = []
+
+    def truncate(self, count: int):
+        """Drop every row with label >= `count` (e.g. rows saved after the index snapshot)."""
+        with self._lock:
+            if count < self._persisted:
+                with self._conn:
+                    self._conn.execute("DELETE FROM items WHERE label >= ?", (count,))
+                self._persisted = count
+                self._pending = []
+            else:
+                self._pending = self._pending[:count - self._persisted]
+
+    def get_many(self, labels) -> list[ItemMetadata]:
+        """Metadata for each label, in order."""
+        labels = [int(label) for label in labels]
+        with self._lock:
+            persisted, pending = self._persisted, self._pending
+        found = {}
+        stored = list({label for label in labels if label < persisted})
+        if stored:
+            placeholders = ",".join("?" * len(stored))
+            for label, *fields in self._reader().execute(
+                f"SELECT label, {_COLUMNS} FROM items WHERE label IN ({placeholders})", stored
+            ):
+                found[label] = ItemMetadata(*fields)
+        for label in labels:
+            if label >= persisted:
+                found[label] = pending[label - persisted]
+        return [found[label] for label in labels]
+
+    def attributes(self) -> list[tuple]:
+        """(dataset, split, class_label) for every label in order, read in one scan."""
+        with self._lock:
+            rows = self._conn.execute("SELECT dataset, split, class_label FROM items ORDER BY label").fetchall()
+            rows += [(item.dataset, item.split, item.class_label) for item in self._pending]
+        return rows
+
+    def rows(self, dataset: str, split: str, since: int = 0) -> set[int]:
+        """Dataset rows >= `since` of (dataset, split) that already have a label."""
+        with self._lock:
+            found = {row for (row,) in self._conn.execute(
+                "SELECT row FROM items WHERE dataset = ? AND split = ? AND row >= ?", (dataset, split, since)
+            )}
+            found.update(item.row for item in self._pending
+                         if item.dataset == dataset and item.split == split and item.row is not None
+                         and item.row >= since)
+        return found
+
+    def paths(self, labels) -> list[str]:
+        return [item.path for item in self.get_many(labels)]
+
+    def close(self):
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._conn.close()
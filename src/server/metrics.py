@@ -0,0 +1,194 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond searches to multi-second endpoint calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[n] for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+            lines += self._samples(items)
+        return lines
+
+    def _samples(self, items) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    """Monotonic total per label set."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Last set value per label set."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Observation counts per upper bound, plus their sum and count, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def _samples(self, items) -> list[str]:
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Requests
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "visionsearch_http_request_seconds", "End-to-end HTTP request latency.", ("method", "route", "status")))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    "visionsearch_http_errors_total", "HTTP responses with a 4xx/5xx status or an unhandled exception.",
+    ("method", "route", "status")))
+SERIALIZE_SECONDS = REGISTRY.register(Histogram(
+    "visionsearch_response_serialize_seconds", "Time to serialize a search response to JSON.", ("endpoint",)))
+
+# Encoding and search
+ENCODE_SECONDS = REGISTRY.register(Histogram(
+    "visionsearch_encode_seconds", "Latency of one encoder call (a batch).", ("kind", "backend")))
+ENCODE_ITEMS = REGISTRY.register(Counter(
+    "visionsearch_encoded_items_total", "Texts and images embedded.", ("kind", "backend")))
+ENCODER_RETRIES = REGISTRY.register(Counter(
+    "visionsearch_encoder_retries_total", "Encoder endpoint requests that were sent again.", ("backend", "reason")))
+ENCODER_ERRORS = REGISTRY.register(Counter(
+    "visionsearch_encoder_errors_total",
+    "Encoder calls that raised, by exception type, and requests that ran out of retries.", ("backend", "kind")))
+KNN_SECONDS = REGISTRY.register(Histogram(
+    "visionsearch_knn_query_seconds", "Latency of one index search call.", ("collection", "engine")))
+
+# Ingestion
+INGEST_RECORDS = REGISTRY.register(Counter(
+    "visionsearch_ingest_records_total", "Dataset records through each build pipeline stage.", ("stage",)))
+
+# Index state, refreshed on every scrape
+INDEX_ITEMS = REGISTRY.register(Gauge(
+    "visionsearch_index_items", "Items searchable in a loaded collection.", ("collection",)))
+INDEX_CAPACITY = REGISTRY.register(Gauge(
+    "visionsearch_index_capacity", "Allocated item slots of a loaded collection.", ("collection",)))
+INDEX_MEMORY_BYTES = REGISTRY.register(Gauge(
+    "visionsearch_index_memory_bytes", "Approximate resident size of a collection.", ("collection",)))
+
+
+@contextmanager
+def timed_encode(kind: str, encoder, items: int):
+    """Time one encoder call and count its inputs or its failure, labelled with the encoder's backend."""
+    backend = getattr(encoder, "backend", "unknown")
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as error:
+        ENCODER_ERRORS.inc(backend=backend, kind=type(error).__name__)
+        raise
+    finally:
+        ENCODE_SECONDS.observe(time.perf_counter() - start, kind=kind, backend=backend)
+    ENCODE_ITEMS.inc(items, kind=kind, backend=backend)
@@ -0,0 +1,338 @@
+import os
+import struct
+import logging
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+from server.exact_search import _executor
+
+logger = logging.getLogger(__name__)
+
+# hnswlib saveIndex header: offsetLevel0, max_elements, cur_element_count, size_data_per_element,
+# label_offset, offsetData (size_t), maxlevel (int), enterpoint_node (uint32), maxM, maxM0, M (size_t),
+# mult (double), ef_construction (size_t)
+_HEADER = struct.Struct("<6QiI3QdQ")
+_LINK_COUNT_MASK = 0xFFFF  # the list header's low 16 bits hold the neighbour count
+_EXPAND_ROWS = 8  # beam entries a block of queries expands per step, at least one per query
+_DISTANCE_ROWS = 128  # vectors gathered per distance product, small enough to stay in cache
+_VISITED_BYTES = 32 * 2**20  # per-thread visited table: one byte per (query, element) of a query block
+
+
+def file_signature(path: str) -> Optional[tuple]:
+    """Identifies one version of a file that is replaced atomically (inode, mtime); None if missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+class MappedGraph:
+    """
+    Read-only HNSW search over a file written by `hnswlib.Index.save_index`,
+    memory-mapped instead of read into the heap.
+
+    The file's level-0 block (links, vectors and labels of every element) is
+    used in place through numpy views of the mapping, so every process that
+    maps the same snapshot shares one copy in the OS page cache. Only the
+    upper-level link lists (about 1/M of the elements) and a label → element
+    table are indexed in process memory, as small arrays.
+
+    Implements the subset of the `hnswlib.Index` API that `HNSWIndex` uses
+    for searching (`knn_query`, `get_items`, counts), with hnswlib's
+    semantics: RuntimeError when fewer than k results are found.
+
+    Searches are vectorized with numpy rather than walking the graph one
+    node at a time: a block of queries descends the upper levels together,
+    then runs a beam search on level 0 in lockstep, each query expanding its
+    best unexpanded entries every step. Blocks are sized so their
+    visited table fits _VISITED_BYTES and run on the shared thread pool
+    (numpy releases the GIL in the gathers and products) unless `num_threads`
+    is 1. Filtered searches run one query at a time.
+    """
+
+    def __init__(self, path: str, space: str, dim: int):
+        self.path = path
+        self.space = space
+        self.dim = dim
+        self.ef = 10
+        self.signature = file_signature(path)  # taken before mapping, so a racing replace is seen as a change
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        (_, self._max_elements, count, size_per_element, label_offset, data_offset, self._max_level,
+         self._entry_point, max_m, max_m0, _, _, _) = _HEADER.unpack_from(self._map, 0)
+        if (label_offset - data_offset) != dim * 4:
+            raise ValueError(f"'{path}' holds {(label_offset - data_offset) // 4}-d vectors, expected {dim}")
+
+        self._count = count
+        # Plain ndarray views of the mapping: np.memmap's __getitem__ is slow in the search loop
+        raw = np.asarray(self._map)
+        block = raw[_HEADER.size:_HEADER.size + count * size_per_element].reshape(count, size_per_element)
+        self._links0 = block[:, :data_offset].view(np.uint32)  # (count, 1 + maxM0)
+        self._vectors = block[:, data_offset:label_offset].view(np.float32)  # (count, dim)
+        self._labels = block[:, label_offset:label_offset + 8].view(np.uint64).reshape(-1)
+        self._ids = np.full(int(self._labels.max()) + 1 if count else 0, -1, dtype=np.int64)
+        self._ids[self._labels] = np.arange(count)
+        self._levels = self._read_upper_links(_HEADER.size + count * size_per_element, max_m)
+        self._local = threading.local()
+
+    def _read_upper_links(self, pos: int, max_m: int) -> list:
+        """
+        Per level above 0 (index 0 = level 1): the elements present there, sorted,
+        and their (n, 1 + maxM) uint32 link lists in the same order.
+        """
+        upper = {}
+        raw = memoryview(self._map)
+        size_at = struct.Struct("<I").unpack_from
+        for element in range(self._count):
+            (size,) = size_at(raw, pos)
+            pos += 4
+            if size:
+                upper[element] = np.frombuffer(raw, dtype=np.uint32, count=size // 4, offset=pos).reshape(-1, max_m + 1)
+                pos += size
+        levels = []
+        for level in range(1, self._max_level + 1):
+            elements = np.array([e for e, links in upper.items() if len(links) >= level], dtype=np.int64)
+            links = np.stack([upper[e][level - 1] for e in elements.tolist()]) if len(elements) \
+                else np.zeros((0, max_m + 1), dtype=np.uint32)
+            levels.append((elements, links))
+        return levels
+
+    # ── hnswlib.Index compatible surface ────────────────────────────
+
+    def get_current_count(self) -> int:
+        return self._count
+
+    def get_max_elements(self) -> int:
+        return self._max_elements
+
+    def set_ef(self, ef: int):
+        self.ef = ef
+
+    def get_items(self, labels, return_type: str = "numpy") -> np.ndarray:
+        return self._vectors[self._ids[np.asarray(labels, dtype=np.int64)]]
+
+    def knn_query(self, data: np.ndarray, k: int = 1, num_threads: int = -1,
+                  filter: Optional[Callable[[int], bool]] = None):
+        queries = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        if self.space == "cosine":  # stored vectors are normalized on insert
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-30)
+        if filter is not None:
+            found = [self._filtered_search(query, k, filter) for query in queries]
+        else:
+            rows = max(1, _VISITED_BYTES // max(self._count, 1))
+            threads = 1 if num_threads == 1 else (os.cpu_count() or 1) if num_threads < 1 else num_threads
+            rows = min(rows, -(-len(queries) // threads))  # at least one block per thread
+            blocks = [queries[lo:lo + rows] for lo in range(0, len(queries), rows)]
+            if threads > 1 and len(blocks) > 1:
+                parts = list(_executor().map(lambda block: self._search(block, k), blocks))
+            else:
+                parts = [self._search(block, k) for block in blocks]
+            found = [row for ids, distances in parts for row in zip(ids, distances)]
+
+        labels = np.empty((len(queries), k), dtype=np.uint64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        for row, (ids, dists) in enumerate(found):
+            if len(ids) < k or not np.isfinite(dists[k - 1]):
+                raise RuntimeError("Cannot return the results in a contiguous 2D array. Probably ef or M is too small")
+            labels[row] = self._labels[ids[:k]]
+            distances[row] = dists[:k]
+        return labels, distances
+
+    # ── search ──────────────────────────────────────────────────────
+
+    def _distances(self, queries: np.ndarray, rows: Optional[np.ndarray], elements: np.ndarray) -> np.ndarray:
+        """Distance from `queries[rows[i]]` to element `elements[i]`; with rows None, from the only query."""
+        out = np.empty(len(elements), dtype=np.float32)
+        for lo in range(0, len(elements), _DISTANCE_ROWS):
+            pairs = slice(lo, lo + _DISTANCE_ROWS)
+            vectors = self._vectors[elements[pairs]]
+            query = np.broadcast_to(queries[0], vectors.shape) if rows is None else queries[rows[pairs]]
+            if self.space == "l2":
+                vectors = vectors - query
+                out[pairs] = np.einsum("ij,ij->i", vectors, vectors)
+            else:
+                out[pairs] = 1 - np.einsum("ij,ij->i", vectors, query)
+        return out
+
+    def _visited(self, rows: int):
+        """This thread's (rows, count) visited table and a tag no row has been marked with yet."""
+        local = self._local
+        table = getattr(local, "table", None)
+        if table is None or table.shape[0] < rows:
+            table = local.table = np.zeros((rows, self._count), dtype=np.uint8)
+            local.tag = 0
+        local.tag += 1
+        if local.tag == 256:
+            table[:] = 0
+            local.tag = 1
+        return table, local.tag
+
+    def _descend(self, queries: np.ndarray):
+        """Greedy walk of every query down the upper levels; returns each one's level-0 entry and its distance."""
+        entry = np.full(len(queries), self._entry_point, dtype=np.int64)
+        entry_distance = self._distances(queries, np.arange(len(queries)), entry)
+        for elements, links in reversed(self._levels):
+            moving = np.arange(len(queries))
+            while len(moving):
+                lists = links[np.searchsorted(elements, entry[moving])]
+                valid = np.arange(lists.shape[1] - 1) < (lists[:, :1] & _LINK_COUNT_MASK)
+                neighbours = np.where(valid, lists[:, 1:], 0).astype(np.int64)
+                rows = np.broadcast_to(moving[:, None], neighbours.shape)
+                distances = np.where(valid, self._distances(queries, rows.ravel(), neighbours.ravel())
+                                     .reshape(neighbours.shape), np.inf)
+                best = np.argmin(distances, axis=1)
+                best_distance = distances[np.arange(len(moving)), best]
+                better = best_distance < entry_distance[moving]
+                moving = moving[better]
+                entry[moving] = neighbours[better, best[better]]
+                entry_distance[moving] = best_distance[better]
+        return entry, entry_distance
+
+    def _search(self, queries: np.ndarray, k: int):
+        """
+        Level-0 beam search of a block of queries in lockstep (hnswlib's
+        searchKnn without a filter). Each row of the beam holds the ef best
+        elements seen so far, sorted; a step expands the best unexpanded ones.
+        Returns (element ids, distances), each (len(queries), ef).
+        """
+        n, ef = len(queries), max(self.ef, k)
+        if not self._count:
+            return np.zeros((n, 0), dtype=np.int64), np.zeros((n, 0), dtype=np.float32)
+        entry, entry_distance = self._descend(queries)
+        if n == 1:
+            ids, distances = self._search_one(queries, ef, entry, entry_distance)
+            return ids[None, :], distances[None, :]
+        ids = np.full((n, ef), -1, dtype=np.int64)
+        distances = np.full((n, ef), np.inf, dtype=np.float32)
+        expanded = np.ones((n, ef), dtype=bool)  # empty slots count as expanded
+        ids[:, 0], distances[:, 0], expanded[:, 0] = entry, entry_distance, False
+        visited, tag = self._visited(n)
+        visited[np.arange(n), entry] = tag
+        expand = max(1, _EXPAND_ROWS // n)
+
+        while True:
+            open_slots = ~expanded
+            query, slot = np.nonzero(open_slots & (np.cumsum(open_slots, axis=1) <= expand))
+            if not len(query):
+                break
+            expanded[query, slot] = True
+            lists = self._links0[ids[query, slot]]
+            valid = np.arange(lists.shape[1] - 1) < (lists[:, :1] & _LINK_COUNT_MASK)
+            query = np.broadcast_to(query[:, None], valid.shape)[valid]
+            neighbour = lists[:, 1:][valid].astype(np.int64)
+            fresh = visited[query, neighbour] != tag
+            # Unique (query, element) pairs, sorted by query
+            pairs = np.unique(query[fresh] * self._count + neighbour[fresh])
+            if not len(pairs):
+                continue
+            query, neighbour = pairs // self._count, pairs % self._count
+            visited[query, neighbour] = tag
+            d = self._distances(queries, query, neighbour)
+            closer = d < distances[query, -1]  # hnswlib: admit while the beam is not full or d beats its worst
+            query, neighbour, d = query[closer], neighbour[closer], d[closer]
+            if not len(query):
+                continue
+
+            # Merge each query's new elements into its beam, keeping the ef nearest
+            counts = np.bincount(query, minlength=n)
+            column = np.arange(len(query)) - (np.cumsum(counts) - counts)[query]
+            touched = np.flatnonzero(counts)
+            width = int(counts.max())
+            new_ids = np.full((n, width), -1, dtype=np.int64)
+            new_distances = np.full((n, width), np.inf, dtype=np.float32)
+            new_ids[query, column], new_distances[query, column] = neighbour, d
+            merged_distances = np.concatenate([distances[touched], new_distances[touched]], axis=1)
+            order = np.argsort(merged_distances, axis=1, kind="stable")[:, :ef]
+            distances[touched] = np.take_along_axis(merged_distances, order, axis=1)
+            ids[touched] = np.take_along_axis(np.concatenate([ids[touched], new_ids[touched]], axis=1), order, axis=1)
+            expanded[touched] = np.take_along_axis(
+                np.concatenate([expanded[touched], new_ids[touched] < 0], axis=1), order, axis=1)
+        return ids, distances
+
+    def _search_one(self, query: np.ndarray, ef: int, ids: np.ndarray, distances: np.ndarray):
+        """`_search` for a single query, on 1-D arrays, which spares a lone request the block bookkeeping."""
+        expanded = np.zeros(1, dtype=bool)
+        visited, tag = self._visited(1)
+        visited = visited[0]
+        visited[ids] = tag
+        while True:
+            slots = np.flatnonzero(~expanded)[:_EXPAND_ROWS]
+            if not len(slots):
+                return ids, distances
+            expanded[slots] = True
+            lists = self._links0[ids[slots]]
+            neighbour = lists[:, 1:][np.arange(lists.shape[1] - 1) < (lists[:, :1] & _LINK_COUNT_MASK)]
+            neighbour = np.unique(neighbour[visited[neighbour] != tag]).astype(np.int64)
+            if not len(neighbour):
+                continue
+            visited[neighbour] = tag
+            d = self._distances(query, None, neighbour)
+            if len(ids) == ef:  # hnswlib: admit while the beam is not full or d beats its worst
+                closer = d < distances[-1]
+                neighbour, d = neighbour[closer], d[closer]
+                if not len(neighbour):
+                    continue
+            distances = np.concatenate([distances, d])
+            order = np.argsort(distances, kind="stable")[:ef]
+            distances = distances[order]
+            ids = np.concatenate([ids, neighbour])[order]
+            expanded = np.concatenate([expanded, np.zeros(len(neighbour), dtype=bool)])[order]
+
+    def _filtered_search(self, query: np.ndarray, k: int, filter: Callable[[int], bool]):
+        """
+        Beam search for one query whose results must pass `filter` (hnswlib's
+        searchKnn with a filter): every element is traversed, but only
+        admitted ones fill the ef results, so the search keeps going until
+        it has ef of them or runs out of candidates nearer than their worst.
+        """
+        if not self._count:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ef = max(self.ef, k)
+        entry, entry_distance = self._descend(query[None, :])
+        visited, tag = self._visited(1)
+        visited = visited[0]
+        visited[entry] = tag
+        candidates, candidate_distances = entry, entry_distance
+        ids, distances = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if filter(int(self._labels[entry[0]])):
+            ids, distances = entry, entry_distance
+        bound = np.inf
+
+        while len(candidates):
+            pick = np.argpartition(candidate_distances, _EXPAND_ROWS - 1)[:_EXPAND_ROWS] \
+                if len(candidates) > _EXPAND_ROWS else np.arange(len(candidates))
+            pick = pick[candidate_distances[pick] <= bound]
+            if not len(pick):
+                break
+            lists = self._links0[candidates[pick]]
+            rest = np.ones(len(candidates), dtype=bool)
+            rest[pick] = False
+            candidates, candidate_distances = candidates[rest], candidate_distances[rest]
+            valid = np.arange(lists.shape[1] - 1) < (lists[:, :1] & _LINK_COUNT_MASK)
+            neighbour = lists[:, 1:][valid].astype(np.int64)
+            neighbour = np.unique(neighbour[visited[neighbour] != tag])
+            if not len(neighbour):
+                continue
+            visited[neighbour] = tag
+            d = self._distances(query[None, :], None, neighbour)
+            closer = d < bound
+            neighbour, d = neighbour[closer], d[closer]
+            candidates = np.concatenate([candidates, neighbour])
+            candidate_distances = np.concatenate([candidate_distances, d])
+            admitted = np.fromiter((filter(int(label)) for label in self._labels[neighbour]), dtype=bool,
+                                   count=len(neighbour))
+            ids, distances = np.concatenate([ids, neighbour[admitted]]), np.concatenate([distances, d[admitted]])
+            if len(ids) >= ef:
+                top = np.argpartition(distances, ef - 1)[:ef]
+                ids, distances = ids[top], distances[top]
+                bound = distances.max()
+                kept = candidate_distances <= bound
+                candidates, candidate_distances = candidates[kept], candidate_distances[kept]
+        order = np.argsort(distances, kind="stable")
+        return ids[order], distances[order]
+
+    def memory_bytes(self) -> int:
+        """Process-private memory: the label table and upper-level index (the mapping is shared)."""
+        return self._ids.nbytes + sum(elements.nbytes + links.nbytes for elements, links in self._levels)
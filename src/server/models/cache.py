@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    ttl_s: float
+    hits: int
+    misses: int
+    hit_ratio: float
+
+class CacheStatsResponse(BaseModel):
+    query_embeddings: CacheStats
+    search_results: CacheStats
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class CollectionInfo(BaseModel):
+    name: str
+    loaded: bool
+    count: int  # items in memory; 0 while the collection is unloaded
+    memory_mb: float  # approximate resident size
+    dim: int
+    space: str
+    M: int
+    ef_construction: int
+    ef_search: int
+    quantization: str = "none"
+    generation: Optional[str] = None  # rebuild that produced the live index; None for the original build
+
+class CollectionList(BaseModel):
+    collections: List[CollectionInfo]
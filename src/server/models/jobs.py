@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class BuildJobStatus(BaseModel):
+    job_id: str
+    status: str  # queued | running | completed | failed | cancelled
+    dataset: str
+    split: str
+    collection: str = "default"
+    seen: int = 0
+    embedded: int = 0
+    failed: int = 0
+    total: Optional[int] = None
+    checkpoint_offset: int = 0
+    throughput: Optional[float] = None  # embedded records per second
+    eta_s: Optional[float] = None
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+    finished_at: Optional[float] = None
+
+    @classmethod
+    def from_job(cls, job: dict) -> "BuildJobStatus":
+        return cls(
+            job_id=job["id"],
+            dataset=job["params"]["dataset_repo"],
+            split=job["params"]["split"],
+            collection=job["params"].get("collection", "default"),
+            **{k: v for k, v in job.items()
+               if k in cls.model_fields and k not in ("job_id", "dataset", "split", "collection")},
+        )
+
+class BuildJobList(BaseModel):
+    jobs: List[BuildJobStatus]
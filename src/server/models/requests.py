@@ -1,6 +1,20 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Optional
+
+from server.index_store import COLLECTION_NAME_PATTERN
 
 class IndexBuildRequest(BaseModel):
     dataset_repo: str ="AI-Lab-Makerere/beans"
     split: str = "train"  # default to 'train'
-    image_column: str = "image"
\ No newline at end of file
+    image_column: str = "image"
+    label_column: str = Field(default="label", description="Class label column stored with each image, if present")
+    batch_size: int = Field(default=32, ge=1, le=256, description="Images per endpoint request")
+    max_wait_ms: int = Field(default=500, ge=0, description="Max time a partial batch waits before it is sent")
+    collection: str = Field(default="default", pattern=COLLECTION_NAME_PATTERN, description="Collection to build into")
+    rebuild: bool = Field(default=False, description="Build a new generation off to the side and swap it in when done")
+    # HNSW parameters for a new collection; an existing collection keeps its own
+    M: Optional[int] = Field(default=None, ge=2, le=128)
+    ef_construction: Optional[int] = Field(default=None, ge=1)
+    ef_search: Optional[int] = Field(default=None, ge=1)
+    quantization: Optional[str] = Field(default=None, pattern="^(none|sq8|pq)$",
+                                        description="Store int8 (sq8) or product-quantized (pq) codes instead of a graph")
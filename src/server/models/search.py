@@ -1,5 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
+
+from server.index_store import COLLECTION_NAME_PATTERN, QUALITY_PATTERN
 
 class SearchQuery(BaseModel):
     query: str = Field(..., min_length=1, description="Text query to search for")
@@ -11,3 +13,13 @@ class SearchResult(BaseModel):
 
 class SearchResponse(BaseModel):
     results: List[SearchResult]
+
+class SearchBatchRequest(BaseModel):
+    collection: str = Field(default="default", pattern=COLLECTION_NAME_PATTERN, description="Collection to search")
+    queries: List[SearchQuery] = Field(..., min_length=1, max_length=1000, description="Queries, each with its own k")
+    quality: Optional[str] = Field(default=None, pattern=QUALITY_PATTERN,
+                                   description="Recall/latency tier for every query: fast, balanced, high or exact")
+    ef: Optional[int] = Field(default=None, ge=1, le=5000, description="HNSW search depth; overrides quality, rounded up to a power of two, at least k")
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResponse]  # one entry per query, in request order
@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class StatusResponse(BaseModel):
     status: str
+    count: int = Field(0, description="Items in the collection.")
+    capacity: int = Field(0, description="Items the index can hold before it is resized.")
+    fill_ratio: float = Field(0.0, description="count / capacity.")
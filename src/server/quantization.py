@@ -0,0 +1,452 @@
+import os
+import json
+import logging
+from typing import Callable, Optional
+
+import numpy as np
+
+from server.exact_search import _executor
+
+logger = logging.getLogger(__name__)
+
+TRAIN_SIZE = int(os.getenv("HNSW_QUANT_TRAIN_SIZE", "10000"))  # items searched exactly until the codebook is trained
+IVF_LIST_SIZE = int(os.getenv("HNSW_IVF_LIST_SIZE", "512"))  # items per inverted list; twice as many splits it
+IVF_NPROBE = int(os.getenv("HNSW_IVF_NPROBE", "16"))  # lists nearest to the query scanned by a search (at least)
+_SCAN_CHUNK = 16384  # vectors read per step of an exact scan or of training
+_DECODE_ROWS = 256  # sq8 codes converted to float per matrix product, small enough to stay in cache
+_MIN_CAPACITY = 1024
+_MIN_LIST_CAPACITY = 16
+_LIST_GROWTH = 1.25  # codes are the memory this index saves, so lists grow with little slack
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means from randomly sampled starting points; returns (k, d) centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+    for _ in range(iterations):
+        distances = (data ** 2).sum(1)[:, None] - 2 * data @ centroids.T + (centroids ** 2).sum(1)[None, :]
+        assign = distances.argmin(1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class ScalarQuantizer:
+    """8-bit scalar quantization: each dimension mapped linearly from its trained [min, max] to 0..255."""
+
+    def __init__(self, low: np.ndarray, scale: np.ndarray):
+        self.low = low.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, data: np.ndarray) -> "ScalarQuantizer":
+        low, high = data.min(0), data.max(0)
+        return cls(low, np.maximum(high - low, 1e-12) / 255.0)
+
+    @property
+    def code_size(self) -> int:
+        return len(self.low)
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((data - self.low) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def inner_products(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """query · decode(codes), converting _DECODE_ROWS codes at a time into one reused float block."""
+        weights = query * self.scale
+        out = np.empty(len(codes), dtype=np.float32)
+        block = np.empty((min(len(codes), _DECODE_ROWS), len(weights)), dtype=np.float32)
+        for lo in range(0, len(codes), _DECODE_ROWS):
+            rows = block[:min(_DECODE_ROWS, len(codes) - lo)]
+            rows[:] = codes[lo:lo + len(rows)]
+            np.matmul(rows, weights, out=out[lo:lo + len(rows)])
+        return out + float(query @ self.low)
+
+    def state(self) -> dict:
+        return {"low": self.low, "scale": self.scale}
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into `m` sub-vectors, each
+    replaced by the id of its nearest of 256 trained centroids (m bytes per
+    item). Distances to a query are summed from per-query lookup tables.
+    """
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = centroids.astype(np.float32)  # (m, 256, d / m)
+
+    @classmethod
+    def train(cls, data: np.ndarray, m: int) -> "ProductQuantizer":
+        if data.shape[1] % m:
+            raise ValueError(f"dim {data.shape[1]} is not divisible into {m} sub-vectors")
+        sub = data.reshape(len(data), m, -1)
+        return cls(np.stack([_kmeans(sub[:, j], 256, seed=j) for j in range(m)]))
+
+    @property
+    def code_size(self) -> int:
+        return self.centroids.shape[0]
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        m, _, width = self.centroids.shape
+        sub = data.reshape(len(data), m, width)
+        codes = np.empty((len(data), m), dtype=np.uint8)
+        for j in range(m):
+            c = self.centroids[j]
+            codes[:, j] = ((c ** 2).sum(1)[None, :] - 2 * sub[:, j] @ c.T).argmin(1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        m = self.centroids.shape[0]
+        return self.centroids[np.arange(m)[None, :], codes].reshape(len(codes), -1)
+
+    def tables(self, query: np.ndarray, l2: bool) -> np.ndarray:
+        """(m, 256) per-sub-vector inner products, or squared distances with `l2`."""
+        m, _, width = self.centroids.shape
+        if l2:
+            return ((self.centroids - query.reshape(m, 1, width)) ** 2).sum(-1)
+        return np.matmul(self.centroids, query.reshape(m, width, 1))[..., 0]
+
+    def scores(self, query: np.ndarray, codes: np.ndarray, l2: bool) -> np.ndarray:
+        """
+        Approximate inner products (squared distances with `l2`) of the query
+        to the codes. The tables are rounded to uint8 (one shared scale, an
+        offset per sub-vector) so a code's score is summed in integers, one
+        table lookup per sub-vector column.
+        """
+        tables = self.tables(query, l2)
+        low = tables.min(1, keepdims=True)
+        scale = max(float((tables - low).max()) / 255.0, 1e-30)
+        lookup = np.rint((tables - low) / scale).astype(np.uint8)
+        total = np.zeros(len(codes), dtype=np.uint16 if 255 * len(lookup) < 2**16 else np.uint32)
+        for j, table in enumerate(lookup):
+            total += table.take(codes[:, j])
+        return (float(low.sum()) + scale * total).astype(np.float32)
+
+    def state(self) -> dict:
+        return {"centroids": self.centroids}
+
+
+class CompressedIndex:
+    """
+    Vector index that keeps only quantized codes in memory.
+
+    The codes are grouped into inverted lists, each holding the items
+    nearest to its centroid. The centroids are trained with k-means (one per
+    IVF_LIST_SIZE training vectors), and a list that grows to twice that
+    size is split in two by 2-means over its float vectors, so lists stay
+    bounded as the collection grows. A search scans only the lists of the
+    IVF_NPROBE centroids nearest to the query (more if those hold fewer than
+    the candidates it needs, or a filter rejects too many of them).
+
+    int8 (`sq8`) codes are scored with a matrix product over cache-sized
+    blocks, product-quantized (`pq`) ones by summing uint8 lookup tables.
+    With `rerank` the best `ef` candidates are then re-scored against the
+    float32 vectors, which live in a memory-mapped file next to the index and
+    are only paged in for those candidates. Until TRAIN_SIZE items have been
+    added there is no codebook yet and searches scan the float vectors
+    exactly. Queries of a batch run on the shared thread pool unless
+    `num_threads` is 1.
+
+    Implements the subset of the `hnswlib.Index` API that `HNSWIndex` uses,
+    so a collection created with `quantization` keeps its write-ahead log,
+    snapshots, filters and generations. Labels must be added in order
+    0, 1, 2, ..., as `HNSWIndex` does.
+    """
+
+    def __init__(self, space: str, dim: int, vectors_path: str, quantization: str = "sq8",
+                 pq_subvectors: int = 64, rerank: bool = True, read_only: bool = False):
+        if quantization not in ("sq8", "pq"):
+            raise ValueError(f"Unknown quantization '{quantization}'")
+        self.space = space
+        self.dim = dim
+        self.vectors_path = vectors_path
+        self.quantization = quantization
+        self.pq_subvectors = pq_subvectors
+        self.rerank = rerank
+        self.read_only = read_only
+        self.ef = 10
+        self.nprobe = IVF_NPROBE
+        self.signature = None  # set by load_index, for mmap readers
+        self._quantizer = None
+        self._count = 0
+        self._max_elements = 0
+        # Inverted lists: (centroids, their squared norms, per list (labels uint32, codes, squared norms of
+        # the decoded vectors) with spare capacity, list sizes). Replaced whole when a list is split.
+        self._ivf: Optional[tuple] = None
+        self._vectors: Optional[np.memmap] = None
+
+    # ── hnswlib.Index compatible surface ────────────────────────────
+
+    def init_index(self, max_elements: int, ef_construction: int = 200, M: int = 16):
+        self._max_elements = max_elements
+        self._map_vectors(max(max_elements, _MIN_CAPACITY))
+
+    def get_current_count(self) -> int:
+        return self._count
+
+    def get_max_elements(self) -> int:
+        return self._max_elements
+
+    def set_ef(self, ef: int):
+        self.ef = ef
+
+    def resize_index(self, new_size: int):
+        self._max_elements = new_size
+
+    def get_items(self, labels, return_type: str = "numpy") -> np.ndarray:
+        return np.asarray(self._vectors[np.asarray(labels, dtype=np.int64)])
+
+    def add_items(self, data: np.ndarray, ids=None, num_threads: int = -1):
+        data = np.ascontiguousarray(data, dtype=np.float32).reshape(-1, self.dim)
+        labels = np.arange(self._count, self._count + len(data)) if ids is None else np.asarray(ids)
+        if len(labels) and (labels[0] != self._count or np.any(np.diff(labels) != 1)):
+            raise ValueError(f"CompressedIndex labels must be appended in order from {self._count}")
+        if self._count + len(data) > self._max_elements:
+            raise RuntimeError("The number of elements exceeds the specified limit")
+        if self.space == "cosine":
+            data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+
+        end = self._count + len(data)
+        if end > len(self._vectors):
+            self._map_vectors(max(end, 2 * len(self._vectors)))
+        self._vectors[self._count:end] = data
+        if self._quantizer is not None:
+            self._add_to_lists(self._quantizer, labels, data)
+        self._count = end
+        if self._quantizer is None and self._count >= TRAIN_SIZE:
+            self._train()
+
+    def knn_query(self, data: np.ndarray, k: int = 1, num_threads: int = -1,
+                  filter: Optional[Callable[[int], bool]] = None):
+        queries = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        if self.space == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-30)
+        quantizer, ivf = self._quantizer, self._ivf  # the lists exist before the quantizer is set
+        coarse = self._coarse_distances(queries, ivf) if quantizer is not None else None
+
+        def search(row: int):
+            return self._search(queries[row], k, filter, quantizer, ivf, coarse[row] if coarse is not None else None)
+
+        threads = 1 if num_threads == 1 else (os.cpu_count() or 1) if num_threads < 1 else num_threads
+        if threads > 1 and len(queries) > 1:
+            found = list(_executor().map(search, range(len(queries))))
+        else:
+            found = [search(row) for row in range(len(queries))]
+
+        labels = np.empty((len(queries), k), dtype=np.uint64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        for row, (found_labels, found_distances) in enumerate(found):
+            if len(found_labels) < k:
+                raise RuntimeError("Cannot return the results in a contiguous 2D array. Probably ef or M is too small")
+            labels[row], distances[row] = found_labels, found_distances
+        return labels, distances
+
+    def save_index(self, path: str):
+        self._vectors.flush()  # rows the snapshot covers must be on disk before it is
+        state = self._quantizer.state() if self._quantizer is not None else {}
+        meta = {"space": self.space, "dim": self.dim, "quantization": self.quantization,
+                "pq_subvectors": self.pq_subvectors, "count": self._count, "max_elements": self._max_elements}
+        if self._ivf is not None:
+            coarse, _, lists, sizes = self._ivf
+            parts = [(ids[:n], codes[:n], norms[:n]) for (ids, codes, norms), n in zip(lists, sizes)]
+            state.update(coarse=coarse, list_sizes=sizes, list_ids=np.concatenate([p[0] for p in parts]),
+                         codes=np.concatenate([p[1] for p in parts]), norms=np.concatenate([p[2] for p in parts]))
+        with open(path, "wb") as f:
+            np.savez(f, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), **state)
+
+    def load_index(self, path: str, max_elements: int = 0):
+        from server.mmap_index import file_signature
+        self.signature = file_signature(path)
+        with np.load(path) as saved:
+            meta = json.loads(saved["meta"].tobytes())
+            self._count, self._max_elements = meta["count"], max(meta["max_elements"], max_elements)
+            if "low" in saved:
+                quantizer = ScalarQuantizer(saved["low"], saved["scale"])
+            elif "centroids" in saved:
+                quantizer = ProductQuantizer(saved["centroids"])
+            else:
+                quantizer = None
+            if quantizer is not None:
+                sizes = saved["list_sizes"].astype(np.int64)
+                bounds = np.cumsum(sizes)[:-1]
+                lists = list(zip(np.split(saved["list_ids"], bounds), np.split(saved["codes"], bounds),
+                                 np.split(saved["norms"], bounds)))
+                coarse = saved["coarse"]
+                self._ivf = (coarse, (coarse ** 2).sum(1), lists, sizes)
+                self._quantizer = quantizer
+        self._map_vectors(max(self._count, _MIN_CAPACITY))
+
+    # ── storage ─────────────────────────────────────────────────────
+
+    def _map_vectors(self, rows: int):
+        if self._vectors is not None:
+            self._vectors.flush()
+        if self.read_only:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+            return
+        os.makedirs(os.path.dirname(self.vectors_path) or ".", exist_ok=True)
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < rows * self.dim * 4:
+                f.truncate(rows * self.dim * 4)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    @staticmethod
+    def _coarse_distances(vectors: np.ndarray, ivf: tuple) -> np.ndarray:
+        """Squared L2 distance (up to each row's constant |v|²) from every vector to every list centroid."""
+        coarse, coarse_norms = ivf[0], ivf[1]
+        return coarse_norms[None, :] - 2 * vectors @ coarse.T
+
+    def _add_to_lists(self, quantizer, labels: np.ndarray, data: np.ndarray):
+        """Encode `data`, append each item to the list of its nearest centroid and split lists that got too long."""
+        codes = quantizer.encode(data)
+        norms = (quantizer.decode(codes) ** 2).sum(1)
+        assign = self._coarse_distances(data, self._ivf).argmin(1)
+        order = np.argsort(assign, kind="stable")
+        lists, starts = np.unique(assign[order], return_index=True)
+        for lst, rows in zip(lists, np.split(order, starts[1:])):
+            self._append(lst, labels[rows], codes[rows], norms[rows])
+        _, _, _, sizes = self._ivf
+        full = [int(lst) for lst in lists if sizes[lst] >= 2 * IVF_LIST_SIZE]
+        while full:
+            full.extend(self._split(full.pop()))
+
+    def _append(self, lst: int, labels: np.ndarray, codes: np.ndarray, norms: np.ndarray):
+        _, _, lists, sizes = self._ivf
+        start = int(sizes[lst])
+        end = start + len(labels)
+        ids, list_codes, list_norms = lists[lst]
+        if end > len(ids):
+            # Grow into new arrays; a search still scanning the old ones keeps a consistent copy
+            capacity = max(end, int(len(ids) * _LIST_GROWTH), _MIN_LIST_CAPACITY)
+            grown = (np.zeros(capacity, dtype=np.uint32), np.zeros((capacity, codes.shape[1]), dtype=np.uint8),
+                     np.zeros(capacity, dtype=np.float32))
+            grown[0][:start], grown[1][:start], grown[2][:start] = ids[:start], list_codes[:start], list_norms[:start]
+            ids, list_codes, list_norms = grown
+        ids[start:end], list_codes[start:end], list_norms[start:end] = labels, codes, norms
+        lists[lst] = (ids, list_codes, list_norms)
+        sizes[lst] = end  # searches read the size before the arrays
+
+    def _split(self, lst: int) -> list:
+        """Split list `lst` in two by 2-means over its float vectors; returns the halves still too long."""
+        coarse, coarse_norms, lists, sizes = self._ivf
+        size = int(sizes[lst])
+        ids, codes, norms = (a[:size] for a in lists[lst])
+        vectors = np.asarray(self._vectors[ids.astype(np.int64)])
+        halves = _kmeans(vectors, 2, iterations=10, seed=lst)
+        side = ((vectors[:, None, :] - halves[None, :, :]) ** 2).sum(-1).argmin(1).astype(bool)
+        if side.all() or not side.any():
+            return []  # identical vectors; leave the list long
+        coarse = np.concatenate([coarse, halves[1:]])
+        coarse[lst] = halves[0]
+        lists = list(lists) + [None]
+        lists[lst] = (ids[~side], codes[~side], norms[~side])
+        lists[-1] = (ids[side], codes[side], norms[side])
+        sizes = np.append(sizes, side.sum())
+        sizes[lst] = size - sizes[-1]
+        self._ivf = (coarse, (coarse ** 2).sum(1), lists, sizes)  # searches keep the tuple they started with
+        return [half for half in (lst, len(sizes) - 1) if sizes[half] >= 2 * IVF_LIST_SIZE]
+
+    def _train(self):
+        sample = np.asarray(self._vectors[:self._count])
+        if len(sample) > TRAIN_SIZE:
+            sample = sample[np.random.default_rng(0).choice(len(sample), TRAIN_SIZE, replace=False)]
+        if self.quantization == "sq8":
+            quantizer = ScalarQuantizer.train(sample)
+        else:
+            quantizer = ProductQuantizer.train(sample, self.pq_subvectors)
+        coarse = _kmeans(sample, max(1, len(sample) // IVF_LIST_SIZE))
+        empty = (np.zeros(0, dtype=np.uint32), np.zeros((0, quantizer.code_size), dtype=np.uint8),
+                 np.zeros(0, dtype=np.float32))
+        self._ivf = (coarse, (coarse ** 2).sum(1), [empty] * len(coarse), np.zeros(len(coarse), dtype=np.int64))
+        for lo in range(0, self._count, _SCAN_CHUNK):
+            hi = min(lo + _SCAN_CHUNK, self._count)
+            self._add_to_lists(quantizer, np.arange(lo, hi), np.asarray(self._vectors[lo:hi]))
+        self._quantizer = quantizer  # searches switch to the lists only once all items are in them
+        logger.info(f"🧮 Trained {self.quantization} codebook and {len(self._ivf[0])} lists on {len(sample)} vectors")
+
+    def memory_bytes(self) -> int:
+        """Resident size: codes, their labels and norms, and the codebooks (float vectors stay on disk)."""
+        if self._quantizer is None:
+            return 0
+        coarse, coarse_norms, lists, _ = self._ivf
+        codebook = sum(v.nbytes for v in self._quantizer.state().values()) + coarse.nbytes + coarse_norms.nbytes
+        return codebook + sum(ids.nbytes + codes.nbytes + norms.nbytes for ids, codes, norms in lists)
+
+    # ── search ──────────────────────────────────────────────────────
+
+    def _exact(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(self._vectors[rows])
+        if self.space == "l2":
+            return ((vectors - query) ** 2).sum(1)
+        return 1 - vectors @ query
+
+    def _scan(self, query: np.ndarray, quantizer, ivf: Optional[tuple], probed: np.ndarray):
+        """Labels and approximate distances of every item in the `probed` lists (all items if untrained)."""
+        if quantizer is None:
+            count = self._count  # items added while searching are not seen
+            labels = np.arange(count)
+            distances = np.empty(count, dtype=np.float32)
+            for lo in range(0, count, _SCAN_CHUNK):
+                distances[lo:lo + _SCAN_CHUNK] = self._exact(query, labels[lo:lo + _SCAN_CHUNK])
+            return labels, distances
+
+        _, _, lists, sizes = ivf
+        parts = []
+        for lst in probed:
+            size = sizes[lst]  # before the arrays: a list that grows later is a superset
+            if size:
+                ids, codes, norms = lists[lst]
+                parts.append((ids[:size], codes[:size], norms[:size]))
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        labels = np.concatenate([p[0] for p in parts]).astype(np.int64)
+        codes = np.concatenate([p[1] for p in parts])
+        l2 = self.space == "l2"
+        if isinstance(quantizer, ProductQuantizer):
+            scores = quantizer.scores(query, codes, l2)
+            return labels, scores if l2 else 1 - scores
+        ip = quantizer.inner_products(query, codes)
+        if l2:
+            return labels, np.concatenate([p[2] for p in parts]) - 2 * ip + float(query @ query)
+        return labels, 1 - ip
+
+    def _search(self, query: np.ndarray, k: int, filter: Optional[Callable[[int], bool]], quantizer,
+                ivf: Optional[tuple], coarse: Optional[np.ndarray]):
+        rerank = self.rerank and quantizer is not None
+        depth = max(self.ef, k) if rerank else k
+        wanted = depth if filter is None else 4 * depth
+        if quantizer is None:
+            order, probes = np.zeros(1, dtype=np.int64), 1
+        else:
+            order = np.argsort(coarse)
+            # At least nprobe lists, and enough of them to hold the candidates wanted
+            held = np.cumsum(ivf[3][order])
+            probes = min(len(order), max(self.nprobe, int(np.searchsorted(held, wanted)) + 1))
+        while True:
+            labels, approximate = self._scan(query, quantizer, ivf, order[:probes])
+            # Widen the candidate pool until enough of it passes the filter, then probe more lists
+            pool = min(len(labels), wanted)
+            while True:
+                candidates = np.argpartition(approximate, pool - 1)[:pool] if pool < len(labels) \
+                    else np.arange(len(labels))
+                if filter is not None:
+                    candidates = candidates[np.fromiter((filter(int(c)) for c in labels[candidates]), dtype=bool,
+                                                        count=len(candidates))]
+                if len(candidates) >= depth or pool == len(labels):
+                    break
+                pool = min(len(labels), pool * 4)
+            if len(candidates) >= depth or probes == len(order):
+                break
+            probes = min(len(order), probes * 4)
+
+        candidates = candidates[np.argsort(approximate[candidates])][:depth]
+        found = labels[candidates]
+        distances = self._exact(query, found) if rerank else approximate[candidates]
+        top = np.argsort(distances)[:k]
+        return found[top].astype(np.uint64), distances[top].astype(np.float32)
@@ -0,0 +1,85 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """
+    Many concurrent readers or one writer.
+
+    A waiting writer blocks new readers, so a steady stream of queries
+    cannot starve it; readers already inside finish first.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class ModeLock:
+    """
+    Shared among holders of the same mode; switching modes waits until the
+    holders of the current one are done.
+
+    Used for settings that are global to an object but chosen per call (an
+    hnswlib index's ef): calls with the same value run concurrently, and
+    `on_switch` applies a new value while nobody is using the old one. Once
+    a call is waiting for another mode, new calls of the current mode queue
+    behind it instead of joining, so the switch is not starved.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._mode = None
+        self._holders = 0
+        self._draining = False  # someone waits for the holders to leave
+
+    @contextmanager
+    def hold(self, mode, on_switch):
+        with self._cond:
+            while self._holders and (mode != self._mode or self._draining):
+                if mode != self._mode:
+                    self._draining = True
+                self._cond.wait()
+            if mode != self._mode:
+                on_switch(mode)
+                self._mode = mode
+            self._holders += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._holders -= 1
+                if not self._holders:
+                    self._draining = False
+                    self._cond.notify_all()
@@ -1,25 +1,93 @@
 import io
-import ast 
 import json
 import os
+import struct
 import numpy as np
 from PIL import Image
-import boto3
-from transformers import CLIPProcessor
-from sagemaker.session import Session
-from sagemaker.predictor import Predictor
-from sagemaker.deserializers import JSONDeserializer
-from sagemaker.serializers import JSONSerializer, IdentitySerializer
+from botocore.exceptions import ClientError
+from server.transport import SageMakerRuntimeTransport, AsyncSageMakerRuntimeTransport, SageMakerInvocationError
+from server.encoders import Encoder, CLIP_MODEL_ID
+from server.metrics import ENCODER_RETRIES
 import logging
 
 logger = logging.getLogger(__name__)
 
-class CLIPSageMakerClient:
+IMAGE_BATCH_CONTENT_TYPE = "application/x-image-batch"
+
+# Response formats: binary `.npy` float32 with JSON as the fallback
+NPY_CONTENT_TYPE = "application/x-npy"
+WIRE_FORMAT = os.getenv("CLIP_WIRE_FORMAT", "npy")  # npy | json
+_ACCEPT = {"npy": f"{NPY_CONTENT_TYPE}, application/json", "json": "application/json"}
+_NPY_MAGIC = b"\x93NUMPY"
+
+
+def encode_image_batch(payloads: list[bytes]) -> bytes:
+    """
+    Frame several encoded images into one request body understood by
+    `inference.input_fn`: <uint32 count> <uint32 length>*count <bytes>*count.
+    """
+    header = struct.pack(f"<I{len(payloads)}I", len(payloads), *(len(p) for p in payloads))
+    return header + b"".join(payloads)
+
+
+def decode_json_embeddings(body: bytes, rows: int) -> np.ndarray:
+    """
+    Parse a JSON embedding response into a (rows, D) float32 matrix.
+
+    The HF inference toolkit wraps `output_fn`'s (body, content_type) tuple in
+    another JSON array, so the embeddings may arrive as a JSON-encoded string.
+    """
+    decoded_data = json.loads(body)
+    if isinstance(decoded_data, list) and len(decoded_data) == 2 and isinstance(decoded_data[0], str):
+        decoded_data = json.loads(decoded_data[0])
+    return np.asarray(decoded_data, dtype=np.float32).reshape(rows, -1)
+
+
+def decode_npy_embeddings(body: bytes, rows: int) -> np.ndarray:
+    """
+    Decode a `.npy` response without copying: the header is parsed and the
+    matrix is a read-only `np.frombuffer` view over the response bytes.
+    """
+    buf = io.BytesIO(body)
+    version = np.lib.format.read_magic(buf)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buf)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buf)
+    if fortran_order or dtype != np.dtype("<f4"):
+        raise ValueError(f"Unexpected embedding array layout: dtype={dtype}, fortran_order={fortran_order}")
+    count = int(np.prod(shape))
+    return np.frombuffer(body, dtype=dtype, count=count, offset=buf.tell()).reshape(rows, -1)
+
+
+def decode_embeddings(body: bytes, rows: int) -> np.ndarray:
+    """Decode a binary or JSON embedding response into a (rows, D) float32 matrix."""
+    if body[:len(_NPY_MAGIC)] == _NPY_MAGIC:
+        return decode_npy_embeddings(body, rows)
+    return decode_json_embeddings(body, rows)
+
+
+def _encode_payload(image) -> bytes:
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class CLIPSageMakerClient(Encoder):
     """
     WIP Singleton class to deploy and use CLIP model via SageMaker using Hugging Face hub.
+    This is the `sagemaker` encoder backend.
+
+    Calls `sagemaker-runtime` directly through a pooled transport that is safe
+    to share across FastAPI's threadpool; `*_async` methods use the asyncio
+    transport and never block a worker thread.
     """
 
     _instance = None
+    backend = "sagemaker"
+    model_id = CLIP_MODEL_ID
 
     def __new__(cls):
         if cls._instance is None:
@@ -39,49 +107,72 @@ class CLIPSageMakerClient:
         if not self.role:
             raise ValueError("SAGEMAKER_ROLE_ARN must be set as an environment variable")
 
-        boto_sess = boto3.Session(region_name=self.region)
-        self.sm_session = Session(boto_session=boto_sess)
-
-        self.json_predictor = Predictor(
-            endpoint_name=self.endpoint_name,
-            serializer=JSONSerializer(),
-            deserializer=JSONDeserializer(),
-            sagemaker_session=self.sm_session
-        )
-
-        self.image_predictor = Predictor(
-            endpoint_name=self.endpoint_name,
-            serializer=IdentitySerializer(content_type="image/jpeg"),
-            deserializer=JSONDeserializer(),
-            sagemaker_session=self.sm_session
-        )
-
+        self.transport = SageMakerRuntimeTransport(self.endpoint_name, region=self.region)
+        self.async_transport = AsyncSageMakerRuntimeTransport(self.endpoint_name, region=self.region)
+        self.wire_format = WIRE_FORMAT if WIRE_FORMAT in _ACCEPT else "json"
 
         logger.info(f"✅ Connected to SageMaker endpoint: {self.endpoint_name}")
         self._initialized = True
 
-    
+    def _fall_back_to_json(self, error: Exception) -> bool:
+        """An endpoint that predates binary responses rejects the npy Accept header."""
+        if self.wire_format == "json" or "Unsupported response content type" not in str(error):
+            return False
+        logger.warning(f"⚠️ Endpoint rejected binary responses ({error}); falling back to JSON")
+        self.wire_format = "json"
+        ENCODER_RETRIES.inc(backend=self.backend, reason="json_fallback")
+        return True
+
+    def _invoke(self, body: bytes, content_type: str, rows: int) -> np.ndarray:
+        try:
+            data, _ = self.transport.invoke(body, content_type=content_type, accept=_ACCEPT[self.wire_format])
+        except ClientError as e:
+            if not self._fall_back_to_json(e):
+                raise
+            data, _ = self.transport.invoke(body, content_type=content_type, accept=_ACCEPT[self.wire_format])
+        return decode_embeddings(data, rows)
+
+    async def _invoke_async(self, body: bytes, content_type: str, rows: int) -> np.ndarray:
+        try:
+            data, _ = await self.async_transport.invoke(body, content_type=content_type,
+                                                        accept=_ACCEPT[self.wire_format])
+        except SageMakerInvocationError as e:
+            if not self._fall_back_to_json(e):
+                raise
+            data, _ = await self.async_transport.invoke(body, content_type=content_type,
+                                                        accept=_ACCEPT[self.wire_format])
+        return decode_embeddings(data, rows)
+
     def encode_image(self, image: Image.Image) -> np.ndarray:
-        buf = io.BytesIO()
-        image.save(buf, format="JPEG")
-        buf.seek(0)
+        return self._invoke(_encode_payload(image), "image/jpeg", rows=1)
 
-        data, _ =  self.image_predictor.predict(buf.read())
-        decoded_data = json.loads(data)
-        decoded_data = decoded_data[0]
-        embedding = np.array(decoded_data, dtype=np.float32).reshape(1, -1)
+    def encode_images(self, images: list) -> np.ndarray:
+        """
+        Encode a micro-batch of images in a single endpoint request.
 
-        return embedding
+        Args:
+            images: PIL images, or already-encoded JPEG/PNG bytes.
 
-    def encode_text(self, text: str) -> np.ndarray:
-        payload = {"inputs": text}
+        Returns:
+            np.ndarray: (N, D) float32 matrix, one row per input image.
+        """
+        payloads = [_encode_payload(image) for image in images]
+        return self._invoke(encode_image_batch(payloads), IMAGE_BATCH_CONTENT_TYPE, rows=len(payloads))
 
-        data, _ = self.json_predictor.predict(payload)
+    def encode_text(self, text: str) -> np.ndarray:
+        return self._invoke(json.dumps({"inputs": text}).encode(), "application/json", rows=1)
 
-        decoded_data = json.loads(data)
-        decoded_data = decoded_data[0]
-        embedding = np.array(decoded_data, dtype=np.float32).reshape(1, -1)
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        """Encode several texts in one endpoint request; returns a (N, D) matrix."""
+        return self._invoke(json.dumps({"inputs": list(texts)}).encode(), "application/json", rows=len(texts))
 
+    async def encode_text_async(self, text: str) -> np.ndarray:
+        return await self._invoke_async(json.dumps({"inputs": text}).encode(), "application/json", rows=1)
 
-        return embedding
+    async def encode_texts_async(self, texts: list[str]) -> np.ndarray:
+        return await self._invoke_async(json.dumps({"inputs": list(texts)}).encode(), "application/json",
+                                        rows=len(texts))
 
+    async def aclose(self):
+        """Close the asyncio transport's connection pool."""
+        await self.async_transport.close()
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import random
+import logging
+from typing import Optional
+from urllib.parse import quote
+
+import boto3
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from server.metrics import ENCODER_ERRORS, ENCODER_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Connection pool and timeout tuning shared by the sync and async transports
+MAX_POOL_CONNECTIONS = int(os.getenv("SAGEMAKER_MAX_POOL_CONNECTIONS", "32"))
+CONNECT_TIMEOUT_S = float(os.getenv("SAGEMAKER_CONNECT_TIMEOUT_S", "2"))
+READ_TIMEOUT_S = float(os.getenv("SAGEMAKER_READ_TIMEOUT_S", "30"))
+KEEPALIVE_S = float(os.getenv("SAGEMAKER_KEEPALIVE_S", "60"))
+MAX_ATTEMPTS = int(os.getenv("SAGEMAKER_MAX_ATTEMPTS", "3"))
+
+# Responses worth retrying: throttling, transient server errors, model warming up
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class SageMakerInvocationError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"SageMaker invocation failed with HTTP {status}: {message}")
+        self.status = status
+
+
+class SageMakerRuntimeTransport:
+    """
+    Thin, thread-safe wrapper around `sagemaker-runtime` `invoke_endpoint`.
+
+    One botocore client (and so one keep-alive connection pool of
+    `max_pool_connections`) is shared by every FastAPI worker thread;
+    botocore's standard retry mode handles throttling and transient errors.
+    """
+
+    def __init__(self, endpoint_name: str, region: Optional[str] = None,
+                 max_pool_connections: int = MAX_POOL_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT_S, read_timeout: float = READ_TIMEOUT_S,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.endpoint_name = endpoint_name
+        config = Config(
+            max_pool_connections=max_pool_connections,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={"max_attempts": max_attempts, "mode": "standard"},
+            tcp_keepalive=True,
+        )
+        self._client = boto3.client("sagemaker-runtime", region_name=region, config=config)
+
+    def invoke(self, body: bytes, content_type: str, accept: str = "application/json") -> tuple[bytes, str]:
+        """POST `body` to the endpoint; returns (response bytes, response content type)."""
+        try:
+            response = self._client.invoke_endpoint(
+                EndpointName=self.endpoint_name,
+                Body=body,
+                ContentType=content_type,
+                Accept=accept,
+            )
+        except ClientError as error:
+            # botocore raises only once its own retries are spent
+            retries = error.response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+            if retries:
+                ENCODER_RETRIES.inc(retries, backend="sagemaker", reason="botocore")
+                ENCODER_ERRORS.inc(backend="sagemaker", kind="retries_exhausted")
+            raise
+        retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retries:
+            ENCODER_RETRIES.inc(retries, backend="sagemaker", reason="botocore")
+        return response["Body"].read(), response.get("ContentType", accept)
+
+
+class AsyncSageMakerRuntimeTransport:
+    """
+    asyncio variant of `SageMakerRuntimeTransport` for `async def` endpoints.
+
+    Requests are SigV4-signed with botocore and sent over a pooled aiohttp
+    session, so awaiting an invocation never occupies a worker thread. The
+    session is created lazily inside the running event loop.
+    """
+
+    def __init__(self, endpoint_name: str, region: Optional[str] = None,
+                 max_pool_connections: int = MAX_POOL_CONNECTIONS,
+                 connect_timeout: float = CONNECT_TIMEOUT_S, read_timeout: float = READ_TIMEOUT_S,
+                 max_attempts: int = MAX_ATTEMPTS, keepalive_s: float = KEEPALIVE_S):
+        boto_session = boto3.Session(region_name=region)
+        self.region = boto_session.region_name
+        self.endpoint_name = endpoint_name
+        self.url = (f"https://runtime.sagemaker.{self.region}.amazonaws.com"
+                    f"/endpoints/{quote(endpoint_name, safe='')}/invocations")
+        self.max_pool_connections = max_pool_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.keepalive_s = keepalive_s
+        self._credentials = boto_session.get_credentials()
+        self._session = None
+
+    def _signed_headers(self, body: bytes, content_type: str, accept: str) -> dict:
+        request = AWSRequest(method="POST", url=self.url, data=body,
+                             headers={"Content-Type": content_type, "Accept": accept})
+        SigV4Auth(self._credentials.get_frozen_credentials(), "sagemaker", self.region).add_auth(request)
+        return dict(request.headers.items())
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_pool_connections, keepalive_timeout=self.keepalive_s),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+            )
+        return self._session
+
+    async def invoke(self, body: bytes, content_type: str, accept: str = "application/json") -> tuple[bytes, str]:
+        """Async `invoke_endpoint`, retried with jittered backoff on throttling/5xx."""
+        session = self._get_session()
+        for attempt in range(1, self.max_attempts + 1):
+            # Re-sign each attempt: the signature embeds a timestamp
+            headers = self._signed_headers(body, content_type, accept)
+            async with session.post(self.url, data=body, headers=headers) as response:
+                payload = await response.read()
+                if response.status < 400:
+                    return payload, response.headers.get("Content-Type", accept)
+                error = SageMakerInvocationError(response.status, payload[:500].decode("utf-8", "replace"))
+            if response.status not in _RETRYABLE_STATUS:
+                raise error
+            if attempt == self.max_attempts:
+                ENCODER_ERRORS.inc(backend="sagemaker", kind="retries_exhausted")
+                raise error
+            delay = min(2.0, 0.05 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            ENCODER_RETRIES.inc(backend="sagemaker", reason=str(response.status))
+            logger.warning(f"⚠️ SageMaker returned {response.status}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,84 @@
+import os
+import json
+import struct
+import zlib
+import logging
+from dataclasses import asdict
+from typing import Iterator
+
+import numpy as np
+
+from server.metadata_store import ItemMetadata
+
+logger = logging.getLogger(__name__)
+
+WAL_FSYNC = os.getenv("HNSW_WAL_FSYNC", "0") == "1"  # also survive OS crashes, at the cost of an fsync per batch
+
+# crc32 of the rest of the record, first label, rows, dim, metadata JSON length
+_HEADER = struct.Struct("<IQIII")
+
+
+class WriteAheadLog:
+    """
+    Append-only log of index insertions made since the last snapshot.
+
+    Each record holds one batch: its first label, the (N, D) float32 vectors
+    and the rows' metadata as JSON, guarded by a CRC32. A record is written
+    and flushed before its vectors enter the in-memory index, so everything a
+    caller saw inserted can be replayed on top of the last snapshot. A torn
+    record at the tail (a crash mid-append) fails its checksum and is cut off.
+    """
+
+    def __init__(self, path: str, fsync: bool = WAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+
+    def append(self, start: int, vectors: np.ndarray, items: list[ItemMetadata]):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        meta = json.dumps([asdict(item) for item in items]).encode()
+        body = vectors.tobytes() + meta
+        header = _HEADER.pack(0, start, vectors.shape[0], vectors.shape[1], len(meta))
+        crc = zlib.crc32(body, zlib.crc32(header[4:]))
+        self._file.write(_HEADER.pack(crc, start, vectors.shape[0], vectors.shape[1], len(meta)) + body)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def replay(self) -> Iterator[tuple[int, np.ndarray, list[ItemMetadata]]]:
+        """Yield (first label, vectors, metadata) per intact record, dropping a torn tail."""
+        self._file.flush()
+        valid = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                crc, start, rows, dim, meta_len = _HEADER.unpack(header)
+                body = f.read(rows * dim * 4 + meta_len)
+                if len(body) < rows * dim * 4 + meta_len or zlib.crc32(body, zlib.crc32(header[4:])) != crc:
+                    break
+                valid = f.tell()
+                vectors = np.frombuffer(body[:rows * dim * 4], dtype=np.float32).reshape(rows, dim)
+                items = [ItemMetadata(**item) for item in json.loads(body[rows * dim * 4:])]
+                yield start, vectors, items
+
+        size = os.path.getsize(self.path)
+        if size > valid:
+            logger.warning(f"⚠️ Dropping {size - valid} bytes of incomplete records from '{self.path}'")
+            self._file.truncate(valid)
+
+    def reset(self):
+        """Discard every record (they are now covered by a snapshot)."""
+        self._file.truncate(0)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def size(self) -> int:
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def close(self):
+        self._file.close()
@@ -1,11 +1,17 @@
 import pytest
 from src.server.index_store import HNSWIndexSingleton
+from server.cache import query_embedding_cache, search_result_cache
 
 @pytest.fixture(autouse=True)
-def reset_index_singleton():
-    HNSWIndexSingleton._index = None
-    HNSWIndexSingleton._ready = False
-    HNSWIndexSingleton._image_paths = []
+def reset_index_singleton(monkeypatch, tmp_path):
+    # Keep on-disk index files per-test so one test's save() never leaks into another's load()
+    monkeypatch.setattr(HNSWIndexSingleton, "INDEX_PATH", str(tmp_path / "index" / "image_index.bin"))
+    monkeypatch.setattr(HNSWIndexSingleton, "META_PATH", str(tmp_path / "index" / "metadata.sqlite3"))
+    monkeypatch.setattr(HNSWIndexSingleton, "LEGACY_META_PATH", str(tmp_path / "index" / "image_paths.txt"))
+    monkeypatch.setattr(HNSWIndexSingleton, "COLLECTIONS_DIR", str(tmp_path / "index" / "collections"))
+    HNSWIndexSingleton.reset()
+    query_embedding_cache.clear()
+    search_result_cache.clear()
 
 def pytest_configure(config):
     config.addinivalue_line("markers", "unit: marks unit tests")
@@ -1,10 +1,11 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import numpy as np
 
 # Import your FastAPI app
 from server.main import app  # adjust this path as needed
+from server.filters import SearchFilter
 
 client = TestClient(app)
 
@@ -15,18 +16,22 @@ client = TestClient(app)
 @patch("server.main.HNSWIndexSingleton")
 def test_check_status_ready(mock_index):
     mock_index.is_ready.return_value = True
+    mock_index.collection.return_value.count.return_value = 250
+    mock_index.collection.return_value.capacity.return_value = 1000
 
     response = client.get("/index/status")
     assert response.status_code == 200
-    assert response.json() == {"status": "ready"}
+    assert response.json() == {"status": "ready", "count": 250, "capacity": 1000, "fill_ratio": 0.25}
 
 @patch("server.main.HNSWIndexSingleton")
 def test_check_status_building(mock_index):
     mock_index.is_ready.return_value = False
+    mock_index.collection.return_value.count.return_value = 0
+    mock_index.collection.return_value.capacity.return_value = 0
 
     response = client.get("/index/status")
     assert response.status_code == 200
-    assert response.json() == {"status": "building"}
+    assert response.json()["status"] == "building"
 
 
 # ────────────────────────────────────────────────────────────────
@@ -34,14 +39,14 @@ def test_check_status_building(mock_index):
 # ────────────────────────────────────────────────────────────────
 
 @patch("server.main.HNSWIndexSingleton")
-@patch("server.main.CLIPSageMakerClient")
-def test_search_success(mock_clip_client_cls, mock_index):
+@patch("server.main.get_encoder")
+def test_search_success(mock_get_encoder, mock_index):
     mock_index.is_ready.return_value = True
     mock_index.query.return_value = (["/img/1.jpg", "/img/2.jpg"], [0.99, 0.95])
 
     mock_client = MagicMock()
-    mock_client.encode_text.return_value = np.random.rand(512).astype(np.float32)
-    mock_clip_client_cls.return_value = mock_client
+    mock_client.encode_texts_async = AsyncMock(side_effect=lambda texts: np.random.rand(len(texts), 512).astype(np.float32))
+    mock_get_encoder.return_value = mock_client
 
     response = client.get("/search", params={"query": "a cat", "k": 2})
     assert response.status_code == 200
@@ -50,6 +55,63 @@ def test_search_success(mock_clip_client_cls, mock_index):
     assert results[0]["image_path"] == "/img/1.jpg"
     assert results[0]["score"] > 0
 
+@patch("server.main.HNSWIndexSingleton")
+@patch("server.main.get_encoder")
+def test_search_repeated_query_is_cached(mock_get_encoder, mock_index):
+    mock_index.is_ready.return_value = True
+    mock_index.version.return_value = 1
+    mock_index.query.return_value = (["/img/1.jpg"], [0.9])
+    mock_client = MagicMock()
+    mock_client.encode_texts_async = AsyncMock(side_effect=lambda texts: np.random.rand(len(texts), 512).astype(np.float32))
+    mock_get_encoder.return_value = mock_client
+
+    for q in ("a cat", "  A  Cat "):
+        response = client.get("/search", params={"query": q, "k": 1})
+        assert response.status_code == 200
+    assert mock_client.encode_texts_async.await_count == 1
+    assert mock_index.query.call_count == 1
+
+    # A new index version invalidates cached results but reuses the cached embedding
+    mock_index.version.return_value = 2
+    client.get("/search", params={"query": "a cat", "k": 1})
+    assert mock_client.encode_texts_async.await_count == 1
+    assert mock_index.query.call_count == 2
+
+    stats = client.get("/cache/stats").json()
+    assert (stats["query_embeddings"]["hits"], stats["query_embeddings"]["misses"]) == (1, 1)
+    assert stats["search_results"]["hits"] == 1
+
+@patch("server.main.HNSWIndexSingleton")
+@patch("server.main.get_encoder")
+def test_search_passes_filters(mock_get_encoder, mock_index):
+    mock_index.is_ready.return_value = True
+    mock_index.version.return_value = 1
+    mock_index.query.return_value = (["/img/3.jpg"], [0.8])
+    mock_client = MagicMock()
+    mock_client.encode_texts_async = AsyncMock(side_effect=lambda texts: np.random.rand(len(texts), 512).astype(np.float32))
+    mock_get_encoder.return_value = mock_client
+
+    response = client.get("/search", params={"query": "a cat", "k": 1, "dataset": "beans", "label": "2"})
+    assert response.status_code == 200
+    assert mock_index.query.call_args.args[2] == SearchFilter(dataset="beans", class_label="2")
+
+    # Filtered and unfiltered results are cached separately
+    client.get("/search", params={"query": "a cat", "k": 1})
+    assert mock_index.query.call_count == 2
+
+@patch("server.main.HNSWIndexSingleton")
+def test_search_passes_quality_and_ef(mock_index):
+    mock_index.is_ready.return_value = True
+    mock_index.version.return_value = 1
+    mock_index.query.return_value = (["/img/3.jpg"], [0.8])
+    with patch("server.main.text_coalescer.encode", AsyncMock(return_value=np.zeros((1, 512), dtype=np.float32))):
+        assert client.get("/search", params={"query": "a dog", "quality": "high"}).status_code == 200
+        assert mock_index.query.call_args.kwargs["quality"] == "high"
+        client.get("/search", params={"query": "a dog", "ef": 300})
+        assert mock_index.query.call_args.kwargs["ef"] == 300
+        assert mock_index.query.call_count == 2  # each setting is cached separately
+        assert client.get("/search", params={"query": "a dog", "quality": "best"}).status_code == 422
+
 @patch("server.main.HNSWIndexSingleton")
 def test_search_index_not_ready(mock_index):
     mock_index.is_ready.return_value = False
@@ -58,39 +120,148 @@ def test_search_index_not_ready(mock_index):
     assert response.json()["detail"] == "Index is still building."
 
 @patch("server.main.HNSWIndexSingleton")
-@patch("server.main.CLIPSageMakerClient")
-def test_search_encoding_failure(mock_clip_client_cls, mock_index):
+def test_search_loads_collection_on_first_use(mock_index):
+    mock_index.is_ready.side_effect = [False, True]
+    mock_index.query.return_value = (["/img/1.jpg"], [0.9])
+    with patch("server.main.text_coalescer.encode", AsyncMock(return_value=np.zeros((1, 512), dtype=np.float32))):
+        response = client.get("/search", params={"query": "a cat", "collection": "beans"})
+    assert response.status_code == 200
+    mock_index.ensure_ready.assert_called_once_with("beans")
+    assert mock_index.query.call_args.kwargs["collection"] == "beans"
+
+@patch("server.main.HNSWIndexSingleton")
+def test_search_unknown_collection(mock_index):
+    mock_index.exists.return_value = False
+    response = client.get("/search", params={"query": "a cat", "collection": "nope"})
+    assert response.status_code == 404
+    assert client.get("/search", params={"query": "a cat", "collection": "../x"}).status_code == 422
+
+@patch("server.main.HNSWIndexSingleton")
+def test_list_collections(mock_index):
+    beans = MagicMock(params=MagicMock(dim=512, space="cosine", M=16, ef_construction=200, ef_search=50,
+                                       quantization="none"))
+    beans.name = "beans"
+    beans.generation = None
+    beans.is_loaded.return_value = True
+    beans.count.return_value = 3
+    beans.memory_bytes.return_value = 2**20
+    mock_index.list_collections.return_value = [beans]
+
+    response = client.get("/collections")
+    assert response.status_code == 200
+    assert response.json()["collections"] == [{"name": "beans", "loaded": True, "count": 3, "memory_mb": 1.0,
+                                               "dim": 512, "space": "cosine", "M": 16, "ef_construction": 200,
+                                               "ef_search": 50, "quantization": "none", "generation": None}]
+
+@patch("server.main.HNSWIndexSingleton")
+def test_rollback_collection(mock_index):
+    previous = MagicMock(params=MagicMock(dim=512, space="cosine", M=16, ef_construction=200, ef_search=50,
+                                          quantization="none"))
+    previous.name, previous.generation = "beans", "job1"
+    previous.is_loaded.return_value = True
+    previous.count.return_value = 3
+    previous.memory_bytes.return_value = 0
+    mock_index.rollback.return_value = previous
+
+    response = client.post("/collections/beans/rollback")
+    assert response.status_code == 200
+    assert response.json()["generation"] == "job1"
+    mock_index.rollback.assert_called_once_with("beans")
+
+    mock_index.rollback.side_effect = ValueError("Collection 'beans' has no previous generation")
+    assert client.post("/collections/beans/rollback").status_code == 409
+
+@patch("server.main.HNSWIndexSingleton")
+@patch("server.main.get_encoder")
+def test_search_encoding_failure(mock_get_encoder, mock_index):
     mock_index.is_ready.return_value = True
     mock_client = MagicMock()
-    mock_client.encode_text.side_effect = Exception("fail encoding")
-    mock_clip_client_cls.return_value = mock_client
+    mock_client.encode_texts_async = AsyncMock(side_effect=Exception("fail encoding"))
+    mock_get_encoder.return_value = mock_client
 
     response = client.get("/search", params={"query": "a cat"})
     assert response.status_code == 500
     assert response.json()["detail"] == "Failed to encode query text."
 
 
+# ────────────────────────────────────────────────────────────────
+# Test POST /search/batch
+# ────────────────────────────────────────────────────────────────
+
+@patch("server.main.HNSWIndexSingleton")
+@patch("server.main.get_encoder")
+def test_search_batch_single_encode_and_query(mock_get_encoder, mock_index):
+    mock_index.is_ready.return_value = True
+    mock_index.version.return_value = 1
+    mock_index.query_batch.side_effect = lambda vecs, ks, collection, quality, ef: [
+        ([f"/img/{i}.jpg" for i in range(k)], [0.9] * k) for k in ks
+    ]
+    mock_client = MagicMock()
+    mock_client.encode_texts_async = AsyncMock(side_effect=lambda texts: np.random.rand(len(texts), 512).astype(np.float32))
+    mock_get_encoder.return_value = mock_client
+
+    payload = {"queries": [{"query": "a cat", "k": 2}, {"query": "a dog", "k": 3}, {"query": "A cat", "k": 1}]}
+    response = client.post("/search/batch", json=payload)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [len(r["results"]) for r in results] == [2, 3, 1]
+    # Duplicate queries are encoded once, all queries are searched in one call
+    mock_client.encode_texts_async.assert_awaited_once_with(["a cat", "a dog"])
+    assert mock_index.query_batch.call_count == 1
+    vecs, ks = mock_index.query_batch.call_args.args
+    assert vecs.shape == (3, 512) and ks == [2, 3, 1]
+
+@patch("server.main.HNSWIndexSingleton")
+@patch("server.main.get_encoder")
+def test_search_batch_encoding_failure(mock_get_encoder, mock_index):
+    mock_index.is_ready.return_value = True
+    mock_client = MagicMock()
+    mock_client.encode_texts_async = AsyncMock(side_effect=Exception("fail encoding"))
+    mock_get_encoder.return_value = mock_client
+
+    response = client.post("/search/batch", json={"queries": [{"query": "a cat"}]})
+    assert response.status_code == 500
+
+def test_search_batch_rejects_empty_request():
+    response = client.post("/search/batch", json={"queries": []})
+    assert response.status_code == 422
+
+
 # ────────────────────────────────────────────────────────────────
 # Test POST /index/build
 # ────────────────────────────────────────────────────────────────
 
-@patch("server.main.build_index")
-def test_build_index_success(mock_build_index):
+def _job(status="queued", **overrides):
+    job = {
+        "id": "job123", "params": {"dataset_repo": "user/repo", "split": "train"},
+        "status": status, "seen": 0, "embedded": 0, "failed": 0, "checkpoint_offset": 0,
+        "cancel_requested": False, "created_at": 1.0, "updated_at": 1.0,
+    }
+    job.update(overrides)
+    return job
+
+@patch("server.main.build_jobs")
+def test_build_index_success(mock_build_jobs):
+    mock_build_jobs.submit.return_value = _job()
     payload = {
         "dataset_repo": "user/repo",
         "split": "train",
         "image_column": "image"
     }
     response = client.post("/index/build", json=payload)
-    assert response.status_code == 200
-    assert response.json() == {
-        "status": "completed",
-        "dataset": "user/repo"
-    }
+    assert response.status_code == 202
+    body = response.json()
+    assert body["job_id"] == "job123"
+    assert body["status"] == "queued"
+    assert body["dataset"] == "user/repo"
+    submitted = mock_build_jobs.submit.call_args.args[0]
+    assert submitted["dataset_repo"] == "user/repo"
+    assert submitted["batch_size"] == 32
 
-@patch("server.main.build_index")
-def test_build_index_failure(mock_build_index):
-    mock_build_index.side_effect = Exception("build error")
+@patch("server.main.build_jobs")
+def test_build_index_failure(mock_build_jobs):
+    mock_build_jobs.submit.side_effect = Exception("queue error")
     payload = {
         "dataset_repo": "user/repo",
         "split": "train",
@@ -98,4 +269,65 @@ def test_build_index_failure(mock_build_index):
     }
     response = client.post("/index/build", json=payload)
     assert response.status_code == 500
-    assert response.json()["detail"] == "Failed to build index."
+    assert response.json()["detail"] == "Failed to queue index build."
+
+@patch("server.main.build_jobs")
+def test_get_build_job_progress(mock_build_jobs):
+    mock_build_jobs.get.return_value = _job("running", seen=120, embedded=100, failed=2, total=1000,
+                                            throughput=25.0, eta_s=35.2)
+    response = client.get("/index/build/job123")
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["seen"], body["embedded"], body["failed"], body["total"]) == (120, 100, 2, 1000)
+    assert body["eta_s"] == 35.2
+
+@patch("server.main.build_jobs")
+def test_get_build_job_not_found(mock_build_jobs):
+    mock_build_jobs.get.return_value = None
+    response = client.get("/index/build/missing")
+    assert response.status_code == 404
+
+@patch("server.main.build_jobs")
+def test_cancel_build_job(mock_build_jobs):
+    mock_build_jobs.cancel.return_value = _job("running", cancel_requested=True)
+    response = client.post("/index/build/job123/cancel")
+    assert response.status_code == 200
+    assert response.json()["cancel_requested"] is True
+    mock_build_jobs.cancel.assert_called_once_with("job123")
+
+
+# ────────────────────────────────────────────────────────────────
+# Test GET /metrics
+# ────────────────────────────────────────────────────────────────
+
+@patch("server.main.HNSWIndexSingleton")
+@patch("server.main.get_encoder")
+def test_metrics_report_requests_errors_and_index_state(mock_get_encoder, mock_index):
+    mock_index.is_ready.return_value = True
+    mock_index.version.return_value = 1
+    mock_index.query.return_value = (["/img/1.jpg"], [0.9])
+    mock_index.exists.side_effect = lambda name: name != "missing"
+    beans = MagicMock()
+    beans.name = "beans"
+    beans.is_loaded.return_value = True
+    beans.count.return_value, beans.capacity.return_value, beans.memory_bytes.return_value = 3, 1024, 4096
+    mock_index.list_collections.return_value = [beans]
+    mock_client = MagicMock(backend="fake")
+    mock_client.encode_texts_async = AsyncMock(side_effect=lambda texts: np.random.rand(len(texts), 512).astype(np.float32))
+    mock_get_encoder.return_value = mock_client
+
+    assert client.get("/search", params={"query": "a metered cat", "k": 1}).status_code == 200
+    assert client.get("/search", params={"query": "a cat", "collection": "missing"}).status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'visionsearch_http_request_seconds_count{method="GET",route="/search",status="200"}' in body
+    assert 'visionsearch_http_errors_total{method="GET",route="/search",status="404"}' in body
+    assert 'visionsearch_encode_seconds_bucket{kind="text",backend="fake",le="+Inf"}' in body
+    assert 'visionsearch_response_serialize_seconds_count{endpoint="search"}' in body
+    assert 'visionsearch_index_capacity{collection="beans"} 1024.0' in body
+
+    beans.is_loaded.return_value = False  # evicted: no longer reported
+    assert 'collection="beans"' not in client.get("/metrics").text
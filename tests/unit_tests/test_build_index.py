@@ -1,3 +1,4 @@
+import time
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
 from io import BytesIO
@@ -5,7 +6,14 @@ import numpy as np
 from PIL import Image
 from uuid import uuid4
 
-from scripts.build_index import build_index
+from scripts.build_index import build_index, prepare_image_payload
+from server.embedding_store import EmbeddingCache
+
+@pytest.fixture(autouse=True)
+def embedding_cache_dir(monkeypatch, tmp_path):
+    path = str(tmp_path / "embeddings")
+    monkeypatch.setattr("scripts.build_index.EMBEDDING_CACHE_DIR", path)
+    return path
 
 # Assuming your build_index function is imported like so:
 # from scripts.build_index import build_index
@@ -20,16 +28,15 @@ def dummy_dataset():
 
 @patch("scripts.build_index.load_dataset")
 @patch("scripts.build_index.HNSWIndexSingleton")
-@patch("scripts.build_index.CLIPSageMakerClient")
+@patch("scripts.build_index.get_encoder")
 @patch("scripts.build_index.Image")
-@patch("os.makedirs")
-@patch("os.path.join", side_effect=lambda *args: "/fake/path/" + "_".join(args[1:]))
-def test_build_index_happy_path(mock_join, mock_makedirs, mock_image, mock_clip_client_cls, mock_index_singleton, mock_load_dataset, dummy_dataset):
+def test_build_index_happy_path(mock_image, mock_get_encoder, mock_index_singleton, mock_load_dataset, dummy_dataset):
     # Mocks
     mock_load_dataset.return_value = iter(dummy_dataset)
     
     mock_img = MagicMock()
     mock_img.convert.return_value = mock_img
+    mock_img.size = (64, 64)
     mock_img.save.return_value = None
     mock_img.close.return_value = None
     mock_img.__enter__.return_value = mock_img
@@ -37,30 +44,30 @@ def test_build_index_happy_path(mock_join, mock_makedirs, mock_image, mock_clip_
     mock_image.open.return_value = mock_img
 
     mock_clip_client = MagicMock()
-    mock_clip_client.encode_image.return_value = np.random.rand(512).astype(np.float32)
-    mock_clip_client_cls.return_value = mock_clip_client
+    mock_clip_client.encode_images.return_value = np.random.rand(1, 512).astype(np.float32)
+    mock_get_encoder.return_value = mock_clip_client
 
     mock_index = MagicMock()
     mock_index.ensure_ready.return_value = None
-    mock_index.add_items.return_value = None
+    mock_index.add_batch.return_value = None
     mock_index.save.return_value = None
-    mock_index_singleton.ensure_ready.return_value = None
-    mock_index_singleton.add_items.return_value = None
-    mock_index_singleton.save.return_value = None
+    mock_index_singleton.collection.return_value.ensure_ready.return_value = None
+    mock_index_singleton.collection.return_value.add_batch.return_value = None
+    mock_index_singleton.collection.return_value.save.return_value = None
 
     build_index("dummy/repo")
 
     # Validations
     assert mock_load_dataset.called
-    assert mock_clip_client.encode_image.call_count == 1  # One valid image
-    assert mock_index_singleton.add_items.call_count == 1
-    assert mock_index_singleton.save.called
+    assert mock_clip_client.encode_images.call_count == 1  # One valid image, one batch
+    assert mock_index_singleton.collection.return_value.add_batch.call_count == 1
+    assert mock_index_singleton.collection.return_value.save.called
 
 @patch("scripts.build_index.load_dataset")
 @patch("scripts.build_index.HNSWIndexSingleton")
-@patch("scripts.build_index.CLIPSageMakerClient")
+@patch("scripts.build_index.get_encoder")
 @patch("scripts.build_index.Image")
-def test_build_index_image_error(mock_image, mock_clip_client_cls, mock_index_singleton, mock_load_dataset):
+def test_build_index_image_error(mock_image, mock_get_encoder, mock_index_singleton, mock_load_dataset):
     # Dataset with corrupted image bytes
     mock_load_dataset.return_value = iter([
         {"image": {"bytes": b"not an image"}},
@@ -69,10 +76,165 @@ def test_build_index_image_error(mock_image, mock_clip_client_cls, mock_index_si
     mock_image.open.side_effect = Image.UnidentifiedImageError("Invalid image")
 
     mock_clip_client = MagicMock()
-    mock_clip_client_cls.return_value = mock_clip_client
+    mock_get_encoder.return_value = mock_clip_client
 
     build_index("dummy/broken")
 
-    assert not mock_clip_client.encode_image.called
-    assert not mock_index_singleton.add_items.called
-    assert mock_index_singleton.save.called
+    assert not mock_clip_client.encode_images.called
+    assert not mock_index_singleton.collection.return_value.add_batch.called
+    assert mock_index_singleton.collection.return_value.save.called
+
+@patch("scripts.build_index.load_dataset")
+@patch("scripts.build_index.HNSWIndexSingleton")
+@patch("scripts.build_index.get_encoder")
+@patch("scripts.build_index.Image")
+def test_build_index_micro_batches(mock_image, mock_get_encoder, mock_index_singleton, mock_load_dataset):
+    # Five valid records with batch_size=2 -> batches of 2, 2 and a final partial 1
+    mock_load_dataset.return_value = iter([{"image": {"bytes": b"img%d" % i}} for i in range(5)])
+    mock_img = MagicMock()
+    mock_img.convert.return_value = mock_img
+    mock_img.size = (64, 64)
+    mock_image.open.return_value = mock_img
+
+    mock_clip_client = MagicMock()
+    mock_clip_client.encode_images.side_effect = lambda batch: np.random.rand(len(batch), 512).astype(np.float32)
+    mock_get_encoder.return_value = mock_clip_client
+
+    build_index("dummy/repo", batch_size=2, max_wait_s=60)
+
+    batch_sizes = [len(c.args[0]) for c in mock_clip_client.encode_images.call_args_list]
+    assert batch_sizes == [2, 2, 1]
+    assert mock_index_singleton.collection.return_value.add_batch.call_count == 3
+
+@patch("scripts.build_index.load_dataset")
+@patch("scripts.build_index.HNSWIndexSingleton")
+@patch("scripts.build_index.get_encoder")
+@patch("scripts.build_index.Image")
+def test_build_index_resumes_and_checkpoints(mock_image, mock_get_encoder, mock_index_singleton, mock_load_dataset):
+    dataset = MagicMock()
+    dataset.info.splits = {"train": MagicMock(num_examples=10)}
+    dataset.skip.return_value = iter([{"image": {"bytes": b"img%d" % i}} for i in range(4)])
+    mock_load_dataset.return_value = dataset
+    mock_img = MagicMock()
+    mock_img.convert.return_value = mock_img
+    mock_img.size = (64, 64)
+    mock_image.open.return_value = mock_img
+
+    mock_clip_client = MagicMock()
+    mock_clip_client.encode_images.side_effect = lambda batch: np.random.rand(len(batch), 512).astype(np.float32)
+    mock_get_encoder.return_value = mock_clip_client
+
+    checkpoints = []
+    stats = build_index("dummy/repo", batch_size=2, max_wait_s=60, decode_workers=1, start_offset=6,
+                        checkpoint_every=2, on_checkpoint=lambda s: checkpoints.append(s.offset))
+
+    dataset.skip.assert_called_once_with(6)
+    assert (stats.embedded, stats.offset, stats.total) == (4, 10, 10)
+    assert checkpoints[-1] == 10
+    # The index is saved before every reported checkpoint
+    assert mock_index_singleton.collection.return_value.save.call_count == len(checkpoints)
+
+@patch("scripts.build_index.load_dataset")
+@patch("scripts.build_index.HNSWIndexSingleton")
+@patch("scripts.build_index.get_encoder")
+@patch("scripts.build_index.Image")
+def test_rebuild_fills_a_staged_generation_and_promotes_it(mock_image, mock_get_encoder, mock_index_singleton,
+                                                           mock_load_dataset):
+    mock_load_dataset.return_value = iter([{"image": {"bytes": b"img%d" % i}} for i in range(3)])
+    mock_img = MagicMock()
+    mock_img.convert.return_value = mock_img
+    mock_img.size = (64, 64)
+    mock_image.open.return_value = mock_img
+    mock_clip_client = MagicMock()
+    mock_clip_client.encode_images.side_effect = lambda batch: np.random.rand(len(batch), 512).astype(np.float32)
+    mock_get_encoder.return_value = mock_clip_client
+    staged = mock_index_singleton.stage.return_value
+
+    build_index("dummy/repo", decode_workers=1, collection="beans", index_params={"M": 32}, rebuild="job1")
+
+    mock_index_singleton.stage.assert_called_once_with("beans", "job1", M=32)
+    assert staged.add_batch.called and not mock_index_singleton.collection.return_value.add_batch.called
+    mock_index_singleton.promote.assert_called_once_with("beans", staged)
+
+def _encoded(fmt, size):
+    buf = BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, format=fmt)
+    return buf.getvalue()
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_prepare_image_payload_passes_jpeg_and_png_through(fmt):
+    data = _encoded(fmt, (640, 480))
+    assert prepare_image_payload(data) is data
+
+def test_prepare_image_payload_resizes_other_formats_to_clip_input():
+    payload = prepare_image_payload(_encoded("BMP", (640, 480)))
+    with Image.open(BytesIO(payload)) as img:
+        assert (img.format, img.size) == ("JPEG", (224, 224))
+
+def test_prepare_image_payload_rejects_garbage():
+    with pytest.raises(Image.UnidentifiedImageError):
+        prepare_image_payload(b"not an image")
+
+@patch("scripts.build_index.load_dataset")
+@patch("scripts.build_index.HNSWIndexSingleton")
+@patch("scripts.build_index.get_encoder")
+def test_build_index_skips_duplicates_and_reuses_cached_embeddings(mock_get_encoder, mock_index_singleton,
+                                                                   mock_load_dataset, embedding_cache_dir):
+    images = [_encoded("PNG", (32, 32 + i)) for i in range(3)]
+    mock_clip_client = MagicMock(model_id="clip-test")
+    mock_clip_client.encode_images.side_effect = lambda batch: np.random.rand(len(batch), 8).astype(np.float32)
+    mock_get_encoder.return_value = mock_clip_client
+
+    # First build: the repeated image is only embedded and indexed once
+    mock_load_dataset.return_value = iter([{"image": {"bytes": b}} for b in images + images[:1]])
+    stats = build_index("dummy/repo", batch_size=8, max_wait_s=60)
+    assert (stats.embedded, stats.skipped) == (3, 1)
+    assert sum(len(c.args[0]) for c in mock_clip_client.encode_images.call_args_list) == 3
+    first = np.vstack([c.args[0] for c in mock_index_singleton.collection.return_value.add_batch.call_args_list])
+    meta = sorted((m for c in mock_index_singleton.collection.return_value.add_batch.call_args_list for m in c.args[1]), key=lambda m: m.row)
+    assert [(m.dataset, m.split, m.row, m.path) for m in meta] == [
+        ("dummy/repo", "train", i, f"hf://dummy/repo/train/{i}") for i in range(3)
+    ]
+    assert len({m.content_hash for m in meta}) == 3
+
+    # Rebuild: every embedding comes from the on-disk cache
+    mock_clip_client.encode_images.reset_mock()
+    mock_index_singleton.collection.return_value.add_batch.reset_mock()
+    mock_load_dataset.return_value = iter([{"image": {"bytes": b}} for b in images])
+    stats = build_index("dummy/repo", batch_size=8, max_wait_s=60)
+    assert stats.embedded == 3
+    assert not mock_clip_client.encode_images.called
+    second = np.vstack([c.args[0] for c in mock_index_singleton.collection.return_value.add_batch.call_args_list])
+    assert sorted(map(tuple, first)) == sorted(map(tuple, second))
+    assert len(EmbeddingCache(embedding_cache_dir, "clip-test")) == 3
+
+@patch("scripts.build_index.load_dataset")
+@patch("scripts.build_index.HNSWIndexSingleton")
+@patch("scripts.build_index.get_encoder")
+def test_build_index_indexes_a_duplicate_whose_first_copy_failed(mock_get_encoder, mock_index_singleton,
+                                                                 mock_load_dataset):
+    import threading
+    image = _encoded("PNG", (32, 32))
+    failed = threading.Event()
+
+    def encode(batch):
+        if not failed.is_set():
+            failed.set()
+            raise RuntimeError("endpoint error")
+        return np.random.rand(len(batch), 8).astype(np.float32)
+
+    def records():
+        yield {"image": {"bytes": image}}
+        failed.wait(5)
+        time.sleep(0.2)  # let the failed batch release its key
+        yield {"image": {"bytes": image}}
+
+    mock_clip_client = MagicMock(model_id="clip-test")
+    mock_clip_client.encode_images.side_effect = encode
+    mock_get_encoder.return_value = mock_clip_client
+    mock_load_dataset.return_value = records()
+
+    stats = build_index("dummy/repo", batch_size=1, max_wait_s=0.01, decode_workers=1, max_inflight=1)
+    assert (stats.failed, stats.embedded, stats.skipped) == (1, 1, 0)
+    meta = [m for c in mock_index_singleton.collection.return_value.add_batch.call_args_list for m in c.args[1]]
+    assert [m.row for m in meta] == [1]
@@ -0,0 +1,42 @@
+import time
+import pytest
+
+from server.cache import TTLCache, normalize_query
+
+
+@pytest.mark.unit
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl_s=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+@pytest.mark.unit
+def test_entries_expire_after_ttl():
+    cache = TTLCache(maxsize=10, ttl_s=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.unit
+def test_stats_count_hits_and_misses():
+    cache = TTLCache(maxsize=10, ttl_s=60)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+
+
+@pytest.mark.unit
+def test_normalize_query_ignores_case_and_whitespace():
+    assert normalize_query("  A   photo of\tA Cat ") == "a photo of a cat"
@@ -0,0 +1,72 @@
+import asyncio
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from server.coalescer import TextEncodeCoalescer
+
+
+def _encoder():
+    encoder = MagicMock()
+    encoder.encode_texts_async = AsyncMock(
+        side_effect=lambda texts: np.array([[float(len(t)), 0.0] for t in texts], dtype=np.float32)
+    )
+    return encoder
+
+
+@pytest.mark.unit
+def test_concurrent_encodes_share_one_request():
+    encoder = _encoder()
+    coalescer = TextEncodeCoalescer(lambda: encoder, window_ms=20, max_batch=32)
+
+    async def run():
+        return await asyncio.gather(*(coalescer.encode(t) for t in ["a", "bb", "ccc", "bb"]))
+
+    vecs = asyncio.run(run())
+
+    encoder.encode_texts_async.assert_awaited_once_with(["a", "bb", "ccc"])
+    assert [v.shape for v in vecs] == [(1, 2)] * 4
+    assert [v[0, 0] for v in vecs] == [1.0, 2.0, 3.0, 2.0]
+    assert coalescer.stats()["requests"] == 4 and coalescer.stats()["batches"] == 1
+
+
+@pytest.mark.unit
+def test_max_batch_flushes_without_waiting_for_window():
+    encoder = _encoder()
+    coalescer = TextEncodeCoalescer(lambda: encoder, window_ms=10_000, max_batch=2)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(*(coalescer.encode(t) for t in ["a", "b", "c", "d"])), 1)
+
+    asyncio.run(run())
+    assert [c.args[0] for c in encoder.encode_texts_async.await_args_list] == [["a", "b"], ["c", "d"]]
+
+
+@pytest.mark.unit
+def test_errors_reach_every_waiting_caller():
+    encoder = MagicMock()
+    encoder.encode_texts_async = AsyncMock(side_effect=RuntimeError("endpoint down"))
+    coalescer = TextEncodeCoalescer(lambda: encoder, window_ms=5)
+
+    async def run():
+        return await asyncio.gather(coalescer.encode("a"), coalescer.encode("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.unit
+def test_short_encoder_response_fails_every_caller_and_tasks_are_released():
+    encoder = MagicMock()
+    encoder.encode_texts_async = AsyncMock(return_value=np.zeros((1, 2), dtype=np.float32))
+    coalescer = TextEncodeCoalescer(lambda: encoder, window_ms=5)
+
+    async def run():
+        results = await asyncio.wait_for(
+            asyncio.gather(coalescer.encode("a"), coalescer.encode("b"), return_exceptions=True), 1)
+        await asyncio.sleep(0)  # let the done callback run
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert not coalescer._tasks
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import server.embedding_store as embedding_store
+from server.embedding_store import EmbeddingCache, content_key
+
+
+def _vectors(n, dim=4, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+@pytest.mark.unit
+def test_put_get_roundtrip_and_reopen(tmp_path):
+    keys = [content_key(b"a"), content_key(b"b")]
+    vectors = _vectors(2)
+    cache = EmbeddingCache(str(tmp_path), "model-a")
+    cache.put_many(keys, vectors)
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "model-a")
+    assert len(reopened) == 2
+    np.testing.assert_array_equal(reopened.get(keys[1]), vectors[1])
+    assert reopened.get(content_key(b"c")) is None
+    assert (reopened.hits, reopened.misses) == (1, 1)
+
+
+@pytest.mark.unit
+def test_unflushed_rows_are_not_persisted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model-a")
+    cache.put_many([content_key(b"a")], _vectors(1))
+    cache.flush()
+    cache.put_many([content_key(b"b")], _vectors(1, seed=1))
+
+    reopened = EmbeddingCache(str(tmp_path), "model-a")
+    assert content_key(b"a") in reopened
+    assert content_key(b"b") not in reopened
+
+
+@pytest.mark.unit
+def test_models_are_kept_apart(tmp_path):
+    key = content_key(b"a")
+    EmbeddingCache(str(tmp_path), "model-a").put_many([key], _vectors(1))
+    assert EmbeddingCache(str(tmp_path), "model-b").get(key) is None
+
+
+@pytest.mark.unit
+def test_grows_past_initial_capacity_and_ignores_known_keys(tmp_path):
+    keys = [content_key(str(i).encode()) for i in range(3000)]
+    vectors = _vectors(3000)
+    cache = EmbeddingCache(str(tmp_path), "model-a")
+    cache.put_many(keys[:10], vectors[:10])
+    cache.put_many(keys, vectors)
+    cache.put_many(keys[:1], _vectors(1, seed=9))  # already cached: not overwritten
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "model-a")
+    assert len(reopened) == 3000
+    np.testing.assert_array_equal(reopened.get(keys[0]), vectors[0])
+    np.testing.assert_array_equal(reopened.get(keys[2999]), vectors[2999])
+
+
+@pytest.mark.unit
+def test_lookups_span_the_sorted_index_and_recent_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "_MIN_RECENT", 8)
+    keys = [content_key(str(i).encode()) for i in range(101)]
+    vectors = _vectors(101)
+    cache = EmbeddingCache(str(tmp_path), "model-a")
+    for lo in range(0, 100, 5):
+        cache.put_many(keys[lo:lo + 5] + keys[:2], np.vstack([vectors[lo:lo + 5], _vectors(2, seed=9)]))
+    cache.put_many(keys[100:], vectors[100:])
+    assert (len(cache._keys), len(cache._recent), len(cache)) == (100, 1, 101)
+    merged = [bytes(key) for key in cache._keys]
+    assert merged == sorted(set(merged))  # merged keys stay sorted and unique
+    for i in (0, 37, 99, 100):
+        np.testing.assert_array_equal(cache.get(keys[i]), vectors[i])
+    assert content_key(b"missing") not in cache
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "model-a")
+    assert len(reopened) == 101 and not reopened._recent
+    np.testing.assert_array_equal(reopened.get(keys[100]), vectors[100])
+
+
+@pytest.mark.unit
+def test_rejects_mismatched_dim(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model-a")
+    cache.put_many([content_key(b"a")], _vectors(1, dim=4))
+    with pytest.raises(ValueError):
+        cache.put_many([content_key(b"b")], _vectors(1, dim=8))
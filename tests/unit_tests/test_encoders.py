@@ -0,0 +1,65 @@
+import time
+import asyncio
+import numpy as np
+import pytest
+from PIL import Image
+
+from server.encoders import FakeEncoder, LocalCLIPEncoder, create_encoder
+
+
+@pytest.mark.unit
+def test_fake_encoder_is_deterministic_unit_vectors():
+    a, b = FakeEncoder(dim=64, seed=1), FakeEncoder(dim=64, seed=1)
+
+    texts = a.encode_texts(["a cat", "a dog", "a cat"])
+
+    assert texts.shape == (3, 64) and texts.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(texts, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(texts[0], texts[2])
+    np.testing.assert_array_equal(texts, b.encode_texts(["a cat", "a dog", "a cat"]))
+    assert not np.allclose(texts[0], FakeEncoder(dim=64, seed=2).encode_text("a cat")[0])
+
+    images = a.encode_images([b"\xff\xd8jpeg", Image.new("RGB", (4, 4))])
+    assert images.shape == (2, 64)
+
+
+@pytest.mark.unit
+def test_fake_encoder_simulates_latency():
+    encoder = FakeEncoder(dim=8, latency_ms=20, per_item_ms=5)
+    start = time.perf_counter()
+    encoder.encode_texts(["a", "b"])
+    assert time.perf_counter() - start >= 0.03
+
+    start = time.perf_counter()
+    asyncio.run(encoder.encode_text_async("a"))
+    assert time.perf_counter() - start >= 0.025
+
+
+@pytest.mark.unit
+def test_local_encoder_reuses_inference_module(tmp_path):
+    inference = tmp_path / "inference.py"
+    inference.write_text(
+        "import numpy as np\n"
+        "def model_fn(model_dir):\n"
+        "    return {'dim': 4}\n"
+        "def predict_fn(inputs, context):\n"
+        "    return np.ones((len(inputs), context['dim']), dtype=np.float32) / 2\n"
+    )
+    encoder = LocalCLIPEncoder(model_dir="dummy-model", inference_path=str(inference))
+
+    assert encoder.encode_texts(["a", "b"]).shape == (2, 4)
+    assert encoder.encode_images([Image.new("RGB", (4, 4))]).shape == (1, 4)
+    assert encoder.model_id == "dummy-model"
+
+
+@pytest.mark.unit
+def test_create_encoder_selects_backend():
+    assert create_encoder("fake").backend == "fake"
+    with pytest.raises(ValueError):
+        create_encoder("nope")
+
+
+@pytest.mark.unit
+def test_local_encoder_names_the_variable_when_inference_code_is_missing(tmp_path):
+    with pytest.raises(FileNotFoundError, match="LOCAL_CLIP_INFERENCE_PATH"):
+        LocalCLIPEncoder(model_dir="dummy-model", inference_path=str(tmp_path / "missing.py"))
@@ -0,0 +1,43 @@
+import hnswlib
+import numpy as np
+import pytest
+
+from server.exact_search import IndexRows, exact_knn
+
+
+def _naive(base, queries, k, space):
+    if space == "l2":
+        distances = ((queries[:, None, :] - base[None, :, :]) ** 2).sum(-1)
+    else:
+        distances = 1 - queries @ base.T
+    return np.argsort(distances, axis=1)[:, :k]
+
+@pytest.mark.unit
+@pytest.mark.parametrize("space", ["ip", "l2"])
+@pytest.mark.parametrize("num_threads", [1, -1])
+def test_blocked_search_matches_a_full_sort(space, num_threads):
+    rng = np.random.default_rng(0)
+    base, queries = rng.random((1000, 16), dtype=np.float32), rng.random((30, 16), dtype=np.float32)
+    labels, distances = exact_knn(base, queries, 7, space, num_threads=num_threads, block_rows=64)
+    np.testing.assert_array_equal(labels, _naive(base, queries, 7, space))
+    assert labels.shape == distances.shape == (30, 7) and labels.dtype == np.uint64
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+@pytest.mark.unit
+def test_matches_hnswlib_distances_and_reads_index_rows():
+    rng = np.random.default_rng(1)
+    vectors = rng.random((200, 16), dtype=np.float32)
+    index = hnswlib.Index(space="cosine", dim=16)
+    index.init_index(max_elements=200, ef_construction=200, M=16)
+    index.add_items(vectors, np.arange(200))
+    index.set_ef(200)
+
+    labels, distances = exact_knn(IndexRows(index, 200, 16), vectors[:5] * 3, 5, "cosine", block_rows=50)
+    expected_labels, expected_distances = index.knn_query(vectors[:5], k=5)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(distances, expected_distances, atol=1e-5)
+
+@pytest.mark.unit
+def test_raises_like_hnswlib_when_short():
+    with pytest.raises(RuntimeError, match="contiguous 2D array"):
+        exact_knn(np.ones((3, 4), dtype=np.float32), np.ones(4, dtype=np.float32), k=4)
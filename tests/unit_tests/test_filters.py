@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from server.filters import AttributeBitsets, SearchFilter
+
+
+@pytest.mark.unit
+def test_mask_ands_terms_and_grows():
+    bitsets = AttributeBitsets()
+    rows = [("beans", "train", str(i % 3)) for i in range(1500)] + [("cifar", "test", "0")] * 10
+    bitsets.extend(0, rows[:1000])
+    bitsets.extend(1000, rows[1000:])
+
+    mask = bitsets.mask(SearchFilter(dataset="beans", class_label="1"))
+    assert mask.shape == (1510,)
+    assert np.array_equal(np.flatnonzero(mask), np.arange(1, 1500, 3))
+    assert bitsets.mask(SearchFilter(dataset="cifar")).sum() == 10
+
+
+@pytest.mark.unit
+def test_unknown_value_matches_nothing():
+    bitsets = AttributeBitsets()
+    bitsets.extend(0, [("beans", "train", None)])
+    assert not bitsets.mask(SearchFilter(split="validation")).any()
+    assert not bitsets.mask(SearchFilter(class_label="0")).any()
+    assert SearchFilter().is_empty()
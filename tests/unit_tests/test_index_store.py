@@ -1,22 +1,23 @@
 import os
 import numpy as np
 import pytest
-from src.server.index_store import HNSWIndexSingleton
+from unittest.mock import patch
+from src.server.index_store import CollectionNotFound, HNSWIndex, HNSWIndexSingleton
+from server.metadata_store import ItemMetadata, MetadataStore
+from server.filters import SearchFilter
 
 @pytest.mark.unit
 def test_query_triggers_auto_load():
     """Query should automatically load the index if not ready."""
-    HNSWIndexSingleton._index = None
-    HNSWIndexSingleton._ready = False
-    HNSWIndexSingleton._image_paths = []
+    HNSWIndexSingleton.reset()
 
     dummy_vecs = [np.random.rand(512).astype(np.float32)]
     dummy_paths = ["image_0.jpg"]
     HNSWIndexSingleton.load()
     HNSWIndexSingleton.add_items(dummy_vecs, dummy_paths)
 
-    # Reset ready flag to simulate "unloaded" state
-    HNSWIndexSingleton._ready = False
+    # Withdraw the published view to simulate "unloaded" state
+    HNSWIndexSingleton.collection()._view = None
     query_vec = np.random.rand(512).astype(np.float32)
     
     # Should succeed — not raise
@@ -28,23 +29,23 @@ def test_query_triggers_auto_load():
 @pytest.mark.unit
 def test_load_creates_index():
     """Ensure index is initialized on first load call."""
-    HNSWIndexSingleton._index = None
-    HNSWIndexSingleton._ready = False
-    HNSWIndexSingleton._image_paths = []
+    HNSWIndexSingleton.reset()
 
     HNSWIndexSingleton.load()
-    assert HNSWIndexSingleton._index is not None
-    assert HNSWIndexSingleton._ready is True
+    assert HNSWIndexSingleton.collection()._index is not None
+    assert HNSWIndexSingleton.is_ready() is True
 
 @pytest.mark.unit
 def test_is_ready_reflects_state():
     """Test that is_ready() returns correct readiness flag."""
-    HNSWIndexSingleton._ready = False
     assert not HNSWIndexSingleton.is_ready()
 
-    HNSWIndexSingleton._ready = True
+    HNSWIndexSingleton.load()
     assert HNSWIndexSingleton.is_ready()
 
+    HNSWIndexSingleton.unload()
+    assert not HNSWIndexSingleton.is_ready()
+
 @pytest.mark.unit
 def test_add_items_and_query():
     """Test that added vectors can be queried successfully."""
@@ -65,9 +66,7 @@ def test_add_items_and_query():
 def test_query_on_unloaded_index_is_safe():
     """If the index isn't loaded, query should load it and handle an empty index gracefully."""
     # Reset singleton
-    HNSWIndexSingleton._index = None
-    HNSWIndexSingleton._ready = False
-    HNSWIndexSingleton._image_paths = []
+    HNSWIndexSingleton.reset()
 
     HNSWIndexSingleton.load()
 
@@ -81,13 +80,11 @@ def test_save_creates_files(tmp_path):
     """Test that the save() method creates index and metadata files."""
 
     # 1. Reset singleton state
-    HNSWIndexSingleton._index = None
-    HNSWIndexSingleton._ready = False
-    HNSWIndexSingleton._image_paths = []
+    HNSWIndexSingleton.reset()
 
     # 2. Patch paths BEFORE load()
     HNSWIndexSingleton.INDEX_PATH = str(tmp_path / "test_index.bin")
-    HNSWIndexSingleton.META_PATH = str(tmp_path / "test_paths.txt")
+    HNSWIndexSingleton.META_PATH = str(tmp_path / "test_metadata.sqlite3")
 
     # 3. Load index and add dummy item
     HNSWIndexSingleton.load()
@@ -102,7 +99,568 @@ def test_save_creates_files(tmp_path):
     assert os.path.exists(HNSWIndexSingleton.INDEX_PATH)
     assert os.path.exists(HNSWIndexSingleton.META_PATH)
 
-    with open(HNSWIndexSingleton.META_PATH, "r") as f:
-        lines = [line.strip() for line in f.readlines()]
-    
-    assert lines == ["img.jpg"], f"Expected ['img.jpg'], got {lines}"
+    store = MetadataStore(HNSWIndexSingleton.META_PATH)
+    assert store.paths([0]) == ["img.jpg"]
+
+@pytest.mark.unit
+def test_add_batch_bulk_inserts_matrix():
+    """Bulk insertion accepts a (N, D) matrix and keeps the index ready throughout."""
+    HNSWIndexSingleton.load()
+    vecs = np.random.rand(20, 512).astype(np.float32)
+    ids = [f"image_{i}.jpg" for i in range(20)]
+
+    with patch("gc.collect") as mock_gc:
+        HNSWIndexSingleton.add_batch(vecs, ids)
+
+    assert not mock_gc.called
+    assert HNSWIndexSingleton.is_ready()
+    assert HNSWIndexSingleton.collection()._index.get_current_count() == 20
+
+    results, _ = HNSWIndexSingleton.query(vecs[7], k=1)
+    assert results == ["image_7.jpg"]
+
+@pytest.mark.unit
+def test_add_batch_rejects_mismatched_ids():
+    HNSWIndexSingleton.load()
+    with pytest.raises(ValueError):
+        HNSWIndexSingleton.add_batch(np.random.rand(3, 512).astype(np.float32), ["a.jpg"])
+
+@pytest.mark.unit
+def test_query_batch_returns_per_query_k():
+    HNSWIndexSingleton.load()
+    vecs = np.random.rand(10, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, [f"image_{i}.jpg" for i in range(10)])
+
+    out = HNSWIndexSingleton.query_batch(vecs[[3, 5]], ks=[1, 4])
+
+    assert [len(paths) for paths, _ in out] == [1, 4]
+    assert out[0][0] == ["image_3.jpg"]
+    assert out[1][0][0] == "image_5.jpg"
+
+@pytest.mark.unit
+def test_save_appends_metadata_incrementally_and_reloads():
+    HNSWIndexSingleton.load()
+    vecs = np.random.rand(4, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:2], [ItemMetadata(path="hf://r/train/0", dataset="r", split="train", row=0,
+                                                         content_hash="ab", class_label="cat"), "b.jpg"])
+    HNSWIndexSingleton.save()
+    HNSWIndexSingleton.add_batch(vecs[2:], ["c.jpg", "d.jpg"])
+    HNSWIndexSingleton.save()
+
+    HNSWIndexSingleton.reset()
+    HNSWIndexSingleton.load()
+    meta = HNSWIndexSingleton.get_metadata([0, 3])
+    assert (meta[0].dataset, meta[0].row, meta[0].class_label) == ("r", 0, "cat")
+    assert meta[1].path == "d.jpg"
+    assert HNSWIndexSingleton.query(vecs[2], k=1)[0] == ["c.jpg"]
+
+@pytest.mark.unit
+def test_load_imports_legacy_paths_file(tmp_path):
+    HNSWIndexSingleton.load()
+    HNSWIndexSingleton.add_batch(np.random.rand(2, 512).astype(np.float32), ["a.jpg", "b.jpg"])
+    HNSWIndexSingleton.save()
+    HNSWIndexSingleton.collection()._metadata.close()
+    os.remove(HNSWIndexSingleton.META_PATH)
+    with open(HNSWIndexSingleton.LEGACY_META_PATH, "w") as f:
+        f.write("a.jpg\nb.jpg\n")
+
+    HNSWIndexSingleton.reset()
+    HNSWIndexSingleton.load()
+    assert HNSWIndexSingleton.get_metadata([1])[0].path == "b.jpg"
+
+@pytest.mark.unit
+def test_load_drops_metadata_saved_past_the_index():
+    HNSWIndexSingleton.load()
+    HNSWIndexSingleton.add_batch(np.random.rand(2, 512).astype(np.float32), ["a.jpg", "b.jpg"])
+    HNSWIndexSingleton.save()
+    # Simulate a crash between the metadata flush and the index write
+    HNSWIndexSingleton.collection()._metadata.append([ItemMetadata(path="orphan.jpg")])
+    HNSWIndexSingleton.collection()._metadata.flush()
+
+    HNSWIndexSingleton.reset()
+    HNSWIndexSingleton.load()
+    assert len(HNSWIndexSingleton.collection()._metadata) == 2
+
+def _labelled(n):
+    return [ItemMetadata(path=f"image_{i}.jpg", dataset="beans" if i % 2 else "cifar", split="train",
+                         class_label=str(i % 5)) for i in range(n)]
+
+@pytest.mark.unit
+@pytest.mark.parametrize("exact_max", [0, 10_000])
+def test_filtered_query_only_returns_matches(monkeypatch, exact_max):
+    """Both the hnswlib filtered search and the exact scan honor the filter."""
+    monkeypatch.setattr(HNSWIndex, "FILTER_EXACT_MAX", exact_max)
+    HNSWIndexSingleton.load()
+    vecs = np.random.rand(200, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:100], _labelled(100))
+    HNSWIndexSingleton.query(vecs[0], k=1, search_filter=SearchFilter(dataset="beans"))  # builds the bitsets
+    HNSWIndexSingleton.add_batch(vecs[100:], _labelled(200)[100:])
+
+    results, scores = HNSWIndexSingleton.query(vecs[7], k=5, search_filter=SearchFilter(dataset="beans", class_label="2"))
+    ids = [int(p[len("image_"):-len(".jpg")]) for p in results]
+    assert ids[0] == 7
+    assert len(ids) == 5 and all(i % 2 == 1 and i % 5 == 2 for i in ids)
+    assert scores == sorted(scores, reverse=True)
+
+@pytest.mark.unit
+def test_filtered_query_caps_k_at_matches():
+    HNSWIndexSingleton.load()
+    vecs = np.random.rand(10, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, _labelled(10))
+
+    results, _ = HNSWIndexSingleton.query(vecs[0], k=5, search_filter=SearchFilter(class_label="3"))
+    assert sorted(results) == ["image_3.jpg", "image_8.jpg"]
+    assert HNSWIndexSingleton.query(vecs[0], k=5, search_filter=SearchFilter(dataset="missing")) == ([], [])
+
+@pytest.mark.unit
+def test_named_collections_are_isolated_and_keep_their_params():
+    vecs = np.random.rand(4, 512).astype(np.float32)
+    HNSWIndexSingleton.collection("beans", create=True, M=8, ef_search=20)
+    HNSWIndexSingleton.add_batch(vecs[:2], ["a.jpg", "b.jpg"], collection="beans")
+    HNSWIndexSingleton.add_batch(vecs[2:], ["c.jpg", "d.jpg"])
+    HNSWIndexSingleton.save("beans")
+
+    assert HNSWIndexSingleton.query(vecs[0], k=2, collection="beans")[0][0] == "a.jpg"
+    assert set(HNSWIndexSingleton.query(vecs[0], k=2)[0]) == {"c.jpg", "d.jpg"}
+
+    HNSWIndexSingleton.reset()
+    beans = HNSWIndexSingleton.collection("beans", M=32)  # existing params win
+    assert (beans.params.M, beans.params.ef_search) == (8, 20)
+    assert HNSWIndexSingleton.query(vecs[1], k=1, collection="beans")[0] == ["b.jpg"]
+    assert [c.name for c in HNSWIndexSingleton.list_collections()] == ["beans", "default"]
+
+@pytest.mark.unit
+def test_unknown_collection_raises():
+    assert not HNSWIndexSingleton.exists("missing")
+    with pytest.raises(CollectionNotFound):
+        HNSWIndexSingleton.query(np.random.rand(512).astype(np.float32), k=1, collection="missing")
+    with pytest.raises(ValueError):
+        HNSWIndexSingleton.collection("../etc", create=True)
+
+@pytest.mark.unit
+def test_memory_budget_unloads_least_recently_used_clean_collections(monkeypatch):
+    monkeypatch.setattr(HNSWIndexSingleton, "MAX_ELEMENTS", 100)
+    vecs = np.random.rand(3, 512).astype(np.float32)
+    for name, vec in zip(("a", "b"), vecs):
+        HNSWIndexSingleton.collection(name, create=True)
+        HNSWIndexSingleton.add_batch(vec[None], [f"{name}.jpg"], collection=name)
+        HNSWIndexSingleton.save(name)
+    one = HNSWIndexSingleton.collection("a").memory_bytes()
+    monkeypatch.setattr(HNSWIndexSingleton, "MEMORY_BUDGET_MB", 2.5 * one / 2**20)
+
+    # "c" has unsaved changes, so it must stay resident however far over budget we go
+    HNSWIndexSingleton.collection("c", create=True)
+    HNSWIndexSingleton.add_batch(vecs[2][None], ["c.jpg"], collection="c")
+    assert not HNSWIndexSingleton.collection("a").is_loaded()
+    assert HNSWIndexSingleton.collection("b").is_loaded()
+
+    # Evicted collections reload transparently on their next use
+    assert HNSWIndexSingleton.query(vecs[0], k=1, collection="a")[0] == ["a.jpg"]
+    assert HNSWIndexSingleton.collection("c").is_loaded()
+    assert not HNSWIndexSingleton.collection("b").is_loaded()
+
+@pytest.mark.unit
+def test_memory_budget_skips_collections_a_writer_holds(monkeypatch):
+    import threading
+    monkeypatch.setattr(HNSWIndexSingleton, "MAX_ELEMENTS", 100)
+    vecs = np.random.rand(2, 512).astype(np.float32)
+    for name, vec in zip(("a", "b"), vecs):
+        HNSWIndexSingleton.collection(name, create=True)
+        HNSWIndexSingleton.add_batch(vec[None], [f"{name}.jpg"], collection=name)
+        HNSWIndexSingleton.save(name)
+    a = HNSWIndexSingleton.collection("a")
+    monkeypatch.setattr(HNSWIndexSingleton, "MEMORY_BUDGET_MB", 1.5 * a.memory_bytes() / 2**20)
+
+    # A build or save of "a" holds its lock: searching "b" must neither wait for it nor evict it
+    with a._lock:
+        searched = threading.Thread(target=HNSWIndexSingleton.query, args=(vecs[1],),
+                                    kwargs={"k": 1, "collection": "b"})
+        searched.start()
+        searched.join(timeout=5)
+        assert not searched.is_alive()
+        assert a.is_loaded() and "a" in HNSWIndexSingleton._lru
+
+    HNSWIndexSingleton.query(vecs[1], k=1, collection="b")
+    assert not a.is_loaded() and "a" not in HNSWIndexSingleton._lru
+
+@pytest.mark.unit
+def test_add_batch_grows_capacity_past_max_elements(monkeypatch):
+    monkeypatch.setattr(HNSWIndexSingleton, "MAX_ELEMENTS", 4)
+    monkeypatch.setattr(HNSWIndex, "GROWTH_FACTOR", 2.0)
+    vecs = np.random.rand(11, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:5], [f"{i}.jpg" for i in range(5)])
+    index = HNSWIndexSingleton.collection()
+    assert index.capacity() == 8
+    HNSWIndexSingleton.add_batch(vecs[5:], [f"{i}.jpg" for i in range(5, 11)])
+    assert (index.count(), index.capacity()) == (11, 16)
+    assert HNSWIndexSingleton.query(vecs[10], k=1)[0] == ["10.jpg"]
+
+@pytest.mark.unit
+def test_reserve_presizes_exactly(monkeypatch):
+    monkeypatch.setattr(HNSWIndexSingleton, "MAX_ELEMENTS", 4)
+    HNSWIndexSingleton.add_batch(np.random.rand(3, 512).astype(np.float32), ["a.jpg", "b.jpg", "c.jpg"])
+    HNSWIndexSingleton.reserve(10)
+    assert HNSWIndexSingleton.collection().capacity() == 13
+    HNSWIndexSingleton.reserve(2)  # already fits, never shrinks
+    assert HNSWIndexSingleton.collection().capacity() == 13
+
+@pytest.mark.unit
+@pytest.mark.parametrize("exact_max_items", [0, 10_000])
+def test_queries_run_while_the_index_grows(monkeypatch, exact_max_items):
+    import threading
+    monkeypatch.setattr(HNSWIndex, "EXACT_MAX_ITEMS", exact_max_items)
+    monkeypatch.setattr(HNSWIndexSingleton, "MAX_ELEMENTS", 8)
+    vecs = np.random.rand(400, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:8], [f"{i}.jpg" for i in range(8)])
+    errors, done = [], threading.Event()
+
+    def search():
+        while not done.is_set():
+            try:
+                paths, _ = HNSWIndexSingleton.query(vecs[0], k=3)
+                assert paths[0] == "0.jpg"
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=search) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for start in range(8, 400, 8):
+        HNSWIndexSingleton.add_batch(vecs[start:start + 8], [f"{i}.jpg" for i in range(start, start + 8)])
+    done.set()
+    for t in readers:
+        t.join()
+    assert not errors
+    assert HNSWIndexSingleton.collection().capacity() >= 400
+
+@pytest.mark.unit
+def test_unsaved_inserts_are_replayed_from_the_wal():
+    vecs = np.random.rand(5, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:2], ["a.jpg", "b.jpg"])
+    HNSWIndexSingleton.save()
+    HNSWIndexSingleton.add_batch(vecs[2:], [ItemMetadata(path=f"hf://r/train/{i}", dataset="r", split="train", row=i)
+                                            for i in range(3)])
+
+    HNSWIndexSingleton.reset()  # crash: the last batch was never snapshotted
+    HNSWIndexSingleton.load()
+    index = HNSWIndexSingleton.collection()
+    assert index.count() == 5 and not index.is_dirty()
+    assert HNSWIndexSingleton.query(vecs[4], k=1)[0] == ["hf://r/train/2"]
+    assert HNSWIndexSingleton.indexed_rows("r", "train", since=1) == {1, 2}
+    assert os.path.getsize(index.wal_path) == 0  # folded into a fresh snapshot
+
+@pytest.mark.unit
+def test_torn_wal_tail_is_dropped():
+    vecs = np.random.rand(3, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:2], ["a.jpg", "b.jpg"])
+    HNSWIndexSingleton.add_batch(vecs[2:], ["c.jpg"])
+    wal_path = HNSWIndexSingleton.collection().wal_path
+    with open(wal_path, "r+b") as f:
+        f.truncate(os.path.getsize(wal_path) - 10)
+
+    HNSWIndexSingleton.reset()
+    HNSWIndexSingleton.load()
+    assert HNSWIndexSingleton.collection().count() == 2
+
+@pytest.mark.unit
+def test_snapshot_is_atomic_and_recorded_in_manifest(monkeypatch):
+    import json
+    monkeypatch.setattr(HNSWIndex, "SNAPSHOT_EVERY_ITEMS", 4)
+    vecs = np.random.rand(5, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:3], ["a.jpg", "b.jpg", "c.jpg"])
+    index = HNSWIndexSingleton.collection()
+    assert not os.path.exists(index.manifest_path)
+
+    HNSWIndexSingleton.add_batch(vecs[3:], ["d.jpg", "e.jpg"])  # crosses the item threshold
+    with open(index.manifest_path) as f:
+        manifest = json.load(f)
+    assert manifest["count"] == 5 and manifest["version"] == index.version()
+    assert not index.is_dirty()
+    assert not os.path.exists(index.index_path + ".tmp")
+
+@pytest.mark.unit
+def test_promote_swaps_generations_and_rollback_restores_the_previous_one():
+    import gc
+    import weakref
+    old_vecs, new_vecs = np.random.rand(2, 512).astype(np.float32), np.random.rand(3, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(old_vecs, ["old0.jpg", "old1.jpg"])
+    HNSWIndexSingleton.save()
+    live = HNSWIndexSingleton.collection()
+    old_version = live.version()
+
+    staged = HNSWIndexSingleton.stage("default", "job1", ef_search=80)
+    staged.add_batch(new_vecs, ["new0.jpg", "new1.jpg", "new2.jpg"])
+    assert HNSWIndexSingleton.query(new_vecs[0], k=1)[0][0].startswith("old")  # live keeps serving meanwhile
+
+    HNSWIndexSingleton.promote("default", staged)
+    assert HNSWIndexSingleton.collection() is staged and staged.params.ef_search == 80
+    assert HNSWIndexSingleton.query(new_vecs[1], k=1)[0] == ["new1.jpg"]
+    assert HNSWIndexSingleton.version() != old_version
+    assert live.query(old_vecs[0], k=1)[0] == ["old0.jpg"]  # a query holding the old instance still completes
+
+    released = weakref.ref(live)
+    del live
+    gc.collect()
+    assert released() is None
+
+    # The pointer survives a restart, and rollback swaps back to the original files
+    HNSWIndexSingleton.reset()
+    assert HNSWIndexSingleton.collection().generation == "job1"
+    restored = HNSWIndexSingleton.rollback("default")
+    assert restored.generation is None
+    assert HNSWIndexSingleton.query(old_vecs[1], k=1)[0] == ["old1.jpg"]
+    assert os.path.isdir(os.path.join(os.path.dirname(HNSWIndexSingleton.INDEX_PATH), "generations", "job1"))
+
+@pytest.mark.unit
+def test_promote_keeps_unfinished_rebuilds_and_removes_only_the_displaced_generation():
+    vecs = np.random.rand(3, 512).astype(np.float32)
+    root = os.path.join(os.path.dirname(HNSWIndexSingleton.INDEX_PATH), "generations")
+    stopped = HNSWIndexSingleton.stage("default", "stopped")  # e.g. a rebuild interrupted by shutdown
+    stopped.add_batch(vecs[:1], ["partial.jpg"])
+    stopped.save()
+
+    for i, generation in enumerate(["job1", "job2", "job3"]):
+        staged = HNSWIndexSingleton.stage("default", generation)
+        staged.add_batch(vecs[i:i + 1], [f"{generation}.jpg"])
+        HNSWIndexSingleton.promote("default", staged)
+
+    # job3 is live, job2 is kept for rollback, job1 was displaced; the stopped rebuild is untouched
+    assert sorted(os.listdir(root)) == ["job2", "job3", "stopped"]
+    resumed = HNSWIndexSingleton.stage("default", "stopped")
+    resumed.ensure_ready()
+    assert resumed.count() == 1
+
+@pytest.mark.unit
+def test_promoting_a_resumed_generation_that_is_already_live_keeps_the_rollback_target():
+    vecs = np.random.rand(2, 512).astype(np.float32)
+    root = os.path.join(os.path.dirname(HNSWIndexSingleton.INDEX_PATH), "generations")
+    for i, generation in enumerate(["job1", "job2"]):
+        staged = HNSWIndexSingleton.stage("default", generation)
+        staged.add_batch(vecs[i:i + 1], [f"{generation}.jpg"])
+        HNSWIndexSingleton.promote("default", staged)
+
+    resumed = HNSWIndexSingleton.stage("default", "job2")  # the job resumed after its promote
+    assert resumed is HNSWIndexSingleton.collection()
+    HNSWIndexSingleton.promote("default", resumed)
+    assert sorted(os.listdir(root)) == ["job1", "job2"]
+
+    restored = HNSWIndexSingleton.rollback("default")
+    assert restored.generation == "job1"
+    assert HNSWIndexSingleton.query(vecs[0], k=1)[0] == ["job1.jpg"]
+
+@pytest.mark.unit
+def test_rollback_without_previous_generation_raises():
+    with pytest.raises(ValueError):
+        HNSWIndexSingleton.rollback("default")
+
+@pytest.mark.unit
+@pytest.mark.parametrize("exact_max_items", [0, 10_000])
+def test_queries_only_see_labels_published_before_they_started(monkeypatch, exact_max_items):
+    from src.server.index_store import _View
+    monkeypatch.setattr(HNSWIndex, "EXACT_MAX_ITEMS", exact_max_items)
+    vecs = np.random.rand(6, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, [f"{i}.jpg" for i in range(6)])
+    index = HNSWIndexSingleton.collection()
+    # As if labels 3..5 were still being inserted when these queries started
+    index._view = _View(index._index, index._metadata, 3)
+
+    paths, _ = HNSWIndexSingleton.query(vecs[4], k=3)
+    assert sorted(paths) == ["0.jpg", "1.jpg", "2.jpg"]
+    [(batch_paths, _)] = HNSWIndexSingleton.query_batch(vecs[5][None], ks=[2])
+    assert set(batch_paths) <= {"0.jpg", "1.jpg", "2.jpg"} and len(batch_paths) == 2
+    assert index.count() == 3
+
+@pytest.mark.unit
+def test_mmap_storage_serves_snapshots_read_only(monkeypatch):
+    from src.server.index_store import MappedHNSWIndex
+    vecs = np.random.rand(5, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs[:3], [ItemMetadata(path=f"{i}.jpg", class_label=str(i % 2)) for i in range(3)])
+    HNSWIndexSingleton.save()
+    writer = HNSWIndexSingleton.collection()
+
+    monkeypatch.setattr(HNSWIndexSingleton, "STORAGE", "mmap")
+    monkeypatch.setattr(MappedHNSWIndex, "REFRESH_INTERVAL_S", 0)
+    HNSWIndexSingleton.reset()
+    assert HNSWIndexSingleton.query(vecs[1], k=1)[0] == ["1.jpg"]
+    assert HNSWIndexSingleton.query(vecs[2], k=3, search_filter=SearchFilter(class_label="0"))[0][0] == "2.jpg"
+    reader = HNSWIndexSingleton.collection()
+    assert isinstance(reader, MappedHNSWIndex)
+    with pytest.raises(RuntimeError, match="read-only"):
+        HNSWIndexSingleton.add_batch(vecs[3:], ["3.jpg", "4.jpg"])
+
+    # The writer's inserts show up once it publishes a snapshot
+    writer.add_batch(vecs[3:], ["3.jpg", "4.jpg"])
+    HNSWIndexSingleton.query(vecs[4], k=1)
+    assert reader.count() == 3
+    writer.save()
+    assert HNSWIndexSingleton.query(vecs[4], k=1)[0] == ["4.jpg"]
+    assert reader.count() == 5
+
+@pytest.mark.unit
+def test_mmap_storage_is_not_ready_before_the_first_snapshot(monkeypatch):
+    monkeypatch.setattr(HNSWIndexSingleton, "STORAGE", "mmap")
+    HNSWIndexSingleton.ensure_ready()
+    assert not HNSWIndexSingleton.is_ready()
+
+@pytest.mark.unit
+def test_quantized_collection_survives_reload_and_mmap(monkeypatch):
+    import server.quantization as quantization
+    from src.server.index_store import MappedHNSWIndex
+    monkeypatch.setattr(quantization, "TRAIN_SIZE", 200)
+    vecs = np.random.rand(300, 512).astype(np.float32)
+    index = HNSWIndexSingleton.collection("small", create=True, quantization="sq8")
+    index.add_batch(vecs[:250], [f"{i}.jpg" for i in range(250)])
+    index.save()
+    index.add_batch(vecs[250:], [f"{i}.jpg" for i in range(250, 300)])  # only in the write-ahead log
+    assert index.memory_bytes() < vecs.nbytes
+
+    HNSWIndexSingleton.reset()
+    assert HNSWIndexSingleton.query(vecs[270], k=1, collection="small")[0] == ["270.jpg"]
+    assert HNSWIndexSingleton.collection("small").params.quantization == "sq8"
+
+    monkeypatch.setattr(HNSWIndexSingleton, "STORAGE", "mmap")
+    HNSWIndexSingleton.reset()
+    assert HNSWIndexSingleton.query(vecs[5], k=1, collection="small")[0] == ["5.jpg"]
+    assert isinstance(HNSWIndexSingleton.collection("small"), MappedHNSWIndex)
+
+@pytest.mark.unit
+def test_small_collections_are_searched_exactly_and_exact_can_be_forced(monkeypatch):
+    vecs = np.random.rand(300, 512).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, [f"{i}.jpg" for i in range(300)])
+    index = HNSWIndexSingleton.collection()
+    exact_paths, exact_scores = HNSWIndexSingleton.query(vecs[7], k=10)
+    assert exact_paths[0] == "7.jpg" and index._matrix is not None
+    assert HNSWIndexSingleton.query(vecs[7], k=10, exact=False)[0][0] == "7.jpg"
+
+    monkeypatch.setattr(HNSWIndex, "EXACT_MAX_ITEMS", 0)
+    index._matrix = None
+    paths, scores = HNSWIndexSingleton.query(vecs[7], k=10, exact=True)  # scanned straight from the index
+    assert paths == exact_paths
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+    assert index._matrix is None
+
+@pytest.mark.unit
+def test_search_ef_follows_quality_tiers_and_buckets_explicit_values():
+    index = HNSWIndexSingleton.collection()
+    ef_search = index.params.ef_search
+    assert index.search_ef() == index.search_ef("balanced") == ef_search
+    assert index.search_ef("fast") == 1  # hnswlib searches max(ef, k) deep
+    assert index.search_ef("high") == 4 * ef_search
+    assert [index.search_ef("fast", ef=e) for e in (1, 3, 64, 65, 5000)] == [1, 4, 64, 128, 8192]
+
+@pytest.mark.unit
+def test_per_query_ef_is_applied_without_disturbing_concurrent_queries(monkeypatch):
+    import threading
+    monkeypatch.setattr(HNSWIndex, "EXACT_MAX_ITEMS", 0)
+    # Centred vectors: uniform [0, 1) ones are so alike under cosine that ef = k can miss the query itself
+    vecs = np.random.default_rng(0).standard_normal((500, 512)).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, [f"{i}.jpg" for i in range(500)])
+    index = HNSWIndexSingleton.collection()
+    assert index._index.ef == index.params.ef_search  # set on a freshly initialized index too
+
+    HNSWIndexSingleton.query(vecs[0], k=5, quality="high")
+    assert index._index.ef == 4 * index.params.ef_search
+    paths, _ = HNSWIndexSingleton.query(vecs[3], k=5, quality="exact")
+    assert paths[0] == "3.jpg"
+
+    errors = []
+
+    def search(quality):
+        for i in range(50):
+            try:
+                assert HNSWIndexSingleton.query(vecs[i], k=10, quality=quality)[0][0] == f"{i}.jpg"
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+    threads = [threading.Thread(target=search, args=(q,)) for q in ("fast", "balanced", "high", None)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+
+@pytest.mark.unit
+def test_default_tier_queries_with_different_k_share_the_index(monkeypatch):
+    import threading
+    from contextlib import contextmanager
+    from server.rwlock import ModeLock
+    monkeypatch.setattr(HNSWIndex, "EXACT_MAX_ITEMS", 0)
+    vecs = np.random.default_rng(0).standard_normal((500, 512)).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, [f"{i}.jpg" for i in range(500)])
+    index = HNSWIndexSingleton.collection()
+    ks = (5, 60, 120, 200)  # all but the first above ef_search
+    inside = threading.Barrier(len(ks), timeout=2)
+    modes = set()
+
+    class SharedOnly(ModeLock):
+        @contextmanager
+        def hold(self, mode, on_switch):
+            with super().hold(mode, on_switch):
+                modes.add(mode[1])
+                inside.wait()  # only passes if every search holds the index at once
+                yield
+
+    monkeypatch.setattr(index, "_ef", SharedOnly())
+    results, errors = {}, []
+
+    def search(k):
+        try:
+            results[k] = HNSWIndexSingleton.query(vecs[k], k=k)[0]
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=search, args=(k,)) for k in ks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert modes == {index.params.ef_search}
+    assert all(len(results[k]) == k and results[k][0] == f"{k}.jpg" for k in ks)
+
+@pytest.mark.unit
+def test_searches_crowded_by_an_insert_stay_bounded_and_fall_back_to_one_scan(monkeypatch):
+    from src.server.index_store import _View
+    from server.exact_search import exact_knn
+    monkeypatch.setattr(HNSWIndex, "EXACT_MAX_ITEMS", 0)
+    monkeypatch.setattr(HNSWIndex, "IN_FLIGHT_DEPTH_MAX", 10)
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((5, 512)).astype(np.float32)
+    # 200 visible items, then an "in-flight" insert of 300 near-copies of the queries that crowds them out
+    vecs = np.concatenate([rng.standard_normal((200, 512)),
+                           np.repeat(queries, 60, axis=0) + 0.01 * rng.standard_normal((300, 512))]).astype(np.float32)
+    HNSWIndexSingleton.add_batch(vecs, [f"{i}.jpg" for i in range(500)])
+    index = HNSWIndexSingleton.collection()
+    resident = index._resident()
+    view = _View(resident.index, resident.metadata, 200)
+    normalized = vecs[:200] / np.linalg.norm(vecs[:200], axis=1, keepdims=True)
+    expected, _ = exact_knn(normalized, queries, 5)
+
+    depths, scans, exact_scan = [], [], index._exact_knn
+
+    class Spy:
+        def __getattr__(self, name):
+            return getattr(resident.index, name)
+
+        def knn_query(self, data, k=1, **kwargs):
+            depths.append(k)
+            return resident.index.knn_query(data, k=k, **kwargs)
+
+    def counting_scan(*args, **kwargs):
+        scans.append(len(np.atleast_2d(args[1])))
+        return exact_scan(*args, **kwargs)
+
+    monkeypatch.setattr(index, "_exact_knn", counting_scan)
+    rows = index._knn(_View(Spy(), view.metadata, 200), queries, 5, 1)
+    assert max(depths) <= 5 + 10 and scans == [5]
+    np.testing.assert_array_equal([labels for labels, _ in rows], expected)
+
+    def short_walk(self, data, k=1, **kwargs):
+        raise RuntimeError("Cannot return the results in a contiguous 2D array")
+
+    monkeypatch.setattr(Spy, "knn_query", short_walk)
+    scans.clear()
+    rows = index._knn(_View(Spy(), view.metadata, 200), queries, 5, 1)
+    assert scans == [5]  # one batched scan, not one per query row
+    np.testing.assert_array_equal([labels for labels, _ in rows], expected)
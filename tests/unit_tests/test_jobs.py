@@ -0,0 +1,92 @@
+import threading
+import time
+import pytest
+
+from server.jobs import BuildJobManager, BuildJobStore, COMPLETED, CANCELLED, FAILED, QUEUED, RUNNING
+from scripts.pipeline import PipelineStats
+
+PARAMS = {"dataset_repo": "user/repo", "split": "train", "image_column": "image",
+          "batch_size": 8, "max_wait_ms": 100}
+
+
+def _wait_for(manager, job_id, states, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job stayed {manager.get(job_id)['status']}")
+
+
+@pytest.mark.unit
+def test_job_runs_in_background_and_records_progress(tmp_path):
+    def fake_build(*args, on_progress=None, on_checkpoint=None, start_offset=0, **kwargs):
+        stats = PipelineStats(seen=10, embedded=9, failed=1, offset=10, total=10)
+        on_progress(stats)
+        on_checkpoint(stats)
+        return stats
+
+    manager = BuildJobManager(str(tmp_path / "jobs.db"), fake_build, progress_interval_s=0)
+    job = manager.submit(PARAMS)
+    assert job["status"] == QUEUED
+
+    job = _wait_for(manager, job["id"], (COMPLETED,))
+    manager.shutdown(timeout=5)
+
+    assert (job["seen"], job["embedded"], job["failed"], job["total"]) == (10, 9, 1, 10)
+    assert job["checkpoint_offset"] == 10
+
+
+@pytest.mark.unit
+def test_cancel_stops_running_job(tmp_path):
+    started = threading.Event()
+
+    def slow_build(*args, stop_event=None, **kwargs):
+        started.set()
+        stop_event.wait(5)
+        return PipelineStats(seen=3, embedded=3, offset=3)
+
+    manager = BuildJobManager(str(tmp_path / "jobs.db"), slow_build)
+    job = manager.submit(PARAMS)
+    assert started.wait(5)
+
+    manager.cancel(job["id"])
+    job = _wait_for(manager, job["id"], (CANCELLED,))
+    manager.shutdown(timeout=5)
+    assert job["embedded"] == 3
+
+
+@pytest.mark.unit
+def test_interrupted_job_resumes_from_checkpoint(tmp_path):
+    db = str(tmp_path / "jobs.db")
+    store = BuildJobStore(db)
+    job = store.create(PARAMS)
+    # Simulate a process that died mid-build after checkpointing offset 500
+    store.update(job["id"], status=RUNNING, checkpoint_offset=500, checkpoint_embedded=480,
+                 checkpoint_failed=20, seen=650, embedded=620)
+
+    offsets = []
+
+    def fake_build(*args, start_offset=0, **kwargs):
+        offsets.append(start_offset)
+        return PipelineStats(seen=100, embedded=100, offset=start_offset + 100)
+
+    manager = BuildJobManager(db, fake_build)
+    manager.start()
+    job = _wait_for(manager, job["id"], (COMPLETED,))
+    manager.shutdown(timeout=5)
+
+    assert offsets == [500]
+    assert (job["seen"], job["embedded"], job["failed"]) == (600, 580, 20)
+
+
+@pytest.mark.unit
+def test_failed_job_records_error(tmp_path):
+    def broken_build(*args, **kwargs):
+        raise RuntimeError("dataset not found")
+
+    manager = BuildJobManager(str(tmp_path / "jobs.db"), broken_build)
+    job = _wait_for(manager, manager.submit(PARAMS)["id"], (FAILED,))
+    manager.shutdown(timeout=5)
+    assert job["error"] == "dataset not found"
@@ -0,0 +1,59 @@
+import pytest
+
+from server.metrics import ENCODE_ITEMS, ENCODE_SECONDS, ENCODER_ERRORS, Counter, Gauge, Histogram, Registry, timed_encode
+
+
+@pytest.mark.unit
+def test_counter_and_gauge_track_each_label_set():
+    registry = Registry()
+    records = registry.register(Counter("records_total", "Records.", ("stage",)))
+    size = registry.register(Gauge("size", "Size."))
+    records.inc(stage="read")
+    records.inc(4, stage="read")
+    records.inc(stage="failed")
+    size.set(7)
+    size.set(3)
+
+    assert records.value(stage="read") == 5 and records.value(stage="embedded") == 0
+    assert size.value() == 3
+    with pytest.raises(ValueError):
+        records.inc(step="read")
+    assert registry.render().splitlines() == [
+        "# HELP records_total Records.",
+        "# TYPE records_total counter",
+        'records_total{stage="failed"} 1.0',
+        'records_total{stage="read"} 5.0',
+        "# HELP size Size.",
+        "# TYPE size gauge",
+        "size 3.0",
+    ]
+
+@pytest.mark.unit
+def test_histogram_renders_cumulative_buckets():
+    latency = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, route='/a"b')
+    with pytest.raises(KeyError), latency.time(route="/c"):
+        raise KeyError("observed even when the block raises")
+
+    assert latency.count(route='/a"b') == 4 and latency.count(route="/c") == 1
+    lines = latency.render()
+    assert 'latency_seconds_bucket{route="/a\\"b",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/a\\"b"} 3.65' in lines
+    assert 'latency_seconds_count{route="/a\\"b"} 4' in lines
+
+@pytest.mark.unit
+def test_timed_encode_times_and_counts_failed_calls():
+    class Encoder:
+        backend = "test-failing"
+
+    with pytest.raises(TimeoutError), timed_encode("text", Encoder(), 3):
+        raise TimeoutError("endpoint timed out")
+    with timed_encode("text", Encoder(), 2):
+        pass
+
+    assert ENCODE_SECONDS.count(kind="text", backend="test-failing") == 2
+    assert ENCODER_ERRORS.value(backend="test-failing", kind="TimeoutError") == 1
+    assert ENCODE_ITEMS.value(kind="text", backend="test-failing") == 2
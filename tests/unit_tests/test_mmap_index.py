@@ -0,0 +1,59 @@
+import hnswlib
+import numpy as np
+import pytest
+
+from server.mmap_index import MappedGraph, file_signature
+
+
+def _saved_index(path, space="cosine", n=500, dim=16):
+    vectors = np.random.default_rng(0).random((n, dim), dtype=np.float32)
+    index = hnswlib.Index(space=space, dim=dim)
+    index.init_index(max_elements=n, M=8, ef_construction=100)
+    index.add_items(vectors, np.arange(n) * 2, num_threads=4)  # labels differ from hnswlib's element ids
+    index.set_ef(40)
+    index.save_index(str(path))
+    return index, vectors
+
+@pytest.mark.unit
+@pytest.mark.parametrize("space", ["cosine", "l2", "ip"])
+def test_mapped_search_matches_hnswlib(tmp_path, space):
+    index, vectors = _saved_index(tmp_path / "index.bin", space)
+    graph = MappedGraph(str(tmp_path / "index.bin"), space, 16)
+    graph.set_ef(40)
+    queries = np.random.default_rng(1).random((20, 16), dtype=np.float32)
+
+    labels, distances = graph.knn_query(queries, k=5)
+    expected_labels, expected_distances = index.knn_query(queries, k=5)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(graph.get_items([0, 10]), index.get_items([0, 10]), atol=1e-6)
+    assert (graph.get_current_count(), graph.get_max_elements()) == (500, 500)
+
+@pytest.mark.unit
+def test_mapped_search_honours_filters_and_raises_when_short(tmp_path):
+    _saved_index(tmp_path / "index.bin")
+    graph = MappedGraph(str(tmp_path / "index.bin"), "cosine", 16)
+    labels, _ = graph.knn_query(np.ones(16, dtype=np.float32), k=3, filter=lambda label: label % 4 == 0)
+    assert all(label % 4 == 0 for label in labels[0])
+    with pytest.raises(RuntimeError):
+        graph.knn_query(np.ones(16, dtype=np.float32), k=501)
+
+@pytest.mark.unit
+def test_mapped_graph_rejects_other_dimensions(tmp_path):
+    _saved_index(tmp_path / "index.bin")
+    with pytest.raises(ValueError):
+        MappedGraph(str(tmp_path / "index.bin"), "cosine", 32)
+    assert file_signature(str(tmp_path / "missing.bin")) is None
+
+@pytest.mark.unit
+def test_threaded_blocks_match_a_serial_search(tmp_path, monkeypatch):
+    _saved_index(tmp_path / "index.bin")
+    graph = MappedGraph(str(tmp_path / "index.bin"), "cosine", 16)
+    graph.set_ef(40)
+    queries = np.random.default_rng(2).random((30, 16), dtype=np.float32)
+    monkeypatch.setattr("server.mmap_index._VISITED_BYTES", 500 * 7)  # several blocks of at most 7 queries
+
+    labels, distances = graph.knn_query(queries, k=5, num_threads=4)
+    expected_labels, expected_distances = graph.knn_query(queries, k=5, num_threads=1)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5, atol=1e-6)
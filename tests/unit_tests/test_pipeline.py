@@ -0,0 +1,78 @@
+import threading
+import time
+import numpy as np
+import pytest
+
+from scripts.pipeline import IngestItem, IngestPipeline
+
+
+def _decode(idx, rec):
+    if rec is None:
+        return None
+    return IngestItem(idx=idx, payload=rec, path=f"img_{idx}.jpg")
+
+
+def _encode(payloads):
+    return np.ones((len(payloads), 4), dtype=np.float32)
+
+
+@pytest.mark.unit
+def test_pipeline_writes_every_valid_record_once():
+    written = []
+    pipeline = IngestPipeline(_decode, _encode, lambda items, emb: written.extend(i.idx for i in items),
+                              decode_workers=3, max_inflight=2, batch_size=4)
+    records = [b"x"] * 10 + [None] * 2
+
+    stats = pipeline.run(records)
+
+    assert sorted(written) == list(range(10))
+    assert (stats.seen, stats.embedded, stats.failed) == (12, 10, 2)
+
+
+@pytest.mark.unit
+def test_pipeline_limits_inflight_encode_requests():
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def slow_encode(payloads):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return _encode(payloads)
+
+    pipeline = IngestPipeline(_decode, slow_encode, lambda items, emb: None,
+                              decode_workers=2, max_inflight=3, batch_size=1, queue_size=4)
+    stats = pipeline.run([b"x"] * 20)
+
+    assert stats.embedded == 20
+    assert 1 < peak <= 3
+
+
+@pytest.mark.unit
+def test_pipeline_counts_failed_batches_and_flushes_partial_batch():
+    def flaky_encode(payloads):
+        if b"bad" in payloads:
+            raise RuntimeError("endpoint error")
+        return _encode(payloads)
+
+    pipeline = IngestPipeline(_decode, flaky_encode, lambda items, emb: None,
+                              decode_workers=1, max_inflight=1, batch_size=2, max_wait_s=5)
+    stats = pipeline.run([b"ok", b"bad", b"ok"])
+
+    assert stats.embedded == 1
+    assert stats.failed == 2
+
+
+@pytest.mark.unit
+def test_pipeline_reraises_dataset_errors():
+    def records():
+        yield b"x"
+        raise IOError("stream broken")
+
+    pipeline = IngestPipeline(_decode, _encode, lambda items, emb: None, decode_workers=1)
+    with pytest.raises(IOError):
+        pipeline.run(records())
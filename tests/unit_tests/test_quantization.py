@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import server.quantization as quantization
+from server.quantization import CompressedIndex, ProductQuantizer, ScalarQuantizer
+
+
+def _clustered(n, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dim))
+    return (centers[rng.integers(20, size=n)] + 0.3 * rng.standard_normal((n, dim))).astype(np.float32)
+
+def _exact_top(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+def _recall(found, expected):
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
+
+def _filled(tmp_path, kind, n=2000, rerank=True):
+    index = CompressedIndex("cosine", 32, str(tmp_path / "vectors.f32"), quantization=kind,
+                            pq_subvectors=8, rerank=rerank)
+    index.init_index(max_elements=n)
+    index.set_ef(50)
+    vectors = _clustered(n)
+    index.add_items(vectors[:n // 2], np.arange(n // 2))
+    index.add_items(vectors[n // 2:], np.arange(n // 2, n))
+    return index, vectors
+
+@pytest.mark.unit
+def test_quantizers_round_trip_closely():
+    data = _clustered(1000)
+    sq = ScalarQuantizer.train(data)
+    assert sq.encode(data).dtype == np.uint8 and sq.code_size == 32
+    assert np.abs(sq.decode(sq.encode(data)) - data).max() <= sq.scale.max()
+
+    pq = ProductQuantizer.train(data, 8)
+    assert pq.encode(data).shape == (1000, 8)
+    assert np.mean((pq.decode(pq.encode(data)) - data) ** 2) < 0.1 * np.mean(data ** 2)
+
+@pytest.mark.unit
+@pytest.mark.parametrize("kind", ["sq8", "pq"])
+def test_reranked_search_recalls_exact_neighbours(tmp_path, monkeypatch, kind):
+    monkeypatch.setattr(quantization, "TRAIN_SIZE", 500)
+    index, vectors = _filled(tmp_path, kind)
+    assert index._quantizer is not None
+    queries = _clustered(50, seed=1)
+
+    labels, distances = index.knn_query(queries, k=10)
+    assert _recall(labels, _exact_top(vectors, queries, 10)) >= 0.9
+    assert np.all(np.diff(distances, axis=1) >= 0)
+    assert index.memory_bytes() < vectors.nbytes
+
+@pytest.mark.unit
+def test_search_is_exact_before_training_and_honours_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr(quantization, "TRAIN_SIZE", 10**6)
+    index, vectors = _filled(tmp_path, "pq", n=300)
+    assert index._quantizer is None
+    queries = _clustered(5, seed=1)
+    labels, _ = index.knn_query(queries, k=5)
+    np.testing.assert_array_equal(labels, _exact_top(vectors, queries, 5))
+
+    labels, _ = index.knn_query(queries, k=5, filter=lambda label: label % 7 == 0)
+    assert np.all(labels % 7 == 0)
+    with pytest.raises(RuntimeError, match="contiguous 2D array"):
+        index.knn_query(queries[0], k=301)
+    with pytest.raises(ValueError):
+        index.add_items(vectors[:1], [5])
+
+@pytest.mark.unit
+def test_save_and_load_keep_codes_and_map_vectors(tmp_path, monkeypatch):
+    monkeypatch.setattr(quantization, "TRAIN_SIZE", 500)
+    index, vectors = _filled(tmp_path, "sq8", n=800)
+    index.save_index(str(tmp_path / "index.bin"))
+    queries = _clustered(5, seed=1)
+
+    reader = CompressedIndex("cosine", 32, str(tmp_path / "vectors.f32"), quantization="sq8", read_only=True)
+    reader.load_index(str(tmp_path / "index.bin"))
+    reader.set_ef(50)
+    assert reader.get_current_count() == 800 and reader.signature is not None
+    np.testing.assert_array_equal(reader.knn_query(queries, k=5)[0], index.knn_query(queries, k=5)[0])
+    np.testing.assert_allclose(reader.get_items([3]), index.get_items([3]))
+
+@pytest.mark.unit
+@pytest.mark.parametrize("kind", ["sq8", "pq"])
+def test_search_scans_only_the_nearest_bounded_lists(tmp_path, monkeypatch, kind):
+    monkeypatch.setattr(quantization, "TRAIN_SIZE", 500)
+    monkeypatch.setattr(quantization, "IVF_LIST_SIZE", 25)
+    index, vectors = _filled(tmp_path, kind)
+    _, _, lists, sizes = index._ivf
+    assert sizes.sum() == 2000 and sizes.max() < 50 and len(lists) >= 40
+    scanned, scan = [], index._scan
+
+    def counting_scan(*args):
+        labels, approximate = scan(*args)
+        scanned.append(len(labels))
+        return labels, approximate
+
+    monkeypatch.setattr(index, "_scan", counting_scan)
+    index.nprobe = 4
+    queries = _clustered(20, seed=1)
+
+    labels, distances = index.knn_query(queries, k=10)
+    assert max(scanned) < 500
+    assert _recall(labels, _exact_top(vectors, queries, 10)) >= 0.8
+    assert np.all(np.diff(distances, axis=1) >= 0)
+    labels, _ = index.knn_query(queries, k=10, filter=lambda label: label % 7 == 0)
+    assert np.all(labels % 7 == 0)  # enough matches only by probing more lists
+
+@pytest.mark.unit
+def test_threaded_batches_match_serial_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr(quantization, "TRAIN_SIZE", 500)
+    monkeypatch.setattr(quantization, "IVF_LIST_SIZE", 25)
+    index, _ = _filled(tmp_path, "pq")
+    queries = _clustered(30, seed=1)
+    labels, distances = index.knn_query(queries, k=5, num_threads=4)
+    expected_labels, expected_distances = index.knn_query(queries, k=5, num_threads=1)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(distances, expected_distances)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from server.rwlock import ModeLock, RWLock
+
+
+@pytest.mark.unit
+def test_readers_share_the_lock():
+    lock = RWLock()
+    inside = threading.Barrier(3, timeout=2)
+
+    def reader():
+        with lock.read():
+            inside.wait()  # only passes if all three readers hold the lock at once
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not inside.broken
+
+@pytest.mark.unit
+def test_writer_waits_for_readers_and_blocks_new_ones():
+    lock = RWLock()
+    order = []
+    first_reader_in = threading.Event()
+
+    def reader(name, hold):
+        with lock.read():
+            order.append(name)
+            first_reader_in.set()
+            time.sleep(hold)
+
+    def writer():
+        with lock.write():
+            order.append("writer")
+
+    r1 = threading.Thread(target=reader, args=("r1", 0.2))
+    r1.start()
+    first_reader_in.wait()
+    w = threading.Thread(target=writer)
+    w.start()
+    time.sleep(0.05)  # writer is now waiting; a new reader must queue behind it
+    r2 = threading.Thread(target=reader, args=("r2", 0))
+    r2.start()
+    for t in (r1, w, r2):
+        t.join()
+    assert order == ["r1", "writer", "r2"]
+
+@pytest.mark.unit
+def test_mode_lock_shares_a_mode_and_switches_only_when_drained():
+    lock = ModeLock()
+    switches, order = [], []
+    inside = threading.Barrier(2, timeout=2)
+    holding = threading.Event()
+
+    def same_mode():
+        with lock.hold(50, switches.append):
+            inside.wait()  # both holders of mode 50 are inside at once
+            holding.set()
+            time.sleep(0.1)
+            order.append("50 done")
+
+    def other_mode():
+        holding.wait()
+        with lock.hold(200, switches.append):
+            order.append("200 in")
+
+    threads = [threading.Thread(target=same_mode) for _ in range(2)] + [threading.Thread(target=other_mode)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not inside.broken
+    assert order == ["50 done", "50 done", "200 in"]
+    assert switches == [50, 200]
@@ -6,7 +6,7 @@ from PIL import Image
 from unittest.mock import patch, Mock
 import boto3
 
-from src.server.sage_maker import CLIPSageMakerClient
+from src.server.sage_maker import CLIPSageMakerClient, encode_image_batch
 
 # Dummy processor to simulate CLIPProcessor
 class DummyProcessor:
@@ -45,3 +45,140 @@ def test_invalid_json_response(mock_boto_client, mock_processor_loader):
         client.encode_image(img)
     with pytest.raises(Exception):
         client.encode_text("test")
+
+
+def test_encode_image_batch_framing():
+    body = encode_image_batch([b"abc", b"", b"defgh"])
+    count, *lengths = np.frombuffer(body[:16], dtype="<u4")
+    assert count == 3
+    assert lengths == [3, 0, 5]
+    assert body[16:] == b"abcdefgh"
+
+
+@patch("boto3.client")
+def test_client_uses_pooled_runtime_transport(mock_boto_client):
+    fake_runtime = Mock()
+    # HF toolkit wraps output_fn's (body, content_type) tuple in a JSON array
+    inner = json.dumps([[0.5] * 4, [0.25] * 4])
+    fake_runtime.invoke_endpoint.return_value = {"Body": io.BytesIO(json.dumps([inner, "application/json"]).encode())}
+    mock_boto_client.return_value = fake_runtime
+
+    client = CLIPSageMakerClient()
+    out = client.encode_texts(["a", "b"])
+
+    assert out.shape == (2, 4)
+    service = mock_boto_client.call_args.args[0]
+    config = mock_boto_client.call_args.kwargs["config"]
+    assert service == "sagemaker-runtime"
+    assert config.max_pool_connections >= 1 and config.tcp_keepalive
+    kwargs = fake_runtime.invoke_endpoint.call_args.kwargs
+    assert kwargs["EndpointName"] == "clip-multimodal-endpoint"
+    assert json.loads(kwargs["Body"]) == {"inputs": ["a", "b"]}
+
+
+class _FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self._body = body
+        self.headers = {"Content-Type": "application/json"}
+
+    async def read(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeSession:
+    closed = False
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def post(self, url, data=None, headers=None):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+
+def test_async_transport_signs_and_retries(monkeypatch):
+    import asyncio
+    from src.server.transport import AsyncSageMakerRuntimeTransport
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    transport = AsyncSageMakerRuntimeTransport("clip-multimodal-endpoint", region="us-west-2")
+    transport._session = _FakeSession([_FakeResponse(503, b"warming up"), _FakeResponse(200, b"[[1.0]]")])
+
+    body, content_type = asyncio.run(transport.invoke(b"{}", content_type="application/json"))
+
+    assert body == b"[[1.0]]"
+    assert len(transport._session.requests) == 2
+    url, headers = transport._session.requests[0]
+    assert url == "https://runtime.sagemaker.us-west-2.amazonaws.com/endpoints/clip-multimodal-endpoint/invocations"
+    assert headers["Authorization"].startswith("AWS4-HMAC-SHA256")
+
+
+async def _no_sleep(delay):
+    return None
+
+
+def test_async_transport_counts_requests_that_run_out_of_retries(monkeypatch):
+    import asyncio
+    from server.metrics import ENCODER_ERRORS
+    from src.server.transport import AsyncSageMakerRuntimeTransport, SageMakerInvocationError
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+    monkeypatch.setattr(asyncio, "sleep", _no_sleep)
+    transport = AsyncSageMakerRuntimeTransport("clip-multimodal-endpoint", region="us-west-2", max_attempts=2)
+    exhausted = ENCODER_ERRORS.value(backend="sagemaker", kind="retries_exhausted")
+
+    transport._session = _FakeSession([_FakeResponse(400, b"bad input")])
+    with pytest.raises(SageMakerInvocationError):
+        asyncio.run(transport.invoke(b"{}", content_type="application/json"))
+    assert ENCODER_ERRORS.value(backend="sagemaker", kind="retries_exhausted") == exhausted
+
+    transport._session = _FakeSession([_FakeResponse(503, b"warming up"), _FakeResponse(503, b"warming up")])
+    with pytest.raises(SageMakerInvocationError):
+        asyncio.run(transport.invoke(b"{}", content_type="application/json"))
+    assert ENCODER_ERRORS.value(backend="sagemaker", kind="retries_exhausted") == exhausted + 1
+
+
+def test_decode_npy_embeddings_is_zero_copy():
+    from src.server.sage_maker import decode_embeddings
+
+    matrix = np.random.rand(3, 512).astype("<f4")
+    buf = io.BytesIO()
+    np.save(buf, matrix)
+    body = buf.getvalue()
+
+    out = decode_embeddings(body, rows=3)
+
+    np.testing.assert_array_equal(out, matrix)
+    assert not out.flags.owndata  # a view over the response bytes
+    # JSON stays supported as the fallback format
+    np.testing.assert_allclose(decode_embeddings(json.dumps(matrix.tolist()).encode(), rows=3), matrix)
+
+
+@patch("boto3.client")
+def test_client_falls_back_to_json_for_old_endpoints(mock_boto_client):
+    from botocore.exceptions import ClientError
+
+    fake_runtime = Mock()
+    rejection = ClientError({"Error": {"Code": "ModelError",
+                                       "Message": "Unsupported response content type: application/x-npy"}},
+                            "InvokeEndpoint")
+    fake_runtime.invoke_endpoint.side_effect = [rejection, {"Body": io.BytesIO(b"[[1.0, 0.0]]")}]
+    mock_boto_client.return_value = fake_runtime
+
+    client = CLIPSageMakerClient()
+    out = client.encode_text("a cat")
+
+    assert out.shape == (1, 2)
+    accepts = [c.kwargs["Accept"] for c in fake_runtime.invoke_endpoint.call_args_list]
+    assert accepts == ["application/x-npy, application/json", "application/json"]
+    assert client.wire_format == "json"
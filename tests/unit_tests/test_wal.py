@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from server.metadata_store import ItemMetadata
+from server.wal import WriteAheadLog
+
+
+@pytest.mark.unit
+def test_records_round_trip(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "index.wal"))
+    vecs = np.random.rand(3, 8).astype(np.float32)
+    wal.append(0, vecs[:2], [ItemMetadata(path="a"), ItemMetadata(path="b", class_label="cat")])
+    wal.append(2, vecs[2:], [ItemMetadata(path="c", row=7)])
+
+    records = list(WriteAheadLog(wal.path).replay())
+    assert [start for start, _, _ in records] == [0, 2]
+    np.testing.assert_array_equal(np.vstack([v for _, v, _ in records]), vecs)
+    assert records[0][2][1].class_label == "cat" and records[1][2][0].row == 7
+
+@pytest.mark.unit
+def test_corrupt_record_and_everything_after_it_are_dropped(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "index.wal"))
+    wal.append(0, np.ones((1, 4), dtype=np.float32), [ItemMetadata(path="a")])
+    good = wal.size()
+    wal.append(1, np.ones((1, 4), dtype=np.float32), [ItemMetadata(path="b")])
+    with open(wal.path, "r+b") as f:
+        f.seek(good + 30)
+        f.write(b"\x00\x01")
+
+    reopened = WriteAheadLog(wal.path)
+    assert [items[0].path for _, _, items in reopened.replay()] == ["a"]
+    assert reopened.size() == good
+
+@pytest.mark.unit
+def test_reset_empties_the_log(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "index.wal"))
+    wal.append(0, np.ones((1, 4), dtype=np.float32), [ItemMetadata(path="a")])
+    wal.reset()
+    wal.append(0, np.zeros((1, 4), dtype=np.float32), [ItemMetadata(path="z")])
+    assert [items[0].path for _, _, items in wal.replay()] == ["z"]